@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Citation Arrow Input
+Reads Parquet and Arrow IPC libraries and formats them in columnar batches.
+
+Instead of turning every row into a record and calling the compiled
+formatter, a style template is evaluated once per record batch with
+Arrow compute kernels: string and integer columns are used as they are,
+literals are broadcast, ``{"if": ...}`` branches become element-wise
+selects and the pieces are joined in one vectorized pass. LaTeX/HTML
+escaping runs as substring replacements over the rows that contain
+special characters. Only author lists, Unicode normalization of non-ASCII
+rows and columns of other types are handled row by row in Python, with the
+same functions the compiled formatters use, so the citations are identical
+to those of the per-record path.
+
+Only the columns a style reads are loaded from Parquet files. Null values
+are treated as absent fields. Requires ``pyarrow``.
+
+``citation_arrow.py --check`` formats a synthetic library both ways, for
+every built-in style and escape target, and reports any citation that
+differs.
+"""
+
+import os
+import re
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+from citation_generator import (
+    AUTHOR_FORMATTERS, BUILTIN_STYLES, CURRENT_YEAR, ESCAPE_TABLES, ESCAPE_TARGETS, ITALIC_MARKUP,
+    STYLE_DEFINITIONS, UNKNOWN_AUTHOR, Paper, _ITALIC_END, _ITALIC_START, _StyleCompiler,
+    _custom_style_definitions, _formatter, _init_worker, _normalized, _period, get_formatter,
+    sort_key,
+)
+
+# Rows per record batch read from Parquet (IPC files keep their own batches)
+DEFAULT_BATCH_SIZE = 1 << 16
+
+# Fields read by sort_key()
+_SORT_COLUMNS = ('authors', 'year', 'title')
+
+
+def require_pyarrow():
+    """Raise ImportError with an install hint when pyarrow is missing."""
+    if pa is None:
+        raise ImportError("Parquet/Arrow input requires pyarrow (pip install pyarrow)")
+
+
+def iter_batches(path: str, input_format: str, columns: Optional[Set[str]] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator['pa.RecordBatch']:
+    """
+    Record batches of a Parquet ('parquet') or Arrow IPC ('arrow') file.
+
+    ``columns`` limits the batches to those columns where present (Parquet
+    files then read nothing else); None keeps all columns.
+    """
+    require_pyarrow()
+    if input_format == 'parquet':
+        parquet = pq.ParquetFile(path, memory_map=True)
+        names = parquet.schema_arrow.names
+        selected = None
+        if columns is not None:
+            # Keep one column even if none is wanted, so batches still count rows
+            selected = [n for n in names if n in columns] or names[:1]
+        yield from parquet.iter_batches(batch_size=batch_size, columns=selected)
+        return
+
+    # The map stays open while batches (zero-copy views of it) are yielded
+    with pa.memory_map(path) as source:
+        try:
+            reader = pa.ipc.open_file(source)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            # Not the random-access file format: an IPC stream
+            source.seek(0)
+            batches = pa.ipc.open_stream(source)
+        for batch in batches:
+            if columns is not None:
+                selected = [n for n in batch.schema.names if n in columns]
+                batch = batch.select(selected or batch.schema.names[:1])
+            yield batch
+
+
+def _rows(batch: 'pa.RecordBatch') -> Iterator[Dict]:
+    """Batch rows as dicts, leaving out null fields."""
+    for row in batch.to_pylist():
+        yield {k: v for k, v in row.items() if v is not None}
+
+
+def iter_arrow_papers(path: str, input_format: str,
+                      batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[Paper]:
+    """Yield the records of a Parquet/Arrow IPC file as Paper objects."""
+    from_dict = Paper.from_dict
+    for batch in iter_batches(path, input_format, batch_size=batch_size):
+        for row in _rows(batch):
+            yield from_dict(row)
+
+
+def _join(parts: List):
+    """Concatenate strings and string arrays element-wise."""
+    merged = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif not (isinstance(part, str) and not part):
+            merged.append(part)
+    if not merged:
+        return ''
+    if len(merged) == 1:
+        return merged[0]
+    if all(isinstance(part, str) for part in merged):
+        return ''.join(merged)
+    return pc.binary_join_element_wise(*merged, '')
+
+
+def _period_of(text):
+    """``_period`` of a string value, or element-wise of a string array."""
+    if isinstance(text, str):
+        return _period(text)
+    return pc.if_else(pc.ends_with(text, '.'), '', '.')
+
+
+def _is_true(text):
+    """Truthiness of a string value or array (non-empty)."""
+    if isinstance(text, str):
+        return bool(text)
+    return pc.greater(pc.binary_length(text), 0)
+
+
+class ColumnarFormatter:
+    """
+    Formats Arrow record batches with one or several styles.
+
+    Called on a batch, returns one citation per row (or one tuple of
+    citations per row when built with a tuple of styles).
+    """
+
+    def __init__(self, style, escape: Optional[str] = None):
+        require_pyarrow()
+        self.multi = not isinstance(style, str)
+        self.definitions = [STYLE_DEFINITIONS[s] for s in (style if self.multi else (style,))]
+        self.escape = None if escape == 'none' else escape
+        # Templates are parsed by the compiler itself (literals, italic markers,
+        # the period rule), so both paths interpret them identically
+        self.compiler = _StyleCompiler(self.escape)
+        self.columns = self._referenced_columns()
+
+    def _referenced_columns(self) -> Set[str]:
+        columns = {'authors'}
+
+        def visit(entries):
+            for entry in entries:
+                if isinstance(entry, str):
+                    columns.update(f for _, f, _, _ in _formatter.parse(entry) if f)
+                elif isinstance(entry, dict):
+                    columns.add(entry.get('if'))
+                    visit(entry.get('then', []))
+                    visit(entry.get('else') or [])
+
+        for definition in self.definitions:
+            visit(definition['template'])
+        return columns
+
+    def __call__(self, batch: 'pa.RecordBatch') -> List:
+        self.batch = batch
+        self.names = set(batch.schema.names)
+        self.values = {}
+        self.author_values = {}
+        results = []
+        for definition in self.definitions:
+            self.compiler.name = definition['name']
+            self.defaults = definition.get('defaults', {})
+            self.authors = definition.get('authors', 'apa')
+            text = self.block(definition['template'])
+            if isinstance(text, str):
+                text = pa.array([text] * batch.num_rows, pa.string())
+            if self.escape:
+                text = self.finish(text)
+            results.append(text.to_pylist())
+        self.batch = self.values = self.author_values = None
+        return list(zip(*results)) if self.multi else results[0]
+
+    def block(self, entries: List):
+        """Text a template block appends, as a string or a string array."""
+        # Adjacent strings are merged, as the compiler does
+        merged = []
+        for entry in entries:
+            if isinstance(entry, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += entry
+            else:
+                merged.append(entry)
+        parts = []
+        for entry in merged:
+            if isinstance(entry, str):
+                parts.append(self.text(entry))
+                continue
+            then = self.block(entry.get('then', []))
+            otherwise = self.block(entry['else']) if entry.get('else') else ''
+            _, condition = self.var(entry['if'])
+            if isinstance(condition, bool):
+                parts.append(then if condition else otherwise)
+            elif isinstance(then, str) and then == otherwise:
+                parts.append(then)
+            else:
+                parts.append(pc.if_else(condition, then, otherwise))
+        return _join(parts)
+
+    def text(self, template: str):
+        parts = []
+        for kind, value in self.compiler.pieces(template):
+            if kind == 'literal':
+                parts.append(value)
+            elif kind == 'field':
+                parts.append(self.var(value)[0])
+            else:
+                parts.append(_period_of(self.var(value)[0]))
+        return _join(parts)
+
+    def var(self, field: str):
+        """(text, truthiness) of a template field, each a scalar or an array."""
+        if field == 'authors':
+            return self.authors_var()
+        default = self.defaults.get(field, '')
+        key = (field, repr(default))
+        if key not in self.values:
+            self.values[key] = self.column(field, default)
+        return self.values[key]
+
+    def column(self, field: str, default):
+        if default == CURRENT_YEAR:
+            default = datetime.now().year
+        n = self.batch.num_rows
+        arr = self.batch.column(field) if field in self.names else None
+        if arr is None or arr.null_count == n:
+            return f'{default}', bool(default)
+        kind = arr.type
+        if pa.types.is_dictionary(kind):
+            arr = arr.dictionary_decode()
+            kind = arr.type
+        if pa.types.is_string(kind) or pa.types.is_large_string(kind):
+            text = arr.cast(pa.string())
+            truthy = pc.greater(pc.binary_length(arr), 0)
+        elif pa.types.is_integer(kind):
+            text = arr.cast(pa.string())
+            truthy = pc.not_equal(arr, 0)
+        else:
+            # Floats, booleans, nested values: str() as in the f-strings
+            values = arr.to_pylist()
+            text = pa.array([f'{default}' if v is None else f'{v}' for v in values], pa.string())
+            truthy = pa.array([bool(default) if v is None else bool(v) for v in values])
+            return text, truthy
+        if arr.null_count:
+            text = pc.fill_null(text, f'{default}')
+            truthy = pc.fill_null(truthy, bool(default))
+        return text, truthy
+
+    def authors_var(self):
+        if self.authors not in self.author_values:
+            func, unknown_when = AUTHOR_FORMATTERS[self.authors]
+            if 'authors' in self.names:
+                lists = self.batch.column('authors').to_pylist()
+            else:
+                lists = [None] * self.batch.num_rows
+            if unknown_when == 'empty-list':
+                names = [func(a) if a else UNKNOWN_AUTHOR for a in lists]
+            else:
+                names = [func([] if a is None else a) or UNKNOWN_AUTHOR for a in lists]
+            text = pa.array(names, pa.string())
+            self.author_values[self.authors] = (text, _is_true(text))
+        return self.author_values[self.authors]
+
+    def finish(self, text: 'pa.Array') -> 'pa.Array':
+        """Escape finished citations and turn italic markers into markup."""
+        # Like the Python escapers, only rows that need it are transformed:
+        # non-ASCII rows are normalized (by the escapers' own function, whose
+        # quick check beats utf8_normalize), rows with special characters escaped
+        text = _where(text, pc.invert(pc.string_is_ascii(text)),
+                      lambda rows: pa.array(list(map(_normalized, rows.to_pylist())), pa.string()))
+        table = ESCAPE_TABLES[self.escape]
+
+        def escape(rows):
+            for char, replacement in table:
+                rows = pc.replace_substring(rows, char, replacement)
+            return rows
+
+        text = _where(text, pc.match_substring_regex(text, _special_characters(table)), escape)
+        opening, closing = ITALIC_MARKUP[self.escape]
+        text = pc.replace_substring(text, _ITALIC_START, opening)
+        return pc.replace_substring(text, _ITALIC_END, closing)
+
+
+def _where(text: 'pa.Array', mask: 'pa.Array', transform) -> 'pa.Array':
+    """Apply an array transform to the rows selected by ``mask`` only."""
+    if not pc.any(mask).as_py():
+        return text
+    return pc.replace_with_mask(text, mask, transform(pc.filter(text, mask)))
+
+
+def _special_characters(table) -> str:
+    """Regex class of the characters an escape table acts on (not those it introduces)."""
+    chars = []
+    introduced = ''
+    for char, replacement in table:
+        if char not in introduced:
+            chars.append(char)
+        introduced += replacement
+    return '[' + ''.join(re.escape(c) for c in chars) + ']'
+
+
+_worker_formatters: Dict = {}
+
+
+def _format_batch(batch: 'pa.RecordBatch', style, escape: Optional[str] = None,
+                  sort_specs: Optional[List[Optional[List[str]]]] = None):
+    """Format one batch (in this process or a worker); returns (citations, sort keys)."""
+    key = (style, escape)
+    if key not in _worker_formatters:
+        _worker_formatters[key] = ColumnarFormatter(style, escape)
+    citations = _worker_formatters[key](batch)
+    keys = []
+    if sort_specs is not None:
+        keys = [tuple(sort_key(row, spec) if spec else None for spec in sort_specs)
+                for row in _rows(batch)]
+    return citations, keys
+
+
+def format_arrow(path: str, input_format: str, style, workers: int = 1,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 sort_specs: Optional[List[Optional[List[str]]]] = None,
+                 keys: Optional[deque] = None, escape: Optional[str] = None) -> Iterator:
+    """
+    Format a Parquet/Arrow IPC file batch by batch with vectorized kernels.
+
+    With ``workers > 1`` batches are formatted in worker processes, at most
+    ``2 * workers`` at a time, and yielded in file order. With
+    ``sort_specs``, each record's sort keys are appended to ``keys`` before
+    its citation is yielded.
+    """
+    columns = ColumnarFormatter(style, escape).columns
+    if sort_specs is not None:
+        columns |= set(_SORT_COLUMNS)
+    batches = iter_batches(path, input_format, columns, batch_size)
+
+    def results(citations, batch_keys):
+        if keys is not None:
+            keys.extend(batch_keys)
+        return citations
+
+    if workers <= 1:
+        for batch in batches:
+            yield from results(*_format_batch(batch, style, escape, sort_specs))
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(_custom_style_definitions(),)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append(pool.submit(_format_batch, batch, style, escape, sort_specs))
+            if len(pending) >= 2 * workers:
+                yield from results(*pending.popleft().result())
+        while pending:
+            yield from results(*pending.popleft().result())
+
+
+def write_library(records: List[Dict], path: str) -> 'pa.Table':
+    """Write dict records to a Parquet (.parquet/.pq) or Arrow IPC file."""
+    # Columns for every field of any record (from_pylist only looks at the first)
+    fields = list(dict.fromkeys(k for record in records for k in record))
+    table = pa.table({field: [record.get(field) for record in records] for field in fields})
+    if path.lower().endswith(('.parquet', '.pq')):
+        pq.write_table(table, path)
+    else:
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=DEFAULT_BATCH_SIZE)
+    return table
+
+
+# Records exercising the corners of the templates: trailing periods before a
+# template ".", escape-target special characters, non-ASCII text, null and
+# missing fields
+_EDGE_RECORDS = [
+    {'authors': ['Smith, John Jr.'], 'title': 'Ends with a period.', 'journal': 'J. Appl. Phys.',
+     'year': 2001, 'doi': '10.1000/x.'},
+    {'authors': ['King, Martin Luther, Jr.', 'Ada Lovelace'], 'title': 'A & B: 50% of $x_1$ {y}',
+     'journal': 'Ann. <Math>', 'volume': '3', 'issue': '#2', 'pages': '1-2', 'month': 'May'},
+    {'authors': ['Gödel, Kurt', 'Erdős, P.'], 'title': 'Cafe\u0301 nai\u0308ve', 'year': None},
+    {'authors': [], 'title': None, 'journal': 'Nature'},
+    {'title': 'No authors or year'},
+]
+
+
+def check_parity(count: int = 3000, styles: Optional[Iterable[str]] = None,
+                 escapes: Iterable[str] = ESCAPE_TARGETS, seed: int = 0) -> List[str]:
+    """
+    Check that columnar formatting matches the per-record formatters.
+
+    A synthetic library (see citation_benchmark) plus a few edge cases is
+    written as Parquet and Arrow IPC and formatted with ``format_arrow``,
+    in every style and escape target and once with all styles together,
+    and compared with the compiled formatters applied to the same records.
+
+    Returns:
+        One line per differing citation (empty when the paths agree)
+    """
+    from citation_benchmark import synthetic_corpus
+
+    require_pyarrow()
+    records = _EDGE_RECORDS + list(synthetic_corpus(count, seed))
+    papers = [Paper.from_dict({k: v for k, v in r.items() if v is not None}) for r in records]
+    styles = list(styles or (d['name'] for d in BUILTIN_STYLES))
+    cases = [(style, escape) for style in styles for escape in escapes]
+    cases.append((tuple(styles), None))
+    mismatches = []
+    directory = tempfile.mkdtemp(prefix='citation-arrow-check-')
+    try:
+        for input_format, name in (('parquet', 'library.parquet'), ('arrow', 'library.arrow')):
+            path = os.path.join(directory, name)
+            write_library(records, path)
+            for style, escape in cases:
+                formatter = get_formatter(style, escape)
+                expected = [formatter(p) for p in papers]
+                actual = list(format_arrow(path, input_format, style, batch_size=1000,
+                                           escape=escape))
+                if len(actual) != len(expected):
+                    mismatches.append(f"{input_format} {style} {escape}: "
+                                      f"{len(actual)} citations, expected {len(expected)}")
+                    continue
+                for i, (got, want) in enumerate(zip(actual, expected)):
+                    if got != want:
+                        mismatches.append(f"{input_format} {style} {escape} record {i}: "
+                                          f"{got!r} != {want!r}")
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    return mismatches
+
+
+def main():
+    """Convert a JSON/JSON Lines library to Parquet or Arrow IPC."""
+    import argparse
+
+    from citation_generator import detect_input_format, iter_papers
+
+    parser = argparse.ArgumentParser(description='Convert a citation library to Parquet/Arrow IPC')
+    parser.add_argument('--input', help='Input JSON or JSON Lines file')
+    parser.add_argument('--output',
+                       help='Output file (.parquet/.pq for Parquet, otherwise Arrow IPC)')
+    parser.add_argument('--check', type=int, nargs='?', const=3000, metavar='N',
+                       help='Instead of converting, check that N synthetic records '
+                            '(default: 3000) format identically through Parquet, '
+                            'Arrow IPC and JSON')
+
+    args = parser.parse_args()
+
+    try:
+        require_pyarrow()
+    except ImportError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.check is not None:
+        mismatches = check_parity(args.check)
+        for line in mismatches:
+            print(line, file=sys.stderr)
+        print(f"{len(mismatches)} mismatches", file=sys.stderr)
+        return 1 if mismatches else 0
+    if not args.input or not args.output:
+        parser.error('--input and --output are required')
+    with open(args.input, 'r', encoding='utf-8') as f:
+        records = [p.to_dict() for p in iter_papers(f, detect_input_format(args.input))]
+    table = write_library(records, args.output)
+    print(f"Wrote {table.num_rows} records to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
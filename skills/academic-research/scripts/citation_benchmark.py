@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Citation Benchmarks
+Measures the citation generator on synthetic bibliographies.
+
+The throughput benchmark streams a synthetic corpus through every style,
+each style in a fresh interpreter, and reports records per second, p50/p99
+per-record formatting latency and peak RSS as JSON. The memory benchmark
+loads a synthetic corpus into memory once as plain dicts and once as
+``Paper`` records, each in a fresh interpreter, and reports the peak
+resident set size of both. The formatters benchmark times the compiled
+style formatters against the per-record if-ladder implementations they
+replaced, on the same ``Paper`` records, and checks that the output is
+identical.
+"""
+
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+_FIRST_NAMES = ['John', 'Ana', 'Wei', 'María José', 'Jean-Luc', 'Kim', 'Olga', 'Hiroshi',
+                'Fatima', 'Ludwig van', 'Priya', 'Lars', 'Chidi', 'Sofia', 'Mateo', 'Yuki']
+_FAMILY_NAMES = ['Smith', 'Zhang', 'García Márquez', 'de la Cruz', "O'Neil", 'Müller',
+                 'Nakamura', 'Okafor', 'Ivanova', 'Rossi', 'Kowalski', 'Nguyen', 'Patel',
+                 'Johansson', 'Beethoven', 'Smith, Jr.']
+_JOURNALS = ['Nature', 'Science', 'Journal of Machine Learning Research',
+             'Physical Review Letters', 'The Lancet', 'ACM Computing Surveys',
+             'IEEE Transactions on Pattern Analysis and Machine Intelligence', 'Cell']
+_WORDS = ['learning', 'deep', 'neural', 'analysis', 'model', 'systems', 'efficient',
+          'large-scale', 'protein', 'quantum', 'networks', 'causal', 'inference',
+          'robust', 'survey', 'data', 'graph', 'optimization', 'clinical', 'climate']
+_MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August',
+           'September', 'October', 'November', 'December']
+
+# Author counts, weighted towards small teams but including lists long
+# enough to trigger every style's truncation rules
+_AUTHOR_COUNTS = [0, 1, 1, 2, 2, 3, 3, 4, 5, 6, 8, 20, 21, 25, 50]
+
+
+def _author(rng: random.Random) -> str:
+    first, family = rng.choice(_FIRST_NAMES), rng.choice(_FAMILY_NAMES)
+    if rng.random() < 0.5:
+        return f"{family}, {first[0]}."
+    return f"{first} {family}"
+
+
+def synthetic_record(rng: random.Random, index: int) -> Dict:
+    """One synthetic paper record; optional fields are dropped at random."""
+    record = {
+        'authors': [_author(rng) for _ in range(rng.choice(_AUTHOR_COUNTS))],
+        'year': rng.randint(1950, 2025),
+        'title': ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(3, 12))).capitalize(),
+        'journal': rng.choice(_JOURNALS),
+        'volume': str(rng.randint(1, 400)),
+        'issue': str(rng.randint(1, 12)),
+        'pages': f"{index % 900 + 1}-{index % 900 + rng.randint(2, 30)}",
+        'doi': f"10.{rng.randint(1000, 9999)}/synthetic.{index}",
+        'url': f"https://example.org/papers/{index}",
+        'month': rng.choice(_MONTHS),
+    }
+    for field in list(record):
+        if rng.random() < 0.15:
+            del record[field]
+    return record
+
+
+def synthetic_corpus(count: int, seed: int = 0) -> Iterator[Dict]:
+    """Deterministic stream of ``count`` synthetic records."""
+    rng = random.Random(seed)
+    for index in range(count):
+        yield synthetic_record(rng, index)
+
+
+def write_corpus(path: str, count: int, seed: int = 0):
+    """Write a synthetic corpus as JSON Lines."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in synthetic_corpus(count, seed):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def _load_records(path: str, model: str) -> Dict:
+    """Hold every record of a JSON Lines file in memory (child process)."""
+    from citation_generator import Paper
+
+    baseline = peak_rss_mb()
+    convert = Paper.from_dict if model == 'paper' else None
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            records.append(convert(record) if convert else record)
+    return {'model': model, 'records': len(records),
+            'baseline_mb': round(baseline, 1), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+
+def percentile(sorted_values: array, fraction: float) -> int:
+    """Nearest-rank percentile of an ascending sequence."""
+    if not sorted_values:
+        return 0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def _run_style(path: str, style: str) -> Dict:
+    """Stream a JSON Lines corpus through one style (child process)."""
+    from citation_generator import STYLES, iter_papers
+
+    formatter = STYLES[style]
+    clock = time.perf_counter_ns
+    latencies = array('q')
+    record = latencies.append
+    start = clock()
+    with open(path, 'r', encoding='utf-8') as f:
+        for paper in iter_papers(f, 'jsonl'):
+            t0 = clock()
+            formatter(paper)
+            record(clock() - t0)
+    elapsed = (clock() - start) / 1e9
+    # Taken before sorting the latencies, which is benchmark overhead
+    peak = peak_rss_mb()
+    format_seconds = sum(latencies) / 1e9
+    latencies = array('q', sorted(latencies))
+    count = len(latencies)
+    return {
+        'style': style,
+        'records': count,
+        'records_per_sec': round(count / format_seconds) if format_seconds else None,
+        'end_to_end_records_per_sec': round(count / elapsed) if elapsed else None,
+        'latency_p50_us': round(percentile(latencies, 0.50) / 1000, 2),
+        'latency_p99_us': round(percentile(latencies, 0.99) / 1000, 2),
+        'peak_rss_mb': round(peak, 1),
+    }
+
+
+def _child(args: List[str]) -> Dict:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__)] + args,
+                         check=True, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.stdout)
+
+
+def throughput_benchmark(sizes: List[int], styles: Optional[List[str]] = None,
+                         seed: int = 0) -> Dict:
+    """
+    Format synthetic corpora of each size in each style
+
+    Args:
+        sizes: Corpus sizes (records)
+        styles: Style names (default: every registered style)
+        seed: Random seed for the corpora
+
+    Returns:
+        Run metadata and one result per (size, style)
+    """
+    if styles is None:
+        from citation_generator import STYLES
+        styles = list(STYLES)
+    results = []
+    for count in sizes:
+        fd, path = tempfile.mkstemp(prefix='citation-bench-', suffix='.jsonl')
+        os.close(fd)
+        try:
+            write_corpus(path, count, seed)
+            for style in styles:
+                results.append(_child(['--run-style', path, style]))
+                print(f"{count} records, {style}: {results[-1]['records_per_sec']} records/s",
+                      file=sys.stderr)
+        finally:
+            os.remove(path)
+    return {
+        'benchmark': 'throughput',
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'results': results,
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """Lines describing the throughput change of each (size, style) against a baseline."""
+    previous = {(r['records'], r['style']): r for r in baseline.get('results', [])}
+    lines = []
+    for result in current['results']:
+        before = previous.get((result['records'], result['style']))
+        if not before or not before.get('records_per_sec') or not result['records_per_sec']:
+            continue
+        change = result['records_per_sec'] / before['records_per_sec'] - 1
+        lines.append(f"{result['records']:>9} {result['style']:<10} "
+                     f"{before['records_per_sec']:>9} -> {result['records_per_sec']:>9} records/s "
+                     f"({change:+.1%}), p99 {before['latency_p99_us']} -> {result['latency_p99_us']} us")
+    return lines
+
+
+def memory_benchmark(count: int, seed: int = 0) -> Dict:
+    """
+    Compare peak RSS of a corpus held as dicts and as Paper records
+
+    Args:
+        count: Number of synthetic records
+        seed: Random seed for the corpus
+
+    Returns:
+        Per-model results and the relative reduction
+    """
+    fd, path = tempfile.mkstemp(prefix='citation-bench-', suffix='.jsonl')
+    os.close(fd)
+    try:
+        write_corpus(path, count, seed)
+        results = {}
+        for model in ('dict', 'paper'):
+            # A fresh interpreter per model, so peaks do not mask each other
+            results[model] = _child(['--load', path, model])
+    finally:
+        os.remove(path)
+    dict_mb = results['dict']['peak_rss_mb'] - results['dict']['baseline_mb']
+    paper_mb = results['paper']['peak_rss_mb'] - results['paper']['baseline_mb']
+    return {
+        'benchmark': 'memory',
+        'records': count,
+        'results': results,
+        'reduction': round(1 - paper_mb / dict_mb, 3) if dict_mb > 0 else None,
+    }
+
+
+def _time_loop(func, papers: List, repeats: int) -> float:
+    """Median seconds of ``repeats`` passes of ``func`` over ``papers``."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for paper in papers:
+            func(paper)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def formatters_benchmark(count: int, styles: Optional[List[str]] = None,
+                         seed: int = 0, repeats: int = 5) -> Dict:
+    """
+    Time the if-ladder reference formatters against the compiled styles
+
+    Both are first run on every record and must agree exactly.
+
+    Args:
+        count: Number of synthetic records
+        styles: Built-in style names (default: every style of the reference fixture)
+        seed: Random seed for the corpus
+        repeats: Timed passes per formatter; the median is reported
+
+    Returns:
+        Per-style ns/record of both implementations and the speedup
+
+    Raises:
+        RuntimeError: If the reference and compiled output differ
+    """
+    from citation_generator import STYLES, Paper
+    from citation_legacy_formatters import LEGACY_STYLES, legacy_format_citation
+
+    papers = [Paper.from_dict(record) for record in synthetic_corpus(count, seed)]
+    results = []
+    for style in styles or LEGACY_STYLES:
+        compiled = STYLES[style]
+
+        def legacy(paper, style=style):
+            return legacy_format_citation(paper, style)
+
+        # Timing two formatters is only meaningful if they do the same work
+        for i, paper in enumerate(papers):
+            expected, actual = compiled(paper), legacy(paper)
+            if actual != expected:
+                raise RuntimeError(
+                    f"reference {style} formatter differs from the compiled one on record {i}: "
+                    f"{actual!r} != {expected!r} (update citation_legacy_formatters.py)")
+        legacy_seconds = _time_loop(legacy, papers, repeats)
+        compiled_seconds = _time_loop(compiled, papers, repeats)
+        results.append({
+            'style': style,
+            'legacy_ns_per_record': round(legacy_seconds / count * 1e9),
+            'compiled_ns_per_record': round(compiled_seconds / count * 1e9),
+            'speedup': round(legacy_seconds / compiled_seconds, 2) if compiled_seconds else None,
+        })
+        print(f"{style}: {results[-1]['legacy_ns_per_record']} -> "
+              f"{results[-1]['compiled_ns_per_record']} ns/record", file=sys.stderr)
+    return {
+        'benchmark': 'formatters',
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'records': count,
+        'repeats': repeats,
+        'seed': seed,
+        'results': results,
+    }
+
+
+def main():
+    """Command-line interface"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the citation generator')
+    parser.add_argument('benchmark', nargs='?', choices=['throughput', 'memory', 'formatters'],
+                       default='throughput', help='Benchmark to run (default: throughput)')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                       help='Comma-separated corpus sizes for the throughput benchmark '
+                            '(default: 1000,10000,100000,1000000)')
+    parser.add_argument('--styles', help='Comma-separated styles (default: all)')
+    parser.add_argument('--records', type=int,
+                       help='Corpus size for the memory benchmark (default: 1000000) '
+                            'or the formatters benchmark (default: 10000)')
+    parser.add_argument('--repeats', type=int, default=5,
+                       help='Timed passes per formatter in the formatters benchmark (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed')
+    parser.add_argument('--output', help='Write the JSON results to this file (default: stdout)')
+    parser.add_argument('--baseline', help='Earlier throughput results to compare against')
+    parser.add_argument('--load', nargs=2, metavar=('PATH', 'MODEL'), help=argparse.SUPPRESS)
+    parser.add_argument('--run-style', nargs=2, metavar=('PATH', 'STYLE'), help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.load:
+        print(json.dumps(_load_records(*args.load)))
+        return 0
+    if args.run_style:
+        print(json.dumps(_run_style(*args.run_style)))
+        return 0
+
+    if args.benchmark == 'memory':
+        results = memory_benchmark(args.records or 1_000_000, args.seed)
+    elif args.benchmark == 'formatters':
+        from citation_legacy_formatters import LEGACY_STYLES
+
+        styles = None
+        if args.styles:
+            styles = [s.strip() for s in args.styles.split(',') if s.strip()]
+            for style in styles:
+                if style not in LEGACY_STYLES:
+                    parser.error(f"no reference implementation of style '{style}' "
+                                 f"(available: {', '.join(LEGACY_STYLES)})")
+        try:
+            results = formatters_benchmark(args.records or 10_000, styles, args.seed,
+                                           args.repeats)
+        except RuntimeError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    else:
+        try:
+            sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+        except ValueError:
+            parser.error('--sizes must be a comma-separated list of integers')
+        styles = None
+        if args.styles:
+            from citation_generator import STYLES
+            styles = [s.strip() for s in args.styles.split(',') if s.strip()]
+            for style in styles:
+                if style not in STYLES:
+                    parser.error(f"unknown style '{style}' (available: {', '.join(STYLES)})")
+        results = throughput_benchmark(sizes, styles, args.seed)
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                for line in compare(results, json.load(f)):
+                    print(line, file=sys.stderr)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
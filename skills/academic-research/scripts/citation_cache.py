@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Citation Cache
+Persistent SQLite cache of formatted citations.
+
+The cache works on the raw input rather than on parsed records, so a hit
+costs neither parsing nor formatting. JSON Lines files are split into
+content-defined chunks of lines: a chunk ends after a line whose checksum
+matches a boundary condition, so editing, inserting or deleting a record
+changes only the chunk around it and the rest of the file still hits.
+Other input formats are cached as one entry per file.
+
+Entries are keyed by a digest of (style fingerprint, chunk bytes), where the
+style fingerprint covers the style definitions, escape target and the
+current year (records without a year are formatted with it). The cache is
+bounded by size and evicts the least recently used entries first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Bump when formatting code changes in a way style definitions do not capture
+CACHE_FORMAT_VERSION = 3
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Recency of a hit is only recorded once per this many seconds
+TOUCH_INTERVAL = 24 * 60 * 60
+
+# Number of stored entries between commits
+COMMIT_EVERY = 100
+
+# Content-defined chunking of JSON Lines input: a chunk ends after a line
+# whose CRC-32 is divisible by CHUNK_LINES (about that many lines on
+# average), but never before MIN_CHUNK_LINES or after MAX_CHUNK_LINES lines
+CHUNK_LINES = 256
+MIN_CHUNK_LINES = 16
+MAX_CHUNK_LINES = 4096
+
+_READ_BLOCK = 1 << 20
+
+
+def default_cache_path() -> str:
+    """Cache file under $XDG_CACHE_HOME (default ~/.cache)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'research-skills', 'citations.sqlite')
+
+
+def style_fingerprint(styles: Sequence[Tuple[str, Dict]], escape: Optional[str] = None) -> bytes:
+    """Digest identifying style definitions, escape target, current year and cache format."""
+    material = json.dumps([CACHE_FORMAT_VERSION, datetime.now().year, escape,
+                           [list(style) for style in styles]],
+                          sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=16).digest()
+
+
+def chunk_key(style_fp: bytes, input_format: str, data: bytes) -> bytes:
+    """Cache key for a chunk of raw input formatted with the fingerprinted styles."""
+    hasher = hashlib.blake2b(input_format.encode('ascii') + b'\x1f', digest_size=16, key=style_fp)
+    hasher.update(data)
+    return hasher.digest()
+
+
+def file_key(style_fp: bytes, input_format: str, path: str) -> bytes:
+    """Cache key for a whole input file (read in blocks, never held in memory)."""
+    hasher = hashlib.blake2b(input_format.encode('ascii') + b'\x1f', digest_size=16, key=style_fp)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_READ_BLOCK), b''):
+            hasher.update(block)
+    return hasher.digest()
+
+
+def iter_line_chunks(f: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """
+    Split a binary JSON Lines stream into content-defined chunks.
+
+    Yields (first line number, chunk bytes); chunks are whole lines.
+    """
+    lines: List[bytes] = []
+    first = 1
+    crc32 = zlib.crc32
+    for line in f:
+        lines.append(line)
+        n = len(lines)
+        if n >= MAX_CHUNK_LINES or (n >= MIN_CHUNK_LINES and crc32(line) % CHUNK_LINES == 0):
+            yield first, b''.join(lines)
+            first += n
+            lines = []
+    if lines:
+        yield first, b''.join(lines)
+
+
+class CitationCache:
+    """Size-bounded, LRU-evicting SQLite store of formatted citation chunks."""
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Open (or create) the cache
+
+        Args:
+            path: SQLite file, default ``default_cache_path()``
+            max_bytes: Approximate upper bound on stored citation data
+        """
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # Per-record entries of cache format 1 are never looked up again
+        self.conn.execute('DROP TABLE IF EXISTS citations')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS chunks ('
+            ' key BLOB PRIMARY KEY,'
+            ' data TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' last_used INTEGER NOT NULL'
+            ') WITHOUT ROWID')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS chunks_last_used ON chunks(last_used)')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM chunks').fetchone()[0]
+        self.now = int(time.time())
+        # Counted in records, not chunks
+        self.hits = 0
+        self.misses = 0
+        self.uncommitted = 0
+
+    def get(self, key: bytes) -> Optional[List]:
+        """
+        Look up the citations of a chunk.
+
+        A hit is marked as recently used; to keep repeated runs read-only,
+        the timestamp is only rewritten once it is older than
+        ``TOUCH_INTERVAL`` seconds.
+        """
+        row = self.conn.execute('SELECT data, last_used FROM chunks WHERE key = ?',
+                                (key,)).fetchone()
+        if row is None:
+            return None
+        data, last_used = row
+        if last_used < self.now - TOUCH_INTERVAL:
+            self.conn.execute('UPDATE chunks SET last_used = ? WHERE key = ?', (self.now, key))
+        return json.loads(data)
+
+    def put(self, key: bytes, citations: List) -> bool:
+        """
+        Store the citations of a chunk, evicting old entries if the size bound is exceeded.
+
+        Returns:
+            False if the entry alone exceeds the size bound and was not stored
+        """
+        data = json.dumps(citations, ensure_ascii=False, separators=(',', ':'))
+        size = len(data.encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return False
+        # A replaced row no longer counts towards the total
+        old = self.conn.execute('SELECT size FROM chunks WHERE key = ?', (key,)).fetchone()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO chunks (key, data, size, last_used) VALUES (?, ?, ?, ?)',
+            (key, data, size, self.now))
+        self.total_bytes += size - (old[0] if old else 0)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+        # Commits are batched; each one costs an fsync
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.conn.commit()
+            self.uncommitted = 0
+        return True
+
+    def evict(self, target_ratio: float = 0.9):
+        """Drop least recently used entries until under ``target_ratio * max_bytes``."""
+        self.total_bytes = self.conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM chunks').fetchone()[0]
+        excess = self.total_bytes - int(self.max_bytes * target_ratio)
+        if excess <= 0:
+            return
+        victims: List[Tuple[bytes]] = []
+        freed = 0
+        for key, size in self.conn.execute('SELECT key, size FROM chunks ORDER BY last_used'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self.conn.executemany('DELETE FROM chunks WHERE key = ?', victims)
+        self.total_bytes -= freed
+
+    def clear(self):
+        """Remove every entry."""
+        self.conn.execute('DELETE FROM chunks')
+        self.conn.commit()
+        self.total_bytes = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    """Show statistics for, or clear, the citation cache."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect the citation cache')
+    parser.add_argument('--cache', help=f'Cache file (default: {default_cache_path()})')
+    parser.add_argument('--clear', action='store_true', help='Remove all cached citations')
+
+    args = parser.parse_args()
+
+    with CitationCache(args.cache) as cache:
+        if args.clear:
+            cache.clear()
+            print(f"Cleared {cache.path}")
+        count = cache.conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+        print(f"{cache.path}: {count} chunks, {cache.total_bytes / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Citation Deduplication
+Detects duplicate records in merged bibliographies.
+
+Records are matched, in order of confidence, by:
+  1. normalized DOI
+  2. fingerprint of normalized title + year + first-author family name
+  3. optionally, MinHash/LSH similarity of titles (near-duplicates such as
+     spelling or punctuation variants) with the same first author and year
+
+Every check is a constant number of hash lookups per record, so a pass is
+linear in the number of records. Only keys and (for near-duplicate
+detection) small title signatures are kept in memory, never the records.
+"""
+
+import hashlib
+import json
+import re
+import sys
+import unicodedata
+import zlib
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from citation_generator import parse_author_name
+
+# Default MinHash parameters: 32 values split into 8 bands of 4 rows, so
+# titles with Jaccard similarity of roughly 0.6 or more become candidates.
+DEFAULT_NUM_PERM = 32
+DEFAULT_BANDS = 8
+DEFAULT_THRESHOLD = 0.8
+
+# LSH buckets stop accepting new members beyond this size, which bounds the
+# candidates compared per record and keeps the pass linear even for
+# collections of very similar titles
+MAX_BUCKET_SIZE = 32
+
+_MAX_HASH = (1 << 32) - 1
+_GOLDEN = 0x9E3779B1
+_EMPTY_BIN = 1 << 63
+_DENSIFY_OFFSET = 1 << 32
+
+_DOI_PREFIX = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_doi(doi) -> str:
+    """Lowercase a DOI and strip resolver prefixes ("https://doi.org/", "doi:")."""
+    if not doi:
+        return ''
+    return _DOI_PREFIX.sub('', str(doi).strip()).strip().lower()
+
+
+def normalize_title(title) -> str:
+    """Casefold, strip accents and collapse punctuation/whitespace in a title."""
+    if not title:
+        return ''
+    text = unicodedata.normalize('NFKD', str(title))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+
+def first_author_family(authors) -> str:
+    """
+    Normalized family name of the first author.
+
+    Uses the citation formatter's name parser, so name order, particles and
+    suffixes do not matter: "Smith, J." and "John Smith" give "smith",
+    "Ludwig van Beethoven" and "van Beethoven, Ludwig" give "beethoven".
+    """
+    if not authors or not isinstance(authors, (list, tuple)):
+        return ''
+    return normalize_title(parse_author_name(str(authors[0])).family)
+
+
+def record_fingerprint(record: Dict) -> Optional[bytes]:
+    """Digest of normalized title, year and first-author family; None without a title."""
+    title = normalize_title(record.get('title'))
+    if not title:
+        return None
+    key = f"{title}\x1f{record.get('year', '')}\x1f{first_author_family(record.get('authors'))}"
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=12).digest()
+
+
+class MinHasher:
+    """
+    MinHash signatures over character trigrams of normalized titles.
+
+    Uses one-permutation hashing: each trigram is hashed once and the hash
+    picks a bin and a value, keeping the minimum per bin. Empty bins are
+    filled from the next non-empty bin (rotation densification), so the
+    cost is linear in the title length rather than in title length times
+    signature length.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM):
+        self.num_perm = num_perm
+
+    def signature(self, text: str) -> Optional[array]:
+        """Signature of ``text``, or None when it is too short to shingle."""
+        text = text.replace(' ', '')
+        if len(text) < 3:
+            return None
+        n = self.num_perm
+        sig = [_EMPTY_BIN] * n
+        data = text.encode('utf-8')
+        for i in range(len(data) - 2):
+            h = zlib.crc32(data[i:i + 3]) * _GOLDEN & _MAX_HASH
+            b, v = h % n, h // n
+            if v < sig[b]:
+                sig[b] = v
+        for j in range(n):
+            if sig[j] == _EMPTY_BIN:
+                k = 1
+                while sig[(j + k) % n] == _EMPTY_BIN:
+                    k += 1
+                sig[j] = sig[(j + k) % n] + k * _DENSIFY_OFFSET
+        return array('Q', sig)
+
+
+def signature_similarity(sig1: array, sig2: array) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+class Deduplicator:
+    """
+    Streaming duplicate detector.
+
+    Records are checked in input order; the first occurrence is kept and
+    later matches are reported as merged into it.
+    """
+
+    def __init__(
+        self,
+        near_duplicates: bool = False,
+        threshold: float = DEFAULT_THRESHOLD,
+        num_perm: int = DEFAULT_NUM_PERM,
+        bands: int = DEFAULT_BANDS,
+    ):
+        """
+        Initialize the index
+
+        Args:
+            near_duplicates: Also detect similar titles with MinHash/LSH
+            threshold: Minimum estimated title similarity for a near-duplicate
+            num_perm: MinHash signature length
+            bands: Number of LSH bands (must divide num_perm)
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.doi_index: Dict[str, int] = {}
+        self.fingerprint_index: Dict[bytes, int] = {}
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm) if near_duplicates else None
+        self.lsh_buckets: Dict[Tuple[int, bytes, str], List[int]] = {}
+        self.signatures: Dict[int, Tuple[array, str]] = {}
+        self.seen = 0
+        self.duplicates = 0
+
+    def check(self, record: Dict, index: int) -> Optional[Tuple[int, str, float]]:
+        """
+        Look up a record and index it if it is new.
+
+        Returns:
+            (index of the kept record, reason, similarity) for a duplicate,
+            or None for a new record
+        """
+        self.seen += 1
+        doi = normalize_doi(record.get('doi'))
+        if doi and doi in self.doi_index:
+            self.duplicates += 1
+            return self.doi_index[doi], 'doi', 1.0
+
+        fingerprint = record_fingerprint(record)
+        if fingerprint is not None and fingerprint in self.fingerprint_index:
+            match = self.fingerprint_index[fingerprint]
+            if doi:
+                self.doi_index[doi] = match
+            self.duplicates += 1
+            return match, 'fingerprint', 1.0
+
+        signature = None
+        bucket_keys = []
+        if self.hasher is not None:
+            signature = self.hasher.signature(normalize_title(record.get('title')))
+            if signature is not None:
+                # Buckets are per first author, so only titles by the same
+                # (normalized) first author are ever compared
+                author = first_author_family(record.get('authors'))
+                year = str(record.get('year', ''))
+                for band in range(len(signature) // self.rows):
+                    values = signature[band * self.rows:(band + 1) * self.rows]
+                    bucket_keys.append((band, values.tobytes(), author))
+                match = self._near_match(signature, year, bucket_keys)
+                if match is not None:
+                    # Later exact copies of this variant resolve directly
+                    if doi:
+                        self.doi_index[doi] = match[0]
+                    if fingerprint is not None:
+                        self.fingerprint_index[fingerprint] = match[0]
+                    self.duplicates += 1
+                    return match
+
+        if doi:
+            self.doi_index[doi] = index
+        if fingerprint is not None:
+            self.fingerprint_index[fingerprint] = index
+        if signature is not None:
+            self.signatures[index] = (signature, year)
+            for key in bucket_keys:
+                bucket = self.lsh_buckets.setdefault(key, [])
+                if len(bucket) < MAX_BUCKET_SIZE:
+                    bucket.append(index)
+        return None
+
+    def _near_match(self, signature: array, year: str,
+                    bucket_keys: List[Tuple[int, bytes, str]]) -> Optional[Tuple[int, str, float]]:
+        best = None
+        checked = set()
+        for key in bucket_keys:
+            for candidate in self.lsh_buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                other, other_year = self.signatures[candidate]
+                if year and other_year and year != other_year:
+                    continue
+                similarity = signature_similarity(signature, other)
+                if similarity >= self.threshold and (best is None or similarity > best[2]):
+                    best = (candidate, 'near-title', similarity)
+        return best
+
+    def filter(self, records: Iterable[Dict], report: Optional[TextIO] = None) -> Iterator[Dict]:
+        """
+        Yield only the first occurrence of each record.
+
+        Args:
+            records: Records in input order
+            report: Optional stream receiving one JSON line per merged record
+                    ({"index", "duplicate_of", "reason", "similarity", "title"})
+        """
+        for index, record in enumerate(records):
+            match = self.check(record, index)
+            if match is None:
+                yield record
+            elif report is not None:
+                duplicate_of, reason, similarity = match
+                report.write(json.dumps({
+                    'index': index,
+                    'duplicate_of': duplicate_of,
+                    'reason': reason,
+                    'similarity': round(similarity, 3),
+                    'title': record.get('title'),
+                }, ensure_ascii=False) + '\n')
+
+
+def main():
+    """Deduplicate a JSON Lines file of records (records go to stdout)."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Remove duplicate records from a JSON Lines bibliography')
+    parser.add_argument('--input', required=True, help='Input JSON Lines file')
+    parser.add_argument('--near-duplicates', action='store_true',
+                       help='Also merge near-duplicate titles (MinHash/LSH)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                       help=f'Near-duplicate similarity threshold (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--report', help='Write merged-record report (JSON Lines) to this file')
+
+    args = parser.parse_args()
+
+    dedup = Deduplicator(near_duplicates=args.near_duplicates, threshold=args.threshold)
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    try:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            records = (json.loads(line) for line in f if line.strip())
+            for record in dedup.filter(records, report):
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if report is not None:
+            report.close()
+
+    print(f"Kept {dedup.seen - dedup.duplicates} of {dedup.seen} records "
+          f"({dedup.duplicates} duplicates merged)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,701 @@
+#!/usr/bin/env python3
+"""
+Citation Enrichment
+Fills missing record fields from a Crossref-compatible REST API.
+
+Records lacking any of ``ENRICH_FIELDS`` are resolved concurrently on an
+asyncio event loop: by DOI (``/works/{doi}``) when they have one, otherwise
+by a bibliographic query whose best hit must match the record's title (and
+year, when both have one). Fields already present are never overwritten.
+
+Requests go through a small keep-alive HTTP/1.1 connection pool built on
+asyncio streams (no third-party client needed), with at most
+``concurrency`` requests in flight. Answers, including "not found", are
+kept in a persistent SQLite cache with a TTL, so repeated runs only hit
+the network for new or expired records.
+
+``StubCrossrefServer`` serves a fixed set of works over the same API for
+offline development and testing; ``citation_enrich.py --check`` runs the
+enricher and its cache against it (lookups, 429 retries, cache TTLs,
+failing fast on an unreachable endpoint) and reports what misbehaves.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import random
+import socket
+import sqlite3
+import ssl
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from citation_dedup import first_author_family, normalize_doi, normalize_title
+
+DEFAULT_BASE_URL = 'https://api.crossref.org'
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 15.0
+
+# Resolved metadata is kept for 30 days; misses are retried after a day
+DEFAULT_TTL = 30 * 24 * 60 * 60
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60
+
+# Attempts per request for 429/5xx answers and dropped connections
+MAX_ATTEMPTS = 4
+
+# Fields filled in when missing
+ENRICH_FIELDS = ('doi', 'authors', 'year', 'journal', 'volume', 'issue', 'pages')
+
+# Crossref fields requested for query hits (keeps responses small)
+_SELECT = 'DOI,title,author,container-title,volume,issue,page,issued'
+
+_USER_AGENT = 'research-skills-citation-enrich/1.0'
+
+# Records collected per event-loop run when enriching a stream
+_BATCH_SIZE = 256
+
+_SQL_BATCH = 500
+
+
+def default_enrich_cache_path() -> str:
+    """Resolver cache under $XDG_CACHE_HOME (default ~/.cache)."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'research-skills', 'crossref.sqlite')
+
+
+class HTTPError(Exception):
+    """Non-retryable HTTP failure, or retries exhausted."""
+
+    def __init__(self, status: int, url: str):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 client over asyncio streams.
+
+    At most ``limit`` connections are open at a time; idle connections are
+    reused per (scheme, host, port). Only GET is needed here.
+    """
+
+    def __init__(self, limit: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 headers: Optional[Dict[str, str]] = None):
+        self.limit = limit
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.idle: Dict[Tuple[str, str, int], List] = {}
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        self.opened = 0
+        self.requests = 0
+
+    async def get(self, url: str) -> Tuple[int, Dict[str, str], bytes]:
+        """GET ``url``; returns (status, lowercase headers, decoded body)."""
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.limit)
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        async with self.slots:
+            for attempt in range(2):
+                conn, reused = await self._acquire(key)
+                try:
+                    status, headers, body, keep = await asyncio.wait_for(
+                        self._roundtrip(conn, parts.netloc, target), self.timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn[1].close()
+                    # A pooled connection may have been closed by the server
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                except BaseException:
+                    conn[1].close()
+                    raise
+                self.requests += 1
+                if keep:
+                    self.idle.setdefault(key, []).append(conn)
+                else:
+                    conn[1].close()
+                return status, headers, body
+        raise ConnectionError(f"cannot reach {url}")
+
+    async def _acquire(self, key: Tuple[str, str, int]):
+        idle = self.idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return (reader, writer), True
+            writer.close()
+        scheme, host, port = key
+        context = None
+        if scheme == 'https':
+            if self.ssl_context is None:
+                self.ssl_context = ssl.create_default_context()
+            context = self.ssl_context
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context), self.timeout)
+        self.opened += 1
+        return (reader, writer), False
+
+    async def _roundtrip(self, conn, host: str, target: str):
+        reader, writer = conn
+        lines = [f'GET {target} HTTP/1.1', f'Host: {host}', 'Accept: application/json',
+                 'Accept-Encoding: gzip', 'Connection: keep-alive']
+        lines.extend(f'{name}: {value}' for name, value in self.headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed before response')
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if not size:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep = False
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return int(status), headers, body, keep
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+class ResolverCache:
+    """SQLite store of resolved metadata (or misses) with a TTL."""
+
+    def __init__(self, path: Optional[str] = None, ttl: int = DEFAULT_TTL,
+                 negative_ttl: int = DEFAULT_NEGATIVE_TTL):
+        self.path = path or default_enrich_cache_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS resolved ('
+            ' key TEXT PRIMARY KEY, data TEXT, fetched INTEGER NOT NULL'
+            ') WITHOUT ROWID')
+        self.conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[Dict]]:
+        """Unexpired entries; a value of None records a known miss."""
+        now = int(time.time())
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), _SQL_BATCH):
+            batch = unique[i:i + _SQL_BATCH]
+            marks = ','.join('?' * len(batch))
+            for key, data, fetched in self.conn.execute(
+                    f'SELECT key, data, fetched FROM resolved WHERE key IN ({marks})', batch):
+                ttl = self.ttl if data is not None else self.negative_ttl
+                if now - fetched < ttl:
+                    found[key] = json.loads(data) if data is not None else None
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Optional[Dict]]]):
+        now = int(time.time())
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO resolved (key, data, fetched) VALUES (?, ?, ?)',
+            [(key, json.dumps(data, ensure_ascii=False) if data is not None else None, now)
+             for key, data in items])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def needs_enrichment(record) -> bool:
+    """True when a record lacks an enrichable field and can be looked up."""
+    if not (record.get('doi') or record.get('title')):
+        return False
+    return any(record.get(field) in (None, '', [], ()) for field in ENRICH_FIELDS)
+
+
+def lookup_key(record) -> str:
+    """Cache key of a record's lookup: its DOI, else normalized title/year/first author."""
+    doi = normalize_doi(record.get('doi'))
+    if doi:
+        return f"doi:{doi}"
+    return (f"query:{normalize_title(record.get('title'))}\x1f{record.get('year', '')}"
+            f"\x1f{first_author_family(record.get('authors'))}")
+
+
+def crossref_fields(work: Dict) -> Dict:
+    """Record fields (this repo's schema) from a Crossref work object."""
+    fields = {}
+    if work.get('DOI'):
+        fields['doi'] = work['DOI']
+    authors = []
+    for author in work.get('author') or []:
+        if author.get('family'):
+            authors.append(f"{author['family']}, {author['given']}" if author.get('given')
+                           else author['family'])
+        elif author.get('name'):
+            authors.append('{' + author['name'] + '}')
+    if authors:
+        fields['authors'] = authors
+    parts = ((work.get('issued') or {}).get('date-parts') or [[None]])[0]
+    if parts and parts[0]:
+        fields['year'] = parts[0]
+    containers = work.get('container-title') or []
+    if containers:
+        fields['journal'] = containers[0]
+    for source, target in (('volume', 'volume'), ('issue', 'issue'), ('page', 'pages')):
+        if work.get(source):
+            fields[target] = str(work[source])
+    return fields
+
+
+def _title_matches(record, work: Dict) -> bool:
+    titles = work.get('title') or []
+    if not titles or normalize_title(titles[0]) != normalize_title(record.get('title')):
+        return False
+    year = record.get('year')
+    found = crossref_fields(work).get('year')
+    return not (year and found) or str(year) == str(found)
+
+
+class Enricher:
+    """Fills missing fields of streamed records from a Crossref-compatible API."""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, cache: Optional[ResolverCache] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 mailto: Optional[str] = None):
+        """
+        Initialize the enricher
+
+        Args:
+            base_url: API root serving ``/works`` (Crossref or a mirror/stub)
+            cache: Persistent resolver cache (None disables caching)
+            concurrency: Maximum requests (and connections) in flight
+            timeout: Seconds per connection attempt and per response
+            mailto: Contact address sent to Crossref ("polite pool")
+        """
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache
+        self.mailto = mailto
+        user_agent = _USER_AGENT + (f' (mailto:{mailto})' if mailto else '')
+        self.pool = ConnectionPool(concurrency, timeout, {'User-Agent': user_agent})
+        self.loop = asyncio.new_event_loop()
+        self.looked_up = 0
+        self.cache_hits = 0
+        self.resolved = 0
+        self.fields_filled = 0
+        self.failures = 0
+        # Set once the endpoint cannot be reached; later lookups fail fast
+        self.unreachable: Optional[Exception] = None
+
+    async def _fetch_json(self, path: str, params: Optional[Dict] = None) -> Optional[Dict]:
+        params = dict(params or {})
+        if self.mailto:
+            params['mailto'] = self.mailto
+        url = self.base_url + path + (f'?{urlencode(params)}' if params else '')
+        for attempt in range(MAX_ATTEMPTS):
+            if self.unreachable is not None:
+                raise self.unreachable
+            try:
+                status, headers, body = await self.pool.get(url)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                if attempt == MAX_ATTEMPTS - 1:
+                    self.unreachable = e
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+            if status == 404:
+                return None
+            if status == 200:
+                return json.loads(body)
+            if status == 429 or status >= 500:
+                if attempt == MAX_ATTEMPTS - 1:
+                    break
+                try:
+                    delay = float(headers.get('retry-after', ''))
+                except ValueError:
+                    delay = 0.5 * 2 ** attempt * random.uniform(0.5, 1.5)
+                await asyncio.sleep(delay)
+                continue
+            raise HTTPError(status, url)
+        raise HTTPError(status, url)
+
+    async def resolve(self, record) -> Optional[Dict]:
+        """Crossref fields for a record, or None when no confident match exists."""
+        doi = normalize_doi(record.get('doi'))
+        if doi:
+            data = await self._fetch_json(f"/works/{quote(doi, safe='/')}")
+            return crossref_fields(data['message']) if data else None
+        params = {'query.bibliographic': str(record.get('title')), 'rows': 3, 'select': _SELECT}
+        family = first_author_family(record.get('authors'))
+        if family:
+            params['query.author'] = family
+        data = await self._fetch_json('/works', params)
+        for work in ((data or {}).get('message') or {}).get('items') or []:
+            if _title_matches(record, work):
+                return crossref_fields(work)
+        return None
+
+    async def _resolve_all(self, records: List) -> List:
+        async def one(record):
+            try:
+                return await self.resolve(record)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                    HTTPError, ValueError, KeyError) as e:
+                return e
+        return await asyncio.gather(*(one(r) for r in records))
+
+    def _apply(self, record, fields: Dict):
+        for field in ENRICH_FIELDS:
+            if field in fields and record.get(field) in (None, '', [], ()):
+                record[field] = fields[field]
+                self.fields_filled += 1
+
+    def enrich_batch(self, records: List) -> List:
+        """Fill missing fields of a list of records in place (and return it)."""
+        todo = {}
+        for record in records:
+            if needs_enrichment(record):
+                todo.setdefault(lookup_key(record), []).append(record)
+        if not todo:
+            return records
+        self.looked_up += sum(len(group) for group in todo.values())
+        cached = self.cache.get_many(list(todo)) if self.cache is not None else {}
+        self.cache_hits += sum(len(todo[key]) for key in cached)
+        misses = [key for key in todo if key not in cached]
+        results = self.loop.run_until_complete(
+            self._resolve_all([todo[key][0] for key in misses])) if misses else []
+
+        fresh = []
+        for key, result in zip(misses, results):
+            if isinstance(result, Exception):
+                # Failures are not cached; the next run tries again
+                self.failures += len(todo[key])
+                continue
+            cached[key] = result
+            fresh.append((key, result))
+        if fresh and self.cache is not None:
+            self.cache.put_many(fresh)
+        for key, fields in cached.items():
+            if fields:
+                for record in todo[key]:
+                    self.resolved += 1
+                    self._apply(record, fields)
+        return records
+
+    def enrich(self, records: Iterable, batch_size: int = _BATCH_SIZE) -> Iterator:
+        """Yield records in input order, enriched a batch at a time."""
+        it = iter(records)
+        while True:
+            batch = list(islice(it, batch_size))
+            if not batch:
+                return
+            yield from self.enrich_batch(batch)
+
+    def close(self):
+        self.pool.close()
+        # Let transports finish closing before the loop goes away
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; don't let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.fail_next > 0
+            if fail:
+                server.fail_next -= 1
+        if server.latency:
+            time.sleep(server.latency)
+        if fail or (server.error_rate and random.random() < server.error_rate):
+            self._send(429, {'status': 'error', 'message': 'rate limited'})
+            return
+        parts = urlsplit(self.path)
+        if parts.path.startswith('/works/'):
+            work = server.by_doi.get(normalize_doi(unquote(parts.path[len('/works/'):])))
+            if work is None:
+                self._send(404, {'status': 'error', 'message': 'Resource not found.'})
+            else:
+                self._send(200, {'status': 'ok', 'message-type': 'work', 'message': work})
+        elif parts.path == '/works':
+            query = parse_qs(parts.query)
+            title = normalize_title((query.get('query.bibliographic') or [''])[0])
+            rows = int((query.get('rows') or ['20'])[0])
+            items = [w for w, t in zip(server.works, server.titles) if title and title in t][:rows]
+            self._send(200, {'status': 'ok', 'message-type': 'work-list',
+                             'message': {'total-results': len(items), 'items': items}})
+        else:
+            self._send(404, {'status': 'error', 'message': 'Not found.'})
+
+
+class StubCrossrefServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Crossref works API.
+
+    Serves ``/works/{doi}`` and ``/works?query.bibliographic=...`` from a
+    list of Crossref work objects, with optional per-request latency and a
+    rate of injected 429 responses. Setting ``fail_next`` answers that many
+    of the following requests with 429.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, works: List[Dict], port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0):
+        super().__init__(('127.0.0.1', port), _StubHandler)
+        self.works = works
+        self.by_doi = {normalize_doi(w.get('DOI')): w for w in works if w.get('DOI')}
+        self.titles = [normalize_title((w.get('title') or [''])[0]) for w in works]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail_next = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> 'StubCrossrefServer':
+        """Serve from a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+# Works served and records enriched by check()
+_CHECK_WORKS = [
+    {'DOI': '10.5555/check.1', 'title': ['Deep learning of citation graphs'],
+     'author': [{'given': 'Ana', 'family': 'Garcia'}], 'container-title': ['Nature'],
+     'volume': '5', 'issue': '2', 'page': '1-10', 'issued': {'date-parts': [[2020, 1]]}},
+    {'DOI': '10.5555/check.2', 'title': ['Quantum graph inference'],
+     'author': [{'given': 'Wei', 'family': 'Zhang'}], 'container-title': ['Science'],
+     'volume': '7', 'issued': {'date-parts': [[2019]]}},
+]
+_CHECK_RECORDS = [
+    # DOI lookup; present fields must survive
+    {'doi': '10.5555/CHECK.1', 'title': 'Deep learning of citation graphs',
+     'journal': 'Journal of Records', 'authors': ['Someone, X.']},
+    # Query lookup matching title and year
+    {'title': 'Quantum Graph Inference', 'year': 2019},
+    # Same title, different year: no confident match
+    {'title': 'Quantum graph inference', 'year': 2001},
+    # Unknown DOI: a cached miss
+    {'doi': '10.5555/missing', 'title': 'Not in the index'},
+]
+
+
+def check() -> List[str]:
+    """
+    Exercise Enricher and ResolverCache against a local stub server.
+
+    Returns:
+        One line per failed expectation (empty when everything behaves)
+    """
+    problems = []
+
+    def expect(condition: bool, message: str):
+        if not condition:
+            problems.append(message)
+
+    directory = tempfile.mkdtemp(prefix='citation-enrich-check-')
+    cache_path = os.path.join(directory, 'crossref.sqlite')
+    server = StubCrossrefServer(_CHECK_WORKS).start()
+    try:
+        with ResolverCache(cache_path) as cache:
+            records = [dict(r) for r in _CHECK_RECORDS]
+            with Enricher(server.url, cache) as enricher:
+                enricher.enrich_batch(records)
+            by_doi, by_query, wrong_year, missing = records
+            expect(by_doi['journal'] == 'Journal of Records'
+                   and by_doi['authors'] == ['Someone, X.'], 'present fields were overwritten')
+            expect((by_doi.get('volume'), by_doi.get('issue'), by_doi.get('pages'),
+                    by_doi.get('year')) == ('5', '2', '1-10', 2020),
+                   'DOI lookup did not fill the missing fields')
+            expect(by_query.get('doi') == '10.5555/check.2'
+                   and by_query.get('journal') == 'Science', 'query lookup did not match')
+            expect('doi' not in wrong_year, 'query hit with a different year was accepted')
+            expect(missing == _CHECK_RECORDS[3], 'unknown DOI changed the record')
+            expect(enricher.resolved == 2 and enricher.failures == 0,
+                   f'{enricher.resolved} resolved, {enricher.failures} failed (expected 2, 0)')
+
+            # Answers, including the miss, come from the cache while fresh
+            requests = server.requests
+            with Enricher(server.url, cache) as enricher:
+                enricher.enrich_batch([dict(r) for r in _CHECK_RECORDS])
+            expect(server.requests == requests and enricher.cache_hits == len(_CHECK_RECORDS),
+                   'cached answers were fetched again')
+
+            # 429 answers are retried, waiting as long as Retry-After says (0 s)
+            server.fail_next = MAX_ATTEMPTS - 1
+            requests = server.requests
+            record = {'doi': '10.5555/check.1'}
+            with Enricher(server.url) as enricher:
+                start = time.perf_counter()
+                enricher.enrich_batch([record])
+                elapsed = time.perf_counter() - start
+            expect(record.get('journal') == 'Nature'
+                   and server.requests == requests + MAX_ATTEMPTS, 'request was not retried after 429')
+            expect(elapsed < 0.5, f'Retry-After: 0 was not honoured ({elapsed:.2f} s)')
+
+            # Giving up after MAX_ATTEMPTS; failures are not cached
+            server.fail_next = MAX_ATTEMPTS
+            record = {'doi': '10.5555/check.2'}
+            with Enricher(server.url, cache) as enricher:
+                enricher.enrich_batch([record])
+            expect(enricher.failures == 1 and record == {'doi': '10.5555/check.2'},
+                   'exhausted retries did not count as a failure')
+            expect(not cache.get_many([lookup_key(record)]), 'a failed lookup was cached')
+
+            # Expired entries are fetched again
+            cache.ttl = cache.negative_ttl = 0
+            requests = server.requests
+            with Enricher(server.url, cache) as enricher:
+                enricher.enrich_batch([dict(r) for r in _CHECK_RECORDS])
+            expect(enricher.cache_hits == 0 and server.requests == requests + len(_CHECK_RECORDS),
+                   'expired cache entries were still used')
+    finally:
+        server.shutdown()
+        server.server_close()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    # Once the endpoint is unreachable, later lookups fail without retrying
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    with Enricher(f'http://127.0.0.1:{port}', timeout=1.0) as enricher:
+        enricher.enrich_batch([{'doi': f'10.5555/down.{i}'} for i in range(3)])
+        start = time.perf_counter()
+        enricher.enrich_batch([{'doi': '10.5555/down.later'}])
+        elapsed = time.perf_counter() - start
+    expect(enricher.unreachable is not None and enricher.failures == 4,
+           'unreachable endpoint was not detected')
+    expect(elapsed < 0.1, f'lookups did not fail fast once unreachable ({elapsed:.2f} s)')
+    return problems
+
+
+def main():
+    """Enrich a JSON Lines file (to stdout), run the stub server, or check against it."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fill missing record fields from Crossref')
+    parser.add_argument('--input', help='Input JSON Lines file')
+    parser.add_argument('--url', default=os.environ.get('CROSSREF_URL', DEFAULT_BASE_URL),
+                       help=f'API root (default: $CROSSREF_URL or {DEFAULT_BASE_URL})')
+    parser.add_argument('--mailto', default=os.environ.get('CROSSREF_MAILTO'),
+                       help='Contact address for the Crossref polite pool')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'Requests in flight (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--cache', help=f'Resolver cache (default: {default_enrich_cache_path()})')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the cache')
+    parser.add_argument('--stub-server', metavar='WORKS',
+                       help='Serve the Crossref work objects in this JSON Lines file instead')
+    parser.add_argument('--port', type=int, default=8080, help='Stub server port (default: 8080)')
+    parser.add_argument('--check', action='store_true',
+                       help='Check the enricher against a local stub server and exit')
+
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check()
+        for line in problems:
+            print(line, file=sys.stderr)
+        print(f"{len(problems)} problems", file=sys.stderr)
+        return 1 if problems else 0
+
+    if args.stub_server:
+        with open(args.stub_server, 'r', encoding='utf-8') as f:
+            works = [json.loads(line) for line in f if line.strip()]
+        server = StubCrossrefServer(works, args.port)
+        print(f"Serving {len(works)} works on {server.url}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if not args.input:
+        parser.error('--input is required')
+    if args.concurrency < 1:
+        parser.error('--concurrency must be positive')
+
+    cache = None if args.no_cache else ResolverCache(args.cache)
+    try:
+        with Enricher(args.url, cache, args.concurrency, mailto=args.mailto) as enricher, \
+                open(args.input, 'r', encoding='utf-8') as f:
+            records = (json.loads(line) for line in f if line.strip())
+            for record in enricher.enrich(records):
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"Enrichment: {enricher.resolved} of {enricher.looked_up} records resolved "
+          f"({enricher.cache_hits} from cache, {enricher.failures} failed), "
+          f"{enricher.fields_filled} fields filled", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,13 +4,335 @@ Citation Generator Script
 Converts paper metadata to formatted citations in various academic styles.
 
 Supports: APA, MLA, Chicago, Harvard, IEEE
+
+Input may be a single JSON object, a JSON array of objects, or JSON Lines
+(one object per line). Records are parsed and formatted one at a time, so
+memory use does not grow with the size of the input.
 """
 
 import json
 import argparse
+import mmap
+import os
+import re
+import string
 import sys
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from citation_writers import (
+    GZIP_SUFFIX, RECORD_FORMATS, WRITERS, CitationWriter, open_output,
+)
+
+# Size of each read when incrementally decoding a JSON document
+READ_CHUNK_SIZE = 1 << 16
+
+# Records handed to a worker process per task when formatting in parallel
+DEFAULT_CHUNK_SIZE = 1000
+
+# Bytes of a JSON Lines file parsed by a worker per task
+DEFAULT_SHARD_SIZE = 4 << 20
+
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+
+# Columnar inputs, read through citation_arrow (requires pyarrow)
+ARROW_FORMATS = ('parquet', 'arrow')
+
+_WHITESPACE = ' \t\n\r'
+
+_intern = sys.intern
+
+
+def _compact(value):
+    """Intern strings (and author lists as tuples of interned strings)."""
+    if value.__class__ is str:
+        return _intern(value)
+    if value.__class__ is list:
+        return tuple([_intern(v) if v.__class__ is str else v for v in value])
+    return value
+
+
+class Paper:
+    """
+    Compact paper metadata record.
+
+    Common fields live in ``__slots__`` with interned string values and
+    author lists stored as tuples; any other keys go to an ``extra`` dict.
+    Supports the read-only mapping API used by the formatters (``get``,
+    ``[]``, ``in``, ``keys``, ``items``), so code written for plain dict
+    records keeps working.
+    """
+
+    FIELDS = ('authors', 'year', 'title', 'journal', 'volume', 'issue',
+              'pages', 'doi', 'url', 'month')
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        self._clear()
+        for key, value in fields.items():
+            self[key] = value
+
+    def _clear(self):
+        # Unset fields hold _MISSING so reads never raise AttributeError
+        self.authors = self.year = self.title = self.journal = self.volume = \
+            self.issue = self.pages = self.doi = self.url = self.month = _MISSING
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Paper':
+        paper = cls.__new__(cls)
+        get = data.get
+        authors = get('authors', _MISSING)
+        if authors.__class__ is list:
+            try:
+                authors = tuple(map(_intern, authors))
+            except TypeError:
+                authors = _compact(authors)
+        paper.authors = authors
+        paper.year = get('year', _MISSING)
+        paper.title = get('title', _MISSING)
+        journal = get('journal', _MISSING)
+        paper.journal = _intern(journal) if journal.__class__ is str else journal
+        paper.volume = get('volume', _MISSING)
+        paper.issue = get('issue', _MISSING)
+        paper.pages = get('pages', _MISSING)
+        paper.doi = get('doi', _MISSING)
+        paper.url = get('url', _MISSING)
+        month = get('month', _MISSING)
+        paper.month = _intern(month) if month.__class__ is str else month
+        if _PAPER_FIELDS.issuperset(data):
+            paper.extra = None
+        else:
+            paper.extra = {k: v for k, v in data.items() if k not in _PAPER_FIELDS}
+        return paper
+
+    def __setitem__(self, key: str, value):
+        if key in _PAPER_FIELDS:
+            setattr(self, key, _compact(value))
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def get(self, key: str, default=None):
+        if key in _PAPER_FIELDS:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self) -> List[str]:
+        keys = [f for f in self.FIELDS if getattr(self, f) is not _MISSING]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def items(self) -> List[Tuple[str, object]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self) -> Dict:
+        """Plain dict copy (author tuples become lists)."""
+        data = {}
+        for key, value in self.items():
+            data[key] = list(value) if isinstance(value, tuple) else value
+        return data
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Paper):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    def __repr__(self) -> str:
+        return f"Paper({self.to_dict()!r})"
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state: Dict):
+        self._clear()
+        for key, value in state.items():
+            self[key] = value
+
+
+_PAPER_FIELDS = frozenset(Paper.FIELDS)
+_MISSING = object()
+
+
+def as_record(data):
+    """Convert a decoded JSON object to a Paper; other values pass through."""
+    return Paper.from_dict(data) if isinstance(data, dict) else data
+
+
+class AuthorName(NamedTuple):
+    """Structured personal name; components are interned strings."""
+    given: str
+    family: str
+    particle: str = ''
+    suffix: str = ''
+
+    @property
+    def full_family(self) -> str:
+        """Family name including any particle ("van Beethoven")."""
+        return f"{self.particle} {self.family}" if self.particle else self.family
+
+
+# Upper bound on distinct author strings kept by each name cache
+NAME_CACHE_SIZE = 1 << 16
+
+NAME_SUFFIXES = frozenset({'jr', 'jr.', 'sr', 'sr.', 'ii', 'iii', 'iv'})
+
+_NAME_PARTICLES = frozenset({
+    'da', 'das', 'de', 'degli', 'dei', 'del', 'della', 'der', 'des', 'di', 'do',
+    'dos', 'du', 'la', 'le', 'ten', 'ter', 'van', 'von', 'zu',
+})
+
+
+def _is_suffix(word: str, has_given: bool) -> bool:
+    """Generational suffix check; a bare "V" is only a suffix next to a given name."""
+    word = word.lower()
+    return word in NAME_SUFFIXES or (word == 'v' and has_given)
+
+
+def _is_particle(word: str) -> bool:
+    return word in _NAME_PARTICLES or (word[:1].islower() and word.isalpha())
+
+
+def _split_family(words: List[str]) -> Tuple[str, str]:
+    """Split "van der Berg" into particle "van der" and family "Berg"."""
+    i = 0
+    while i < len(words) - 1 and _is_particle(words[i]):
+        i += 1
+    return ' '.join(words[:i]), ' '.join(words[i:])
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def parse_author_name(raw: str) -> AuthorName:
+    """
+    Parse a personal name into given/family/particle/suffix parts.
+
+    Understands "Given Family", "Family, Given", "Family, Given Suffix",
+    "Family, Suffix, Given", "Family, Given, Suffix" and "Given Family,
+    Suffix", including lowercase particles such as "van" or "de la". A name wrapped in braces ("{World Health
+    Organization}") is kept verbatim as the family name.
+    """
+    name = ' '.join(str(raw).split())
+    if name.startswith('{') and name.endswith('}'):
+        return AuthorName('', sys.intern(name[1:-1]))
+
+    parts = [p.strip() for p in name.split(',')]
+    suffix = ''
+    if len(parts) >= 3:
+        if _is_suffix(parts[-1], True) and not _is_suffix(parts[1], True):
+            # "King, Martin Luther, Jr."
+            family_words, given, suffix = parts[0].split(), ' '.join(parts[1:-1]), parts[-1]
+        else:
+            family_words, suffix, given = parts[0].split(), parts[1], ' '.join(parts[2:])
+    elif len(parts) == 2 and not _is_suffix(parts[1], len(parts[0].split()) > 1):
+        family_words, given_words = parts[0].split(), parts[1].split()
+        # "Smith, John Jr.": a trailing suffix is not a given name (a bare "V"
+        # after a comma is read as an initial)
+        if len(given_words) > 1 and _is_suffix(given_words[-1], False):
+            suffix = given_words.pop()
+        given = ' '.join(given_words)
+    else:
+        if len(parts) == 2:
+            suffix = parts[1]
+        words = parts[0].split()
+        if len(words) > 1 and _is_suffix(words[-1], len(words) > 2):
+            suffix = words.pop()
+        # The family name starts at the first particle or the last word
+        start = len(words) - 1
+        for i, word in enumerate(words[1:-1], 1):
+            if word in _NAME_PARTICLES:
+                start = i
+                break
+        given, family_words = ' '.join(words[:start]), words[start:]
+
+    particle, family = _split_family(family_words)
+    return AuthorName(sys.intern(given), sys.intern(family),
+                      sys.intern(particle), sys.intern(suffix))
+
+
+def name_initials(given: str) -> str:
+    """Initials for given names: "John Ronald" -> "J. R.", "Jean-Luc" -> "J.-L."."""
+    initials = []
+    for word in given.split():
+        hyphenated = []
+        for part in word.split('-'):
+            letters = [chunk[0] + '.' for chunk in part.split('.') if chunk]
+            if letters:
+                hyphenated.append(' '.join(letters))
+        if hyphenated:
+            initials.append('-'.join(hyphenated))
+    return ' '.join(initials)
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_inverted_initials(raw: str) -> str:
+    """Format as "Family, G. G., Jr." (APA, Harvard)."""
+    n = parse_author_name(raw)
+    out = n.full_family
+    initials = name_initials(n.given)
+    if initials:
+        out = f"{out}, {initials}"
+    if n.suffix:
+        out = f"{out}, {n.suffix}"
+    return sys.intern(out)
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_inverted(raw: str) -> str:
+    """Format as "Family, Given, Jr." (first author in MLA and Chicago)."""
+    n = parse_author_name(raw)
+    out = f"{n.full_family}, {n.given}" if n.given else n.full_family
+    if n.suffix:
+        out = f"{out}, {n.suffix}"
+    return sys.intern(out)
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_natural(raw: str) -> str:
+    """Format as "Given Family, Jr." (later authors in MLA and Chicago)."""
+    n = parse_author_name(raw)
+    out = f"{n.given} {n.full_family}" if n.given else n.full_family
+    if n.suffix:
+        out = f"{out}, {n.suffix}"
+    return sys.intern(out)
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_initials_first(raw: str) -> str:
+    """Format as "G. G. Family, Jr." (IEEE)."""
+    n = parse_author_name(raw)
+    initials = name_initials(n.given)
+    out = f"{initials} {n.full_family}" if initials else n.full_family
+    if n.suffix:
+        out = f"{out}, {n.suffix}"
+    return sys.intern(out)
 
 
 def format_authors_apa(authors: List[str]) -> str:
@@ -18,17 +340,18 @@ def format_authors_apa(authors: List[str]) -> str:
     if not authors:
         return ""
 
-    if len(authors) == 1:
-        return authors[0]
-    elif len(authors) == 2:
-        return f"{authors[0]}, & {authors[1]}"
-    elif len(authors) <= 20:
-        formatted = ", ".join(authors[:-1])
-        return f"{formatted}, & {authors[-1]}"
+    names = [name_inverted_initials(a) for a in authors]
+    if len(names) == 1:
+        return names[0]
+    elif len(names) == 2:
+        return f"{names[0]}, & {names[1]}"
+    elif len(names) <= 20:
+        formatted = ", ".join(names[:-1])
+        return f"{formatted}, & {names[-1]}"
     else:
         # For 21+ authors, list first 19, ellipsis, then last author
-        formatted = ", ".join(authors[:19])
-        return f"{formatted}, ... {authors[-1]}"
+        formatted = ", ".join(names[:19])
+        return f"{formatted}, ... {names[-1]}"
 
 
 def format_authors_mla(authors: List[str]) -> str:
@@ -36,254 +359,1551 @@ def format_authors_mla(authors: List[str]) -> str:
     if not authors:
         return ""
 
+    if len(authors) == 1:
+        return name_inverted(authors[0])
+    elif len(authors) == 2:
+        return f"{name_inverted(authors[0])}, and {name_natural(authors[1])}"
+    else:
+        return f"{name_inverted(authors[0])}, et al."
+
+
+def format_authors_chicago(authors: List[str]) -> str:
+    """Format authors for Chicago (first author: Last, First; others: First Last)."""
+    if len(authors) == 1:
+        return name_inverted(authors[0])
+    elif len(authors) == 2:
+        return f"{name_inverted(authors[0])} and {name_natural(authors[1])}"
+    else:
+        return f"{name_inverted(authors[0])} et al."
+
+
+def format_authors_harvard(authors: List[str]) -> str:
+    """Format authors for Harvard (Last, Initials)."""
+    if len(authors) == 1:
+        return name_inverted_initials(authors[0])
+    elif len(authors) == 2:
+        return f"{name_inverted_initials(authors[0])} and {name_inverted_initials(authors[1])}"
+    else:
+        return f"{name_inverted_initials(authors[0])} et al."
+
+
+def format_authors_and_et_al(authors: List[str]) -> str:
+    """Format authors as given, "A and B" or "A et al."."""
     if len(authors) == 1:
         return authors[0]
     elif len(authors) == 2:
-        return f"{authors[0]}, and {authors[1]}"
+        return f"{authors[0]} and {authors[1]}"
     else:
-        return f"{authors[0]}, et al."
+        return f"{authors[0]} et al."
+
+
+def format_authors_ieee(authors: List[str]) -> str:
+    """Format authors for IEEE (Initial. Last): up to three names, then "et al."."""
+    author_str = ", ".join([name_initials_first(a) for a in authors[:3]])
+    if len(authors) > 3:
+        author_str += ", et al."
+    return author_str
+
+
+UNKNOWN_AUTHOR = "Unknown Author"
+
+# Author-list formatters a style definition can refer to by name, with the
+# condition under which UNKNOWN_AUTHOR is substituted: 'empty-result' when the
+# formatted string is empty, 'empty-list' when there are no authors at all.
+AUTHOR_FORMATTERS: Dict[str, Tuple[Callable[[List[str]], str], str]] = {
+    'apa': (format_authors_apa, 'empty-result'),
+    'mla': (format_authors_mla, 'empty-result'),
+    'chicago': (format_authors_chicago, 'empty-list'),
+    'harvard': (format_authors_harvard, 'empty-list'),
+    'and-et-al': (format_authors_and_et_al, 'empty-list'),
+    'ieee': (format_authors_ieee, 'empty-list'),
+}
+
+# Default value that is replaced by the current year at format time
+CURRENT_YEAR = '$year'
+
+# Built-in style definitions.
+#
+# A definition names an author formatter, the reference-list sort order
+# (keys from SORT_FIELDS, or None to keep citation order), per-field defaults
+# and a template.
+# Template entries are either strings using str.format-style ``{field}``
+# placeholders (``{authors}`` is the formatted author list) or conditionals
+# ``{"if": field, "then": [...], "else": [...]}`` that test the field for
+# truthiness. A period right after a placeholder is dropped when the value
+# already ends with one ("Jr." stays "Jr."). Fields without a default fall
+# back to ''. User-supplied styles in a JSON file (see ``--style-file``) use
+# the same schema.
+BUILTIN_STYLES: List[Dict] = [
+    {
+        'name': 'apa',
+        'description': 'APA 7th edition',
+        'version': 2,
+        'authors': 'apa',
+        'sort': ['author', 'year', 'title'],
+        'defaults': {'year': CURRENT_YEAR, 'title': 'Untitled'},
+        'template': [
+            '{authors} ({year}). {title}. ',
+            {'if': 'journal', 'then': [
+                '*{journal}*',
+                {'if': 'volume', 'then': [', *{volume}*']},
+                {'if': 'issue', 'then': ['({issue})']},
+                {'if': 'pages', 'then': [', {pages}']},
+                '.',
+            ]},
+            {'if': 'doi', 'then': [' https://doi.org/{doi}'],
+             'else': [{'if': 'url', 'then': [' {url}']}]},
+        ],
+    },
+    {
+        'name': 'mla',
+        'description': 'MLA 9th edition',
+        'version': 2,
+        'authors': 'mla',
+        'sort': ['author', 'title'],
+        'defaults': {'year': CURRENT_YEAR, 'title': 'Untitled'},
+        'template': [
+            '{authors}. "{title}." ',
+            {'if': 'journal', 'then': [
+                '*{journal}*',
+                {'if': 'volume', 'then': [', vol. {volume}']},
+                {'if': 'issue', 'then': [', no. {issue}']},
+                ', {year}',
+                {'if': 'pages', 'then': [', pp. {pages}']},
+                '.',
+            ]},
+            {'if': 'doi', 'then': [' https://doi.org/{doi}.']},
+        ],
+    },
+    {
+        'name': 'chicago',
+        'description': 'Chicago 17th edition (notes-bibliography)',
+        'version': 2,
+        'authors': 'chicago',
+        'sort': ['author', 'title'],
+        'defaults': {'year': CURRENT_YEAR, 'title': 'Untitled'},
+        'template': [
+            '{authors}. "{title}." ',
+            {'if': 'journal', 'then': [
+                '*{journal}*',
+                {'if': 'volume', 'then': [' {volume}']},
+                {'if': 'issue', 'then': [', no. {issue}']},
+                ' ({year})',
+                {'if': 'pages', 'then': [': {pages}']},
+                '.',
+            ]},
+            {'if': 'doi', 'then': [' https://doi.org/{doi}.']},
+        ],
+    },
+    {
+        'name': 'harvard',
+        'description': 'Harvard',
+        'version': 2,
+        'authors': 'harvard',
+        'sort': ['author', 'year', 'title'],
+        'defaults': {'year': CURRENT_YEAR, 'title': 'Untitled'},
+        'template': [
+            "{authors} ({year}) '{title}', ",
+            {'if': 'journal', 'then': [
+                '*{journal}*',
+                {'if': 'volume', 'then': [', vol. {volume}']},
+                {'if': 'issue', 'then': [', no. {issue}']},
+                {'if': 'pages', 'then': [', pp. {pages}']},
+                '.',
+            ]},
+        ],
+    },
+    {
+        'name': 'ieee',
+        'description': 'IEEE',
+        'version': 2,
+        'authors': 'ieee',
+        'sort': None,
+        'defaults': {'year': CURRENT_YEAR, 'title': 'Untitled'},
+        'template': [
+            '{authors}, "{title}," ',
+            {'if': 'journal', 'then': [
+                '*{journal}*',
+                {'if': 'volume', 'then': [', vol. {volume}']},
+                {'if': 'issue', 'then': [', no. {issue}']},
+                {'if': 'pages', 'then': [', pp. {pages}']},
+                {'if': 'month', 'then': [', {month}']},
+                ', {year}.',
+            ]},
+        ],
+    },
+]
+
+# Output targets for --escape; 'none' leaves field values untouched
+ESCAPE_TARGETS = ('none', 'latex', 'html')
+
+# Replacements in application order. A backslash is parked on a control
+# character first so the braces and backslashes introduced by later
+# replacements are not escaped again.
+_LATEX_ESCAPES = (
+    ('\\', '\x00'), ('{', r'\{'), ('}', r'\}'), ('&', r'\&'), ('%', r'\%'), ('$', r'\$'),
+    ('#', r'\#'), ('_', r'\_'), ('~', r'\textasciitilde{}'), ('^', r'\textasciicircum{}'),
+    ('\x00', r'\textbackslash{}'),
+)
+
+# Template italics (Markdown ``*...*``) are compiled to these control
+# characters, which survive escaping and are then swapped for markup
+_ITALIC_START = '\x01'
+_ITALIC_END = '\x02'
+
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def _nfc(text: str) -> str:
+    return unicodedata.normalize('NFC', text)
+
+
+def _normalized(text: str) -> str:
+    # ASCII and already-composed text (the quick check is cheap) skip the cache
+    if text.isascii() or unicodedata.is_normalized('NFC', text):
+        return text
+    return _nfc(text)
+
+
+# Special characters are rare, so each costs one substring test and only
+# the ones present are replaced; a str.translate() pass with
+# multi-character replacements is far slower, especially on non-ASCII text
+def escape_latex(value) -> str:
+    """NFC-normalize a value and escape LaTeX/BibTeX special characters."""
+    text = _normalized(value if value.__class__ is str else str(value))
+    if ('\\' in text or '{' in text or '}' in text or '&' in text or '%' in text
+            or '$' in text or '#' in text or '_' in text or '~' in text or '^' in text):
+        for char, replacement in _LATEX_ESCAPES:
+            if char in text:
+                text = text.replace(char, replacement)
+    return text
+
+
+def escape_html(value) -> str:
+    """NFC-normalize a value and escape it for HTML element content."""
+    text = _normalized(value if value.__class__ is str else str(value))
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _finisher(escape: Callable[[object], str], opening: str, closing: str) -> Callable[[str], str]:
+    def finish(citation: str) -> str:
+        citation = escape(citation)
+        if _ITALIC_START in citation:
+            citation = citation.replace(_ITALIC_START, opening).replace(_ITALIC_END, closing)
+        return citation
+    return finish
+
+
+ESCAPERS: Dict[str, Callable[[object], str]] = {'latex': escape_latex, 'html': escape_html}
+
+# Replacements each escaper applies (in order), and the markup of italics
+ESCAPE_TABLES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    'latex': _LATEX_ESCAPES,
+    'html': (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')),
+}
+ITALIC_MARKUP: Dict[str, Tuple[str, str]] = {
+    'latex': (r'\textit{', '}'),
+    'html': ('<i>', '</i>'),
+}
+
+# Applied by escaping formatters to each finished citation
+_FINISHERS: Dict[str, Callable[[str], str]] = {
+    target: _finisher(ESCAPERS[target], *ITALIC_MARKUP[target]) for target in ESCAPERS
+}
+
+_formatter = string.Formatter()
+
+SORT_FIELDS = ('author', 'year', 'title')
+
+_LEADING_ARTICLE = re.compile(r'^(?:the|an?)\s+')
+
+
+def collation_key(text) -> str:
+    """Accent- and case-insensitive form of a string for alphabetizing."""
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold().strip()
+
+
+def _title_key(metadata: Dict) -> str:
+    return _LEADING_ARTICLE.sub('', collation_key(metadata.get('title', 'Untitled')))
+
+
+def sort_key(metadata: Dict, fields: List[str]) -> Tuple:
+    """
+    Reference-list sort key for a record.
+
+    'author' orders by each author's family then given name; works without
+    authors are alphabetized by title in their place. 'year' orders numeric
+    years before other values (such as "n.d."). 'title' ignores a leading
+    article.
+    """
+    key = []
+    for field in fields:
+        if field == 'author':
+            authors = metadata.get('authors') or []
+            if authors:
+                names = [parse_author_name(a) for a in authors]
+                key.append(tuple((collation_key(n.full_family), collation_key(n.given))
+                                 for n in names))
+            else:
+                key.append(((_title_key(metadata), ''),))
+        elif field == 'year':
+            year = metadata.get('year', _MISSING)
+            if year is _MISSING:
+                year = datetime.now().year
+            try:
+                key.append((0, int(year), ''))
+            except (TypeError, ValueError):
+                key.append((1, 0, str(year)))
+        elif field == 'title':
+            key.append(_title_key(metadata))
+        else:
+            raise ValueError(f"Unknown sort field '{field}'")
+    return tuple(key)
+
+
+def _period(value) -> str:
+    """Closing period for a field value, unless the value already ends with one."""
+    return '' if str(value).endswith('.') else '.'
+
+
+class _StyleCompiler:
+    """
+    Translate style definitions into the source of one formatter function.
+
+    Several styles can be compiled together; fields and formatted author
+    lists are then read and built once per record and shared by every
+    style that uses them.
+    """
+
+    def __init__(self, escape: Optional[str] = None):
+        self.escape = None if escape == 'none' else escape
+        self.fields: Dict[Tuple[str, str], str] = {}
+        self.reads: List[Tuple[str, str, object]] = []
+        self.author_vars: Dict[str, str] = {}
+        self.header: List[str] = []
+        self.body: List[str] = []
+        self.namespace = {'_MISSING': _MISSING, '_now': datetime.now}
+        if self.escape:
+            self.namespace['_finish'] = _FINISHERS[self.escape]
+        self.results: List[str] = []
+
+    def add(self, definition: Dict):
+        """Compile one style definition; its citation is stored in ``s<n>``."""
+        name = definition.get('name')
+        if not isinstance(name, str) or not name:
+            raise ValueError("Style definition needs a non-empty 'name'")
+        authors = definition.get('authors', 'apa')
+        if authors not in AUTHOR_FORMATTERS:
+            raise ValueError(f"Style '{name}': unknown author formatter '{authors}'")
+        template = definition.get('template')
+        if not isinstance(template, list):
+            raise ValueError(f"Style '{name}': 'template' must be a list")
+        sort = definition.get('sort')
+        if sort is not None and (not isinstance(sort, list)
+                                 or any(f not in SORT_FIELDS for f in sort)):
+            raise ValueError(f"Style '{name}': 'sort' must be a list of {', '.join(SORT_FIELDS)}")
+        self.name = name
+        self.authors = authors
+        self.defaults = definition.get('defaults', {})
+        self.result = f's{len(self.results)}'
+
+        lines = []
+        self.block(template, '    ', lines)
+        prefix = f'    {self.result} += '
+        if lines and lines[0].startswith(prefix):
+            lines[0] = f'    {self.result} = ' + lines[0][len(prefix):]
+        else:
+            lines.insert(0, f"    {self.result} = ''")
+        self.body.extend(lines)
+        self.results.append(self.result)
+
+    def authors_var(self) -> str:
+        """Local variable holding the author list formatted for this style."""
+        if self.authors not in self.author_vars:
+            raw = self.read('authors', [])
+            var = f'a{len(self.author_vars)}'
+            func, unknown_when = AUTHOR_FORMATTERS[self.authors]
+            self.namespace[f'_authors_{var}'] = func
+            if unknown_when == 'empty-list':
+                self.header.append(f'    {var} = _authors_{var}({raw}) if {raw} else {UNKNOWN_AUTHOR!r}')
+            else:
+                self.header.append(f'    {var} = _authors_{var}({raw}) or {UNKNOWN_AUTHOR!r}')
+            self.author_vars[self.authors] = var
+        return self.author_vars[self.authors]
+
+    def read(self, field: str, default) -> str:
+        """Local variable holding a raw field value; each is read once per record."""
+        key = (field, repr(default))
+        if key not in self.fields:
+            var = f'v{len(self.fields)}'
+            self.reads.append((var, field, default))
+            self.fields[key] = var
+        return self.fields[key]
+
+    def var(self, field: str) -> str:
+        """Local variable holding a field as used in the template."""
+        if field == 'authors':
+            return self.authors_var()
+        return self.read(field, self.defaults.get(field, ''))
+
+    def read_lines(self, paper: bool) -> List[str]:
+        """
+        Statements loading every field, for Paper or for dict records.
+
+        Paper slots are plain attribute loads (unset slots hold _MISSING);
+        dict records and Paper extras go through ``get``.
+        """
+        indent = '        '
+        lines = [] if paper else [f'{indent}g = m.get']
+        for var, field, default in self.reads:
+            value = '_now().year' if default == CURRENT_YEAR else repr(default)
+            if paper and field in _PAPER_FIELDS:
+                lines.append(f'{indent}{var} = m.{field}')
+            elif default == CURRENT_YEAR:
+                lines.append(f"{indent}{var} = {'m.get' if paper else 'g'}({field!r}, _MISSING)")
+            else:
+                lines.append(f"{indent}{var} = {'m.get' if paper else 'g'}({field!r}, {value})")
+                continue
+            lines.append(f'{indent}if {var} is _MISSING:')
+            lines.append(f'{indent}    {var} = {value}')
+        return lines or [f'{indent}pass']
+
+    def literal(self, text: str, italic: bool) -> Tuple[str, bool]:
+        """
+        Template literal for the escape target, and the italics state after it.
+
+        With an escape target, ``*`` toggles italics and becomes a marker
+        that the finisher turns into the target's markup.
+        """
+        if not self.escape or '*' not in text:
+            return text, italic
+        parts = text.split('*')
+        out = [parts[0]]
+        for part in parts[1:]:
+            italic = not italic
+            out.append(_ITALIC_START if italic else _ITALIC_END)
+            out.append(part)
+        return ''.join(out), italic
+
+    def pieces(self, template: str) -> List[Tuple[str, str]]:
+        """
+        Parse a ``{field}`` template string into ('literal', text),
+        ('field', name) and ('period', name) pieces.
+
+        A period right after a placeholder becomes a 'period' piece, which
+        renders as ``_period(value)``: "{authors}." must not double the
+        period of "Jr." or an initial. The columnar formatter renders the
+        same pieces, so both interpret templates identically.
+        """
+        try:
+            parsed = list(_formatter.parse(template))
+        except ValueError as e:
+            raise ValueError(f"Style '{self.name}': bad template {template!r}: {e}") from None
+        italic = False
+        pieces = []
+        previous = None
+        for literal, field, spec, conversion in parsed:
+            if previous and literal.startswith('.'):
+                pieces.append(('period', previous))
+                literal = literal[1:]
+            literal, italic = self.literal(literal, italic)
+            if literal:
+                pieces.append(('literal', literal))
+            previous = None
+            if field is None:
+                continue
+            if spec or conversion or not field:
+                raise ValueError(f"Style '{self.name}': unsupported placeholder in {template!r}")
+            previous = field
+            pieces.append(('field', field))
+        return pieces
+
+    def text(self, template: str) -> str:
+        """Compile a ``{field}`` template string into an f-string literal."""
+        pieces = self.pieces(template)
+        if all(kind == 'literal' for kind, _ in pieces):
+            return repr(''.join(text for _, text in pieces))
+        out = []
+        for kind, value in pieces:
+            if kind == 'literal':
+                out.append(value.replace('{', '{{').replace('}', '}}'))
+            elif kind == 'field':
+                out.append('{' + self.var(value) + '}')
+            else:
+                self.namespace['_period'] = _period
+                out.append('{_period(' + self.var(value) + ')}')
+        return 'f' + repr(''.join(out))
+
+    def block(self, entries: List, indent: str, lines: List[str]):
+        # Adjacent strings are merged so each run becomes a single f-string
+        merged = []
+        for entry in entries:
+            if isinstance(entry, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += entry
+            else:
+                merged.append(entry)
+        for entry in merged:
+            if isinstance(entry, str):
+                if entry:
+                    lines.append(f'{indent}{self.result} += {self.text(entry)}')
+            elif isinstance(entry, dict) and 'if' in entry:
+                lines.append(f"{indent}if {self.var(entry['if'])}:")
+                start = len(lines)
+                self.block(entry.get('then', []), indent + '    ', lines)
+                if len(lines) == start:
+                    lines.append(f'{indent}    pass')
+                if entry.get('else'):
+                    lines.append(f'{indent}else:')
+                    self.block(entry['else'], indent + '    ', lines)
+            else:
+                raise ValueError(f"Style '{self.name}': invalid template entry {entry!r}")
+
+    def build(self, name: str, as_tuple: bool) -> Callable:
+        results = [f'_finish({r})' if self.escape else r for r in self.results]
+        result = ', '.join(results) + (',' if len(results) == 1 else '')
+        if not as_tuple:
+            result = results[0]
+        prologue = (['def _format(m):', '    if m.__class__ is _Paper:']
+                    + self.read_lines(paper=True) + ['    else:']
+                    + self.read_lines(paper=False))
+        self.namespace['_Paper'] = Paper
+        source = '\n'.join(prologue + self.header + self.body
+                           + [f'    return {result}', ''])
+        exec(compile(source, f'<style {name}>', 'exec'), self.namespace)
+        func = self.namespace['_format']
+        func.__name__ = func.__qualname__ = f'format_{name}'
+        return func
+
+
+def compile_style(definition: Dict, escape: Optional[str] = None) -> Callable[[Dict], str]:
+    """
+    Compile a style definition into a formatter callable.
+
+    The definition is translated once into a specialised Python function
+    that reads each field a single time and builds the citation with
+    f-strings, so no template interpretation happens per record. With an
+    ``escape`` target ('latex' or 'html'), the finished citation is escaped
+    in one pass and template italics become the target's markup.
+
+    Raises:
+        ValueError: If the definition is malformed
+    """
+    compiler = _StyleCompiler(escape)
+    compiler.add(definition)
+    func = compiler.build(compiler.name, as_tuple=False)
+    func.__doc__ = definition.get('description')
+    return func
+
+
+def compile_styles(definitions: List[Dict],
+                   escape: Optional[str] = None) -> Callable[[Dict], Tuple[str, ...]]:
+    """
+    Compile several style definitions into one formatter returning a tuple.
+
+    Fields and author lists shared between the styles are read and
+    formatted once per record.
+
+    Raises:
+        ValueError: If a definition is malformed
+    """
+    compiler = _StyleCompiler(escape)
+    for definition in definitions:
+        compiler.add(definition)
+    return compiler.build('_'.join(d['name'] for d in definitions), as_tuple=True)
+
+
+# Dispatch table: style name -> compiled formatter
+STYLES: Dict[str, Callable[[Dict], str]] = {}
+STYLE_DEFINITIONS: Dict[str, Dict] = {}
+
+
+def register_style(definition: Dict) -> Callable[[Dict], str]:
+    """Compile a style definition and add it to the dispatch table."""
+    func = compile_style(definition)
+    STYLES[definition['name']] = func
+    STYLE_DEFINITIONS[definition['name']] = definition
+    return func
+
+
+def load_style_file(path: str) -> List[str]:
+    """Register the style definition(s) in a JSON file; return their names."""
+    with open(path, 'r', encoding='utf-8') as f:
+        definitions = json.load(f)
+    if isinstance(definitions, dict):
+        definitions = [definitions]
+    for definition in definitions:
+        if not isinstance(definition, dict):
+            raise ValueError("Style file must contain an object or a list of objects")
+        register_style(definition)
+    return [d['name'] for d in definitions]
+
+
+_MULTI_FORMATTERS: Dict[Tuple[Tuple[str, ...], Optional[str]], Callable] = {}
+_ESCAPED_FORMATTERS: Dict[Tuple[str, str], Callable[[Dict], str]] = {}
+
+
+def get_multi_formatter(styles: Tuple[str, ...],
+                        escape: Optional[str] = None) -> Callable[[Dict], Tuple[str, ...]]:
+    """Return a (cached) formatter producing one citation per named style."""
+    key = (styles, None if escape == 'none' else escape)
+    if key not in _MULTI_FORMATTERS:
+        _MULTI_FORMATTERS[key] = compile_styles([STYLE_DEFINITIONS[s] for s in styles], key[1])
+    return _MULTI_FORMATTERS[key]
+
+
+for _definition in BUILTIN_STYLES:
+    register_style(_definition)
 
 
 def generate_apa_citation(metadata: Dict) -> str:
     """Generate APA 7th edition citation."""
-    authors = metadata.get('authors', [])
-    year = metadata.get('year', datetime.now().year)
-    title = metadata.get('title', 'Untitled')
-    journal = metadata.get('journal', '')
-    volume = metadata.get('volume', '')
-    issue = metadata.get('issue', '')
-    pages = metadata.get('pages', '')
-    doi = metadata.get('doi', '')
-    url = metadata.get('url', '')
-
-    # Format authors
-    author_str = format_authors_apa(authors)
-    if not author_str:
-        author_str = "Unknown Author"
-
-    # Build citation
-    citation = f"{author_str} ({year}). {title}. "
-
-    if journal:
-        citation += f"*{journal}*"
-        if volume:
-            citation += f", *{volume}*"
-        if issue:
-            citation += f"({issue})"
-        if pages:
-            citation += f", {pages}"
-        citation += "."
-
-    # Add DOI or URL
-    if doi:
-        citation += f" https://doi.org/{doi}"
-    elif url:
-        citation += f" {url}"
-
-    return citation
+    return STYLES['apa'](metadata)
 
 
 def generate_mla_citation(metadata: Dict) -> str:
     """Generate MLA 9th edition citation."""
-    authors = metadata.get('authors', [])
-    title = metadata.get('title', 'Untitled')
-    journal = metadata.get('journal', '')
-    volume = metadata.get('volume', '')
-    issue = metadata.get('issue', '')
-    year = metadata.get('year', datetime.now().year)
-    pages = metadata.get('pages', '')
-    doi = metadata.get('doi', '')
-
-    # Format authors
-    author_str = format_authors_mla(authors)
-    if not author_str:
-        author_str = "Unknown Author"
-
-    # Build citation
-    citation = f'{author_str}. "{title}." '
-
-    if journal:
-        citation += f"*{journal}*"
-        if volume:
-            citation += f", vol. {volume}"
-        if issue:
-            citation += f", no. {issue}"
-        citation += f", {year}"
-        if pages:
-            citation += f", pp. {pages}"
-        citation += "."
-
-    # Add DOI
-    if doi:
-        citation += f" https://doi.org/{doi}."
-
-    return citation
+    return STYLES['mla'](metadata)
 
 
 def generate_chicago_citation(metadata: Dict) -> str:
     """Generate Chicago 17th edition citation (notes-bibliography)."""
-    authors = metadata.get('authors', [])
-    title = metadata.get('title', 'Untitled')
-    journal = metadata.get('journal', '')
-    volume = metadata.get('volume', '')
-    issue = metadata.get('issue', '')
-    year = metadata.get('year', datetime.now().year)
-    pages = metadata.get('pages', '')
-    doi = metadata.get('doi', '')
-
-    # Format authors (first author: Last, First; others: First Last)
-    if not authors:
-        author_str = "Unknown Author"
-    elif len(authors) == 1:
-        author_str = authors[0]
-    elif len(authors) == 2:
-        # Assuming format "Last, First" already
-        author_str = f"{authors[0]} and {authors[1]}"
-    else:
-        author_str = f"{authors[0]} et al."
+    return STYLES['chicago'](metadata)
 
-    # Build citation
-    citation = f'{author_str}. "{title}." '
 
-    if journal:
-        citation += f"*{journal}*"
-        if volume:
-            citation += f" {volume}"
-        if issue:
-            citation += f", no. {issue}"
-        citation += f" ({year})"
-        if pages:
-            citation += f": {pages}"
-        citation += "."
+def generate_harvard_citation(metadata: Dict) -> str:
+    """Generate Harvard citation."""
+    return STYLES['harvard'](metadata)
 
-    # Add DOI
-    if doi:
-        citation += f" https://doi.org/{doi}."
 
-    return citation
+def generate_ieee_citation(metadata: Dict) -> str:
+    """Generate IEEE citation."""
+    return STYLES['ieee'](metadata)
 
 
-def generate_harvard_citation(metadata: Dict) -> str:
-    """Generate Harvard citation."""
-    authors = metadata.get('authors', [])
-    year = metadata.get('year', datetime.now().year)
-    title = metadata.get('title', 'Untitled')
-    journal = metadata.get('journal', '')
-    volume = metadata.get('volume', '')
-    issue = metadata.get('issue', '')
-    pages = metadata.get('pages', '')
-
-    # Format authors
-    if not authors:
-        author_str = "Unknown Author"
-    elif len(authors) == 1:
-        author_str = authors[0]
-    elif len(authors) == 2:
-        author_str = f"{authors[0]} and {authors[1]}"
-    else:
-        author_str = f"{authors[0]} et al."
+_MONTH_NUMBERS = {
+    name: number
+    for number, names in enumerate([
+        ('jan', 'january'), ('feb', 'february'), ('mar', 'march'), ('apr', 'april'),
+        ('may',), ('jun', 'june'), ('jul', 'july'), ('aug', 'august'),
+        ('sep', 'sept', 'september'), ('oct', 'october'), ('nov', 'november'),
+        ('dec', 'december'),
+    ], 1)
+    for name in names
+}
+_BIBTEX_MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
 
-    # Build citation
-    citation = f"{author_str} ({year}) '{title}', "
+_KEY_WORD = re.compile(r'[a-z0-9]+')
+_PAGE_RANGE = re.compile(r'(?<=\d)\s*[-\u2013]\s*(?=\d)')
 
-    if journal:
-        citation += f"*{journal}*"
-        if volume:
-            citation += f", vol. {volume}"
-        if issue:
-            citation += f", no. {issue}"
-        if pages:
-            citation += f", pp. {pages}"
-        citation += "."
 
-    return citation
+def month_number(month) -> Optional[int]:
+    """1-12 for a month number or English month name/abbreviation, else None."""
+    text = str(month).strip().rstrip('.').lower()
+    if text.isdigit():
+        number = int(text)
+        return number if 1 <= number <= 12 else None
+    return _MONTH_NUMBERS.get(text)
 
 
-def generate_ieee_citation(metadata: Dict) -> str:
-    """Generate IEEE citation."""
-    authors = metadata.get('authors', [])
-    title = metadata.get('title', 'Untitled')
-    journal = metadata.get('journal', '')
-    volume = metadata.get('volume', '')
-    issue = metadata.get('issue', '')
-    pages = metadata.get('pages', '')
-    year = metadata.get('year', datetime.now().year)
-    month = metadata.get('month', '')
-
-    # Format authors (Initial. Last)
-    if not authors:
-        author_str = "Unknown Author"
-    else:
-        # Simplified - assumes format already suitable
-        author_str = ", ".join(authors[:3])
-        if len(authors) > 3:
-            author_str += ", et al."
+class CitationKeys:
+    """
+    Assigns citation keys, unique within one output.
+
+    A record's own ``citation_key``, ``id`` or ``key`` is used when
+    present; otherwise the key is built from the first author's family
+    name, the year and the first title word ("smith2024machine"). Clashes
+    get letter suffixes ("smith2024machinea", "smith2024machineb", ...).
+    """
+
+    def __init__(self):
+        self.used = set()
+        self.suffixes: Dict[str, int] = {}
+
+    @staticmethod
+    def base_key(record: Dict) -> str:
+        for field in ('citation_key', 'id', 'key'):
+            if record.get(field):
+                return str(record.get(field))
+        authors = record.get('authors') or []
+        family = collation_key(parse_author_name(authors[0]).family) if authors else ''
+        words = _KEY_WORD.findall(_title_key(record)) if record.get('title') else []
+        base = ''.join(_KEY_WORD.findall(family)) + str(record.get('year', '')) + (words[0] if words else '')
+        return base or 'ref'
+
+    def assign(self, record: Dict) -> str:
+        base = key = self.base_key(record)
+        while key in self.used:
+            n = self.suffixes.get(base, 0) + 1
+            self.suffixes[base] = n
+            suffix = ''
+            while n:
+                n, r = divmod(n - 1, 26)
+                suffix = chr(ord('a') + r) + suffix
+            key = base + suffix
+        self.used.add(key)
+        return key
+
+
+def _csl_name(raw: str) -> Dict:
+    name = parse_author_name(raw)
+    if str(raw).strip().startswith('{'):
+        return {'literal': name.family}
+    csl = {'family': name.family}
+    if name.given:
+        csl['given'] = name.given
+    if name.particle:
+        csl['non-dropping-particle'] = name.particle
+    if name.suffix:
+        csl['suffix'] = name.suffix
+    return csl
+
+
+def paper_to_csl(record: Dict, key: str) -> Dict:
+    """CSL-JSON item for a record."""
+    item = {'id': key, 'type': 'article-journal' if record.get('journal') else 'article'}
+    authors = record.get('authors') or []
+    if authors:
+        item['author'] = [_csl_name(a) for a in authors]
+    for field, csl_field in (('title', 'title'), ('journal', 'container-title'),
+                             ('volume', 'volume'), ('issue', 'issue'), ('pages', 'page'),
+                             ('doi', 'DOI'), ('url', 'URL')):
+        value = record.get(field)
+        if value not in (None, ''):
+            item[csl_field] = str(value)
+    year = record.get('year')
+    if year not in (None, ''):
+        try:
+            parts = [int(year)]
+        except (TypeError, ValueError):
+            item['issued'] = {'literal': str(year)}
+        else:
+            month = month_number(record.get('month', ''))
+            if month:
+                parts.append(month)
+            item['issued'] = {'date-parts': [parts]}
+    return item
+
+
+def _bibtex_name(raw: str) -> str:
+    name = parse_author_name(raw)
+    if str(raw).strip().startswith('{'):
+        return '{' + escape_latex(name.family) + '}'
+    family = escape_latex(name.full_family)
+    if name.suffix:
+        return f"{family}, {escape_latex(name.suffix)}, {escape_latex(name.given)}"
+    return f"{family}, {escape_latex(name.given)}" if name.given else family
+
+
+def paper_to_bibtex(record: Dict, key: str) -> str:
+    """BibTeX entry for a record (@article with a journal, else @misc)."""
+    fields = []
+    authors = record.get('authors') or []
+    if authors:
+        fields.append(('author', ' and '.join(_bibtex_name(a) for a in authors)))
+    for field, bib_field in (('title', 'title'), ('journal', 'journal'), ('volume', 'volume'),
+                             ('issue', 'number')):
+        value = record.get(field)
+        if value not in (None, ''):
+            fields.append((bib_field, escape_latex(value)))
+    pages = record.get('pages')
+    if pages not in (None, ''):
+        fields.append(('pages', _PAGE_RANGE.sub('--', escape_latex(pages))))
+    year = record.get('year')
+    if year not in (None, ''):
+        fields.append(('year', escape_latex(year)))
+    month = record.get('month')
+    lines = [f"@{'article' if record.get('journal') else 'misc'}{{{key},"]
+    lines.extend(f"  {name} = {{{value}}}," for name, value in fields)
+    if month not in (None, ''):
+        number = month_number(month)
+        lines.append(f"  month = {_BIBTEX_MONTHS[number - 1]}," if number
+                     else f"  month = {{{escape_latex(month)}}},")
+    for field, bib_field in (('doi', 'doi'), ('url', 'url')):
+        value = record.get(field)
+        if value not in (None, ''):
+            # doi/url are verbatim fields in biblatex; only braces need care
+            lines.append(f"  {bib_field} = {{{str(value).replace('{', '').replace('}', '')}}},")
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def record_serializer(output_format: str) -> Callable[[Dict], str]:
+    """Serializer producing one CSL-JSON object or BibTeX entry per record."""
+    keys = CitationKeys()
+    if output_format == 'csl-json':
+        return lambda record: json.dumps(paper_to_csl(record, keys.assign(record)),
+                                         ensure_ascii=False)
+    if output_format == 'bibtex':
+        return lambda record: paper_to_bibtex(record, keys.assign(record))
+    raise ValueError(f"'{output_format}' is not a record format")
+
+
+def iter_jsonl(f: TextIO) -> Iterator[Paper]:
+    """Yield one record per non-blank line of a JSON Lines stream."""
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"line {lineno}: {e.msg}", e.doc, e.pos) from None
+        yield as_record(record)
+
+
+def iter_json(f: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Paper]:
+    """
+    Incrementally decode a JSON document.
+
+    A top-level array is yielded element by element; any other top-level
+    value (a single object, or whitespace-separated objects) is yielded as
+    it is decoded. Only the record currently being decoded is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    eof = not buf
+    pos = 0
+
+    def fill():
+        nonlocal buf, pos, eof
+        more = f.read(chunk_size)
+        if not more:
+            eof = True
+        buf = buf[pos:] + more
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A value ending exactly at the buffer edge may be truncated
+            # (e.g. a number), so only accept it once more input is seen.
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            pos = end
+            return value
+
+    skip_ws()
+    if pos >= len(buf):
+        return
+
+    if buf[pos] != '[':
+        while pos < len(buf):
+            yield as_record(decode())
+            skip_ws()
+        return
+
+    pos += 1
+    skip_ws()
+    if pos < len(buf) and buf[pos] == ']':
+        return
+    while True:
+        skip_ws()
+        yield as_record(decode())
+        skip_ws()
+        if pos >= len(buf):
+            raise json.JSONDecodeError("Unterminated array", buf, pos)
+        if buf[pos] == ']':
+            return
+        if buf[pos] != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+        pos += 1
+
+
+def detect_input_format(path: str) -> str:
+    """Guess 'jsonl', 'parquet', 'arrow' or 'json' from the file extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in JSONL_EXTENSIONS:
+        return 'jsonl'
+    if extension in PARQUET_EXTENSIONS:
+        return 'parquet'
+    if extension in ARROW_EXTENSIONS:
+        return 'arrow'
+    return 'json'
+
+
+def iter_papers(f: TextIO, input_format: str = 'json') -> Iterator[Paper]:
+    """Yield paper metadata records (as Paper objects) from an open input stream."""
+    if input_format == 'jsonl':
+        return iter_jsonl(f)
+    return iter_json(f)
+
+
+def read_papers(path: str, input_format: str) -> Iterator[Paper]:
+    """Yield the records of a library file in any input format."""
+    if input_format in ARROW_FORMATS:
+        from citation_arrow import iter_arrow_papers
+        yield from iter_arrow_papers(path, input_format)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_papers(f, input_format)
+
 
-    # Build citation
-    citation = f'{author_str}, "{title}," '
+def iter_jsonl_spans(f: BinaryIO) -> Iterator[Tuple[int, int, Paper]]:
+    """Yield (byte offset, byte length, record) for each record of a binary JSON Lines stream."""
+    offset = 0
+    for lineno, line in enumerate(f, 1):
+        length = len(line)
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise json.JSONDecodeError(f"line {lineno}: {e.msg}", e.doc, e.pos) from None
+            yield offset, length, as_record(record)
+        offset += length
 
-    if journal:
-        citation += f"*{journal}*"
-        if volume:
-            citation += f", vol. {volume}"
-        if issue:
-            citation += f", no. {issue}"
-        if pages:
-            citation += f", pp. {pages}"
-        if month:
-            citation += f", {month}"
-        citation += f", {year}."
 
-    return citation
+def _with_key(record, key: str):
+    """Record carrying its citation key, so record formats reuse the cited key."""
+    if isinstance(record, (Paper, dict)) and key != CitationKeys.base_key(record):
+        record['citation_key'] = key
+    return record
+
+
+def iter_cited(path: str, input_format: str, keys: List[str], missing: List[str],
+               index_path: Optional[str] = None) -> Iterator[Paper]:
+    """
+    Yield the library records cited under ``keys``, in the order of ``keys``.
+
+    Keys are those assigned by ``CitationKeys`` over the whole library, so
+    they match the library's BibTeX/CSL-JSON export. A JSON Lines library is
+    read through a persistent key index (built on first use and whenever
+    the file changes) and only the cited lines are parsed; other libraries are
+    scanned once. Keys absent from the library are appended to ``missing``.
+    ``\\nocite{*}`` (key ``*``) selects the whole library in library order.
+    """
+    from citation_keys import ALL_KEYS, KeyIndex, default_index_path
+
+    if ALL_KEYS in keys:
+        assign = CitationKeys().assign
+        for record in read_papers(path, input_format):
+            yield _with_key(record, assign(record))
+        return
+
+    if input_format != 'jsonl':
+        wanted = set(keys)
+        found = {}
+        assign = CitationKeys().assign
+        for record in read_papers(path, input_format):
+            key = assign(record)
+            if key in wanted and key not in found:
+                found[key] = _with_key(record, key)
+        for key in keys:
+            if key in found:
+                yield found[key]
+            else:
+                missing.append(key)
+        return
+
+    with KeyIndex(index_path or default_index_path(path)) as index:
+        if not index.is_current(path):
+            assign = CitationKeys().assign
+            with open(path, 'rb') as f:
+                index.rebuild(path, ((assign(record), offset, length)
+                                     for offset, length, record in iter_jsonl_spans(f)))
+        spans = index.lookup(keys)
+    with open(path, 'rb') as f:
+        for key in keys:
+            if key not in spans:
+                missing.append(key)
+                continue
+            offset, length = spans[key]
+            f.seek(offset)
+            yield _with_key(as_record(json.loads(f.read(length))), key)
+
+
+def format_citation(paper: Dict, style: str) -> str:
+    """Format a single record in the requested citation style."""
+    return STYLES.get(style, STYLES['apa'])(paper)
+
+
+def get_formatter(style, escape: Optional[str] = None):
+    """
+    Resolve a style name, or a tuple of names, to a compiled formatter.
+
+    A tuple yields a formatter returning one citation per style. An
+    ``escape`` target ('latex' or 'html') selects a variant compiled for
+    that output.
+    """
+    if isinstance(style, tuple):
+        return get_multi_formatter(style, escape)
+    if escape is None or escape == 'none':
+        return STYLES[style]
+    if (style, escape) not in _ESCAPED_FORMATTERS:
+        _ESCAPED_FORMATTERS[(style, escape)] = compile_style(STYLE_DEFINITIONS[style], escape)
+    return _ESCAPED_FORMATTERS[(style, escape)]
+
+
+def _format_chunk(papers: List[Dict], style, escape: Optional[str] = None) -> List:
+    """Worker entry point: format one chunk of records."""
+    formatter = get_formatter(style, escape)
+    return [formatter(paper) for paper in papers]
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Split an iterable into lists of at most ``size`` items."""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _custom_style_definitions() -> List[Dict]:
+    """Definitions registered on top of the built-in styles."""
+    builtin = {d['name'] for d in BUILTIN_STYLES}
+    return [d for name, d in STYLE_DEFINITIONS.items() if name not in builtin]
+
+
+def _init_worker(definitions: List[Dict]):
+    """Register user-supplied styles in a freshly started worker process."""
+    for definition in definitions:
+        if definition['name'] not in STYLES:
+            register_style(definition)
+
+
+def format_parallel(papers: Iterable[Dict], style, workers: int,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE,
+                    escape: Optional[str] = None) -> Iterator[str]:
+    """
+    Format records across a pool of worker processes.
+
+    Records are sent to workers in chunks and results are yielded in input
+    order. At most ``2 * workers`` chunks are in flight at once, so input is
+    still consumed lazily and memory stays bounded.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(_custom_style_definitions(),)) as pool:
+        pending = deque()
+        for chunk in chunked(papers, chunk_size):
+            pending.append(pool.submit(_format_chunk, chunk, style, escape))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def shard_ranges(path: str, shard_size: int = DEFAULT_SHARD_SIZE) -> List[Tuple[int, int]]:
+    """
+    Split a file into newline-aligned byte ranges of about ``shard_size``.
+
+    Each range ends just after a newline (or at end of file), so every line
+    falls entirely within one range.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ranges = []
+            start = 0
+            while start < size:
+                end = mm.find(b'\n', min(start + shard_size, size) - 1)
+                end = size if end < 0 else end + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def _format_shard(path: str, start: int, end: int, style,
+                  sort_specs: Optional[List[Optional[List[str]]]] = None,
+                  escape: Optional[str] = None) -> Tuple[List, List]:
+    """
+    Worker entry point: parse and format the JSON Lines records in a byte range.
+
+    Returns the citations and, when ``sort_specs`` is given, each record's
+    tuple of per-style sort keys.
+    """
+    formatter = get_formatter(style, escape)
+    citations = []
+    keys = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        offset = start
+        for line in mm[start:end].split(b'\n'):
+            if line.strip():
+                try:
+                    record = as_record(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise json.JSONDecodeError(f"line at byte {offset}: {e.msg}", e.doc, e.pos) from None
+                citations.append(formatter(record))
+                if sort_specs is not None:
+                    keys.append(tuple(sort_key(record, spec) if spec else None
+                                      for spec in sort_specs))
+            offset += len(line) + 1
+    return citations, keys
+
+
+def format_sharded(path: str, style, workers: int, shard_size: int = DEFAULT_SHARD_SIZE,
+                   sort_specs: Optional[List[Optional[List[str]]]] = None,
+                   keys: Optional[deque] = None, escape: Optional[str] = None) -> Iterator:
+    """
+    Format a JSON Lines file with workers that each read their own byte range.
+
+    The parent only computes newline-aligned ranges (via mmap) and never
+    parses records; workers map the file, parse and format their range.
+    Results are yielded in file order, with at most ``2 * workers`` ranges
+    in flight. With ``sort_specs``, each record's sort keys are appended to
+    ``keys`` before its citation is yielded.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(_custom_style_definitions(),)) as pool:
+        pending = deque()
+
+        def results(future):
+            citations, shard_keys = future.result()
+            if keys is not None:
+                keys.extend(shard_keys)
+            return citations
+
+        for start, end in shard_ranges(path, shard_size):
+            pending.append(pool.submit(_format_shard, path, start, end, style, sort_specs, escape))
+            if len(pending) >= 2 * workers:
+                yield from results(pending.popleft())
+        while pending:
+            yield from results(pending.popleft())
+
+
+def _format_lines(data: bytes, first_line: int, style, escape: Optional[str] = None) -> List:
+    """Worker entry point: parse and format a chunk of JSON Lines starting at ``first_line``."""
+    formatter = get_formatter(style, escape)
+    citations = []
+    for lineno, line in enumerate(data.split(b'\n'), first_line):
+        if line.strip():
+            try:
+                record = as_record(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise json.JSONDecodeError(f"line {lineno}: {e.msg}", e.doc, e.pos) from None
+            citations.append(formatter(record))
+    return citations
+
+
+def format_cached(path: str, input_format: str, style, cache, workers: int = 1,
+                  escape: Optional[str] = None) -> Iterator:
+    """
+    Format an input file, serving unchanged parts of it from a CitationCache.
+
+    JSON Lines input is split into content-defined chunks of lines; a chunk
+    found in the cache is neither parsed nor formatted, and only changed
+    chunks are formatted (in worker processes when ``workers > 1``) and
+    stored. Other input formats are cached as a whole file. Results are
+    yielded in input order; with a tuple of styles, each is a tuple.
+    """
+    from citation_cache import chunk_key, file_key, iter_line_chunks, style_fingerprint
+
+    styles = style if isinstance(style, tuple) else (style,)
+    multi = isinstance(style, tuple)
+    style_fp = style_fingerprint([(s, STYLE_DEFINITIONS[s]) for s in styles],
+                                 None if escape == 'none' else escape)
+
+    def hit(citations):
+        cache.hits += len(citations)
+        return [tuple(c) for c in citations] if multi else citations
+
+    def store(key, citations):
+        cache.misses += len(citations)
+        cache.put(key, citations)
+        return citations
+
+    if input_format != 'jsonl':
+        key = file_key(style_fp, input_format, path)
+        cached = cache.get(key)
+        if cached is not None:
+            yield from hit(cached)
+            return
+        papers = read_papers(path, input_format)
+        if workers > 1:
+            citations = format_parallel(papers, style, workers, escape=escape)
+        else:
+            citations = map(get_formatter(style, escape), papers)
+        # Kept for storing only while the output could fit in the cache
+        collected, size = [], 0
+        for citation in citations:
+            if collected is not None:
+                collected.append(citation)
+                size += sum(map(len, citation)) if multi else len(citation)
+                if size > cache.max_bytes:
+                    cache.misses += len(collected)
+                    collected = None
+            else:
+                cache.misses += 1
+            yield citation
+        if collected is not None:
+            store(key, collected)
+        return
+
+    with open(path, 'rb') as f:
+        chunks = iter_line_chunks(f)
+        if workers <= 1:
+            for first_line, data in chunks:
+                key = chunk_key(style_fp, input_format, data)
+                cached = cache.get(key)
+                if cached is not None:
+                    yield from hit(cached)
+                else:
+                    yield from store(key, _format_lines(data, first_line, style, escape))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(_custom_style_definitions(),)) as pool:
+            pending = deque()
+
+            def results(key, cached, future):
+                return hit(cached) if future is None else store(key, future.result())
+
+            for first_line, data in chunks:
+                key = chunk_key(style_fp, input_format, data)
+                cached = cache.get(key)
+                future = None
+                if cached is None:
+                    future = pool.submit(_format_lines, data, first_line, style, escape)
+                pending.append((key, cached, future))
+                if len(pending) >= 2 * workers:
+                    yield from results(*pending.popleft())
+            while pending:
+                yield from results(*pending.popleft())
+
+
+def write_citations(citations: Iterator[str], out) -> int:
+    """Write citations as they are produced (``out`` is a writer or a text stream)."""
+    writer = out if isinstance(out, CitationWriter) else CitationWriter(out)
+    for citation in citations:
+        writer.write(citation)
+    if writer is not out:
+        writer.close()
+    return writer.count
+
+
+def write_citation_sets(rows: Iterator[Tuple[str, ...]], outs: List[CitationWriter]) -> int:
+    """Write each citation of a row to the matching writer."""
+    count = 0
+    for row in rows:
+        for out, citation in zip(outs, row):
+            out.write(citation)
+        count += 1
+    return count
+
+
+def write_sorted_citations(rows: Iterator[Tuple[str, ...]], keys: deque,
+                           sort_specs: List[Optional[List[str]]], outs: List[CitationWriter],
+                           memory_budget: int):
+    """
+    Write each style's citations in reference-list order.
+
+    ``keys`` is filled with one tuple of per-style sort keys per record as
+    records are read; styles without a sort spec are written in input
+    order. Sorting uses an external merge sort bounded by ``memory_budget``
+    bytes in total.
+    """
+    from citation_sort import ExternalSorter
+
+    sorted_count = sum(1 for spec in sort_specs if spec)
+    sorters = [ExternalSorter(memory_budget // max(sorted_count, 1)) if spec else None
+               for spec in sort_specs]
+    try:
+        for seq, row in enumerate(rows):
+            record_keys = keys.popleft()
+            for i, citation in enumerate(row):
+                if sorters[i] is not None:
+                    sorters[i].add(record_keys[i], seq, citation)
+                else:
+                    outs[i].write(citation)
+        for sorter, out in zip(sorters, outs):
+            if sorter is not None:
+                write_citations(sorter.sorted_texts(), out)
+    finally:
+        for sorter in sorters:
+            if sorter is not None:
+                sorter.cleanup()
+
+
+def output_path_for_style(output: str, style: str) -> str:
+    """
+    Derive a per-style output path.
+
+    A ``{style}`` placeholder in ``output`` is replaced by the style name;
+    otherwise the style is inserted before the extension
+    (``refs.txt`` -> ``refs.apa.txt``).
+    """
+    if '{style}' in output:
+        return output.replace('{style}', style)
+    gz = GZIP_SUFFIX if output.endswith(GZIP_SUFFIX) else ''
+    root, ext = os.path.splitext(output[:len(output) - len(gz)])
+    return f"{root}.{style}{ext}{gz}"
 
 
 def main():
-    parser = argparse.ArgumentParser(description='Generate formatted citations from paper metadata')
-    parser.add_argument('--input', required=True, help='Input JSON file with paper metadata')
-    parser.add_argument('--format', choices=['apa', 'mla', 'chicago', 'harvard', 'ieee'],
-                       default='apa', help='Citation format (default: apa)')
-    parser.add_argument('--output', help='Output file (default: stdout)')
+    if sys.argv[1:2] == ['serve']:
+        from citation_server import main as serve
+        return serve(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='Generate formatted citations from paper metadata',
+                                     epilog="Run '%(prog)s serve --help' for the long-running server mode.")
+    parser.add_argument('--input', required=True,
+                       help='Input JSON, JSON Lines, Parquet or Arrow IPC file with paper metadata')
+    parser.add_argument('--input-format', choices=['auto', 'json', 'jsonl', 'parquet', 'arrow'],
+                       default='auto',
+                       help='Input format (default: auto, from the file extension)')
+    parser.add_argument('--format', default='apa',
+                       help='Citation format: apa, mla, chicago, harvard, ieee, '
+                            'or a style from --style-file. A comma-separated list '
+                            'writes one file per style in a single pass (default: apa)')
+    parser.add_argument('--style-file', action='append', default=[],
+                       help='JSON file with additional style definition(s); may be repeated')
+    parser.add_argument('--cited-in', nargs='+', metavar='SOURCE',
+                       help='Only render entries cited in these .tex/.md files (\\cite{key}, '
+                            '[@key]), in order of first citation')
+    parser.add_argument('--key-index', metavar='PATH',
+                       help='With --cited-in, key index file for a JSON Lines library '
+                            '(default: under ~/.cache/research-skills/key-index)')
+    parser.add_argument('--output', help='Output file (default: stdout). With several formats, '
+                                          'a path containing {style} or a base path that gets '
+                                          '.<style> inserted before the extension')
+    parser.add_argument('--output-format', choices=list(WRITERS), default='text',
+                       help='text (citations separated by blank lines), html (<li> list), '
+                            'or the records themselves as csl-json or bibtex (default: text)')
+    parser.add_argument('--escape', choices=ESCAPE_TARGETS,
+                       help='Escape citations for the output target: latex (special characters, '
+                            '\\textit{} for italics), html, or none (default: html for '
+                            '--output-format html, otherwise none)')
+    parser.add_argument('--gzip', action='store_true',
+                       help='Compress the output with gzip (implied by an output path ending in .gz)')
+    parser.add_argument('--dedup', action='store_true',
+                       help='Drop duplicate records (same DOI, or same title/year/first author)')
+    parser.add_argument('--near-duplicates', action='store_true',
+                       help='With --dedup, also merge near-identical titles (MinHash/LSH)')
+    parser.add_argument('--dedup-report',
+                       help='With --dedup, write one JSON line per merged record to this file')
+    parser.add_argument('--enrich', action='store_true',
+                       help='Fill missing DOI/volume/issue/pages (and authors, year, journal) '
+                            'from a Crossref-compatible API before formatting')
+    parser.add_argument('--enrich-url', default=os.environ.get('CROSSREF_URL', 'https://api.crossref.org'),
+                       help='API root for --enrich (default: $CROSSREF_URL or https://api.crossref.org)')
+    parser.add_argument('--enrich-concurrency', type=int, default=8,
+                       help='Concurrent --enrich requests (default: 8)')
+    parser.add_argument('--enrich-cache', metavar='PATH',
+                       help='Resolver cache for --enrich '
+                            '(default: ~/.cache/research-skills/crossref.sqlite)')
+    parser.add_argument('--enrich-ttl', type=float, default=30,
+                       help='Days before cached --enrich results are looked up again (default: 30)')
+    parser.add_argument('--mailto', default=os.environ.get('CROSSREF_MAILTO'),
+                       help='Contact address sent with --enrich requests (Crossref polite pool)')
+    parser.add_argument('--cache', nargs='?', const='', metavar='PATH',
+                       default=os.environ.get('CITATION_CACHE'),
+                       help='Reuse formatted citations from a persistent cache (default file: '
+                            '~/.cache/research-skills/citations.sqlite; also enabled by setting '
+                            'CITATION_CACHE to a path or to an empty string)')
+    parser.add_argument('--cache-size', type=float, default=256,
+                       help='Maximum cache size in MB before old entries are evicted (default: 256)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Format every record without reading or writing the cache')
+    parser.add_argument('--sort', action='store_true',
+                       help='Sort each style into reference-list order (e.g. author, year, '
+                            'title for APA); IEEE keeps citation order')
+    parser.add_argument('--sort-memory', type=float, default=512,
+                       help='Memory budget in MB for --sort before spilling to temporary '
+                            'files (default: 512)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Number of worker processes used for formatting (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                       help=f'Records per worker task (default: {DEFAULT_CHUNK_SIZE})')
 
     args = parser.parse_args()
 
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be positive')
+
+    for path in args.style_file:
+        try:
+            load_style_file(path)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot load style file '{path}': {e}")
+    styles = tuple(dict.fromkeys(s.strip() for s in args.format.split(',') if s.strip()))
+    for style in styles:
+        if style not in STYLES:
+            parser.error(f"unknown format '{style}' (available: {', '.join(STYLES)})")
+    if not styles:
+        parser.error('--format needs at least one style')
+    if len(styles) > 1 and not args.output:
+        parser.error('--output is required when several formats are requested')
+    record_format = args.output_format in RECORD_FORMATS
+    if record_format and len(styles) > 1:
+        parser.error(f'--output-format {args.output_format} writes records once; '
+                     '--format then only selects the sort order and takes one style')
+    style = styles[0] if len(styles) == 1 else styles
+
+    input_format = args.input_format
+    if input_format == 'auto':
+        input_format = detect_input_format(args.input)
+    if input_format in ARROW_FORMATS:
+        from citation_arrow import require_pyarrow
+        try:
+            require_pyarrow()
+        except ImportError as e:
+            parser.error(str(e))
+
+    if args.sort_memory <= 0:
+        parser.error('--sort-memory must be positive')
+    if (args.near_duplicates or args.dedup_report) and not args.dedup:
+        parser.error('--near-duplicates and --dedup-report require --dedup')
+    if args.enrich_concurrency < 1 or args.enrich_ttl < 0:
+        parser.error('--enrich-concurrency must be positive and --enrich-ttl not negative')
+
+    escape = args.escape or ('html' if args.output_format == 'html' else 'none')
+    # Workers read byte ranges of a JSON Lines file themselves unless a
+    # stage needs every record in this process
+    needs_records = record_format or args.cited_in or args.enrich or args.dedup
+    # The cache is keyed by raw input, so it only serves citations formatted
+    # straight from the input file
+    use_cache = args.cache is not None and not args.no_cache
+    if use_cache and (needs_records or args.sort):
+        print("Note: --cache is not used with --sort, --dedup, --enrich, --cited-in "
+              "or record output formats", file=sys.stderr)
+        use_cache = False
+    sharded = args.workers > 1 and input_format == 'jsonl' and not needs_records and not use_cache
+    # Columnar input is formatted a batch at a time unless a stage needs records
+    columnar = input_format in ARROW_FORMATS and not needs_records and not use_cache
+
     try:
-        # Read input
-        with open(args.input, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
+        with ExitStack() as inputs:
+            missing_keys: List[str] = []
+            if sharded or columnar or use_cache:
+                papers = None
+            elif args.cited_in:
+                from citation_keys import scan_files
+                cited = scan_files(args.cited_in)
+                papers = iter_cited(args.input, input_format, cited, missing_keys, args.key_index)
+            elif input_format in ARROW_FORMATS:
+                papers = read_papers(args.input, input_format)
+            else:
+                f = inputs.enter_context(open(args.input, 'r', encoding='utf-8'))
+                papers = iter_papers(f, input_format)
+            enricher = None
+            if args.enrich:
+                # Before dedup, so DOIs found here also identify duplicates
+                from citation_enrich import Enricher, ResolverCache
+                ttl = int(args.enrich_ttl * 24 * 60 * 60)
+                resolver_cache = inputs.enter_context(
+                    ResolverCache(args.enrich_cache, ttl=ttl, negative_ttl=min(ttl, 24 * 60 * 60)))
+                enricher = inputs.enter_context(
+                    Enricher(args.enrich_url, resolver_cache, args.enrich_concurrency,
+                             mailto=args.mailto))
+                papers = enricher.enrich(papers)
+            dedup = None
+            if args.dedup:
+                from citation_dedup import Deduplicator
+                dedup = Deduplicator(near_duplicates=args.near_duplicates)
+                report = None
+                if args.dedup_report:
+                    report = inputs.enter_context(open(args.dedup_report, 'w', encoding='utf-8'))
+                papers = dedup.filter(papers, report)
+            keys = deque()
+            if args.sort:
+                sort_specs = [STYLE_DEFINITIONS[s].get('sort') for s in styles]
 
-        # Support both single paper and list of papers
-        if isinstance(metadata, list):
-            papers = metadata
-        else:
-            papers = [metadata]
-
-        # Generate citations
-        citations = []
-        for paper in papers:
-            if args.format == 'apa':
-                citation = generate_apa_citation(paper)
-            elif args.format == 'mla':
-                citation = generate_mla_citation(paper)
-            elif args.format == 'chicago':
-                citation = generate_chicago_citation(paper)
-            elif args.format == 'harvard':
-                citation = generate_harvard_citation(paper)
-            elif args.format == 'ieee':
-                citation = generate_ieee_citation(paper)
+                def keyed(records):
+                    # Keys are queued in input order and consumed alongside
+                    # the formatted citations, however far formatting runs ahead
+                    for record in records:
+                        keys.append(tuple(sort_key(record, spec) if spec else None
+                                          for spec in sort_specs))
+                        yield record
+
+                if papers is not None:
+                    papers = keyed(papers)
+            cache = None
+            if use_cache:
+                from citation_cache import CitationCache
+                cache = inputs.enter_context(
+                    CitationCache(args.cache or None, max_bytes=int(args.cache_size * 1024 * 1024)))
+                citations = format_cached(args.input, input_format, style, cache, args.workers,
+                                          escape)
+            elif columnar:
+                from citation_arrow import format_arrow
+                citations = format_arrow(args.input, input_format, style, args.workers,
+                                         sort_specs=sort_specs if args.sort else None,
+                                         keys=keys, escape=escape)
+            elif sharded:
+                citations = format_sharded(args.input, style, args.workers,
+                                           sort_specs=sort_specs if args.sort else None,
+                                           keys=keys, escape=escape)
+            elif record_format:
+                # Serialized records are cheap to produce and carry per-run
+                # citation keys, so they bypass the cache and worker pool
+                citations = map(record_serializer(args.output_format), papers)
+            elif args.workers > 1:
+                citations = format_parallel(papers, style, args.workers, args.chunk_size, escape)
             else:
-                citation = generate_apa_citation(paper)
+                citations = map(get_formatter(style, escape), papers)
 
-            citations.append(citation)
+            with ExitStack() as stack:
+                if len(styles) > 1:
+                    paths = [output_path_for_style(args.output, s) for s in styles]
+                elif args.output:
+                    paths = [args.output]
+                else:
+                    paths = []
+                if args.gzip:
+                    paths = [p if p.endswith(GZIP_SUFFIX) else p + GZIP_SUFFIX for p in paths]
+                streams = [stack.enter_context(open_output(p, args.gzip)) for p in paths]
+                if not paths:
+                    streams = [open_output(None, args.gzip)]
+                    if args.gzip:
+                        stack.enter_context(streams[0])
+                writer_class = WRITERS[args.output_format]
+                outs = [writer_class(stream) for stream in streams]
 
-        # Output
-        output_text = '\n\n'.join(citations)
+                if args.sort:
+                    rows = citations if len(styles) > 1 else ((c,) for c in citations)
+                    write_sorted_citations(rows, keys, sort_specs, outs,
+                                           int(args.sort_memory * 1024 * 1024))
+                elif len(styles) > 1:
+                    write_citation_sets(citations, outs)
+                else:
+                    write_citations(citations, outs[0])
+                for out in outs:
+                    out.close()
+                if not paths and not args.gzip and args.output_format == 'text':
+                    sys.stdout.write('\n')
 
-        if args.output:
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(output_text)
-            print(f"Citations written to {args.output}")
-        else:
-            print(output_text)
+            for path in paths:
+                print(f"Citations written to {path}")
+
+            if missing_keys:
+                shown = ', '.join(missing_keys[:10]) + (', ...' if len(missing_keys) > 10 else '')
+                print(f"Warning: {len(missing_keys)} cited keys not found in {args.input}: {shown}",
+                      file=sys.stderr)
+            if cache is not None and cache.misses:
+                print(f"Cache: {cache.hits} hits, {cache.misses} formatted", file=sys.stderr)
+            if enricher is not None and enricher.looked_up:
+                print(f"Enrichment: {enricher.resolved} of {enricher.looked_up} incomplete records "
+                      f"resolved ({enricher.cache_hits} from cache, {enricher.failures} failed), "
+                      f"{enricher.fields_filled} fields filled", file=sys.stderr)
+            if dedup is not None:
+                print(f"Merged {dedup.duplicates} duplicate records "
+                      f"({dedup.seen - dedup.duplicates} of {dedup.seen} kept)", file=sys.stderr)
 
         return 0
 
@@ -299,4 +1919,7 @@ def main():
 
 
 if __name__ == '__main__':
+    # Sibling modules import this file as citation_generator; let them share
+    # this instance (and the styles registered from --style-file)
+    sys.modules.setdefault('citation_generator', sys.modules[__name__])
     sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Citation Keys
+Finds the citation keys used in manuscripts and locates them in a library.
+
+Sources are scanned with one compiled alternation that recognizes LaTeX
+citation commands (``\\cite{a,b}``, ``\\citep[p.~3]{a}``, ``\\parencite``,
+``\\nocite{*}``, ...) and Pandoc citations (``[@a; @b, p. 3]``,
+``[-@a]``) in a single pass over each file; LaTeX comments are skipped
+in ``.tex`` files.
+
+``KeyIndex`` maps citation keys to byte ranges of a JSON Lines library in a
+small SQLite file. It is rebuilt only when the library changes, so
+rendering a manuscript's references reads just the cited lines instead of
+parsing the whole library.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+# Bump when key generation changes, so existing indexes are rebuilt
+INDEX_FORMAT_VERSION = 1
+
+# Pseudo-key of \nocite{*}: include the whole library
+ALL_KEYS = '*'
+
+_TEX_CITE = (r'\\(?:[a-zA-Z]*cite[a-zA-Z]*\*?)'
+             r'(?:\s*\[[^\]]*\]){0,2}\s*\{(?P<tex>[^}]*)\}')
+_MD_CITE = r'\[(?P<md>[^\[\]]*?(?<![\w.])-?@[^\[\]]*)\]'
+_TEX_COMMENT = r'(?<!\\)%[^\n]*'
+
+# .tex files: comments are matched (and dropped) in the same pass
+_TEX_PATTERN = re.compile(f'{_TEX_COMMENT}|{_TEX_CITE}|{_MD_CITE}')
+_SOURCE_PATTERN = re.compile(f'{_TEX_CITE}|{_MD_CITE}')
+
+# A Pandoc key: starts with a word character; internal punctuation must be
+# followed by a word character, so trailing punctuation is not part of it
+_MD_KEY = re.compile(r'(?<![\w.])-?@(?:\{(?P<braced>[^}]+)\}|(?P<key>\w(?:\w|[:.#$%&\-+?<>~/](?=\w))*))')
+
+_SQL_BATCH = 500
+
+
+def scan_text(text: str, tex: bool = False) -> List[str]:
+    """Citation keys in ``text`` in order of first appearance (with duplicates)."""
+    keys = []
+    pattern = _TEX_PATTERN if tex else _SOURCE_PATTERN
+    for match in pattern.finditer(text):
+        tex_keys, md_keys = match.group('tex'), match.group('md')
+        if tex_keys is not None:
+            keys.extend(k.strip() for k in tex_keys.split(',') if k.strip())
+        elif md_keys is not None:
+            for key in _MD_KEY.finditer(md_keys):
+                keys.append(key.group('braced') or key.group('key'))
+    return keys
+
+
+def scan_files(paths: Iterable[str]) -> List[str]:
+    """Distinct citation keys of several sources, in order of first citation."""
+    seen: Dict[str, None] = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        for key in scan_text(text, tex=path.lower().endswith(('.tex', '.ltx', '.sty'))):
+            seen.setdefault(key)
+    return list(seen)
+
+
+def default_index_path(library: str) -> str:
+    """Index file for a library, under the citation cache directory."""
+    from citation_cache import default_cache_path
+
+    digest = hashlib.blake2b(os.path.abspath(library).encode('utf-8'), digest_size=8).hexdigest()
+    name = f"{os.path.splitext(os.path.basename(library))[0]}-{digest}.keys.sqlite"
+    return os.path.join(os.path.dirname(default_cache_path()), 'key-index', name)
+
+
+class KeyIndex:
+    """SQLite map of citation key -> (byte offset, length) in a JSON Lines library."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS keys ('
+            ' key TEXT PRIMARY KEY, offset INTEGER NOT NULL, length INTEGER NOT NULL'
+            ') WITHOUT ROWID')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+        self.conn.commit()
+
+    @staticmethod
+    def _signature(library: str) -> str:
+        st = os.stat(library)
+        return f"{INDEX_FORMAT_VERSION}:{os.path.abspath(library)}:{st.st_size}:{st.st_mtime_ns}"
+
+    def is_current(self, library: str) -> bool:
+        """True when the index was built from the library as it is now."""
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'library'").fetchone()
+        return row is not None and row[0] == self._signature(library)
+
+    def rebuild(self, library: str, entries: Iterable[Tuple[str, int, int]]):
+        """Replace the index with ``(key, offset, length)`` entries (first key wins)."""
+        signature = self._signature(library)
+        with self.conn:
+            self.conn.execute('DELETE FROM keys')
+            self.conn.execute("DELETE FROM meta WHERE name = 'library'")
+            self.conn.executemany('INSERT OR IGNORE INTO keys VALUES (?, ?, ?)', entries)
+            self.conn.execute("INSERT INTO meta VALUES ('library', ?)", (signature,))
+
+    def lookup(self, keys: List[str]) -> Dict[str, Tuple[int, int]]:
+        """Byte ranges of the keys present in the index."""
+        found = {}
+        for i in range(0, len(keys), _SQL_BATCH):
+            batch = keys[i:i + _SQL_BATCH]
+            marks = ','.join('?' * len(batch))
+            for key, offset, length in self.conn.execute(
+                    f'SELECT key, offset, length FROM keys WHERE key IN ({marks})', batch):
+                found[key] = (offset, length)
+        return found
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    """List the citation keys used in manuscript sources."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List citation keys cited in .tex/.md files')
+    parser.add_argument('sources', nargs='+', help='LaTeX or Markdown files')
+
+    args = parser.parse_args()
+
+    for key in scan_files(args.sources):
+        print(key)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Legacy Citation Formatters (benchmark fixture)
+
+FIXTURE ONLY - not used to generate citations. These are the hand-written
+per-style functions and per-record if/elif dispatch that the compiled
+style formatters replaced, kept solely as the baseline of
+``citation_benchmark.py formatters``. They share the generator's author
+formatters and period rule, so they must produce exactly the same
+citations as ``STYLES``; the benchmark checks this on every record before
+timing anything and refuses to run when they disagree. When a change to
+the built-in styles makes it fail, update this file to match.
+"""
+
+from datetime import datetime
+from typing import Dict
+
+from citation_generator import (
+    UNKNOWN_AUTHOR, _period, format_authors_apa, format_authors_chicago, format_authors_harvard,
+    format_authors_ieee, format_authors_mla,
+)
+
+# Styles with a reference implementation
+LEGACY_STYLES = ('apa', 'mla', 'chicago', 'harvard', 'ieee')
+
+
+def legacy_apa_citation(metadata: Dict) -> str:
+    """APA 7th edition, if-ladder implementation."""
+    authors = metadata.get('authors', [])
+    year = metadata.get('year', datetime.now().year)
+    title = metadata.get('title', 'Untitled')
+    journal = metadata.get('journal', '')
+    volume = metadata.get('volume', '')
+    issue = metadata.get('issue', '')
+    pages = metadata.get('pages', '')
+    doi = metadata.get('doi', '')
+    url = metadata.get('url', '')
+
+    author_str = format_authors_apa(authors)
+    if not author_str:
+        author_str = UNKNOWN_AUTHOR
+
+    citation = f"{author_str} ({year}). {title}{_period(title)} "
+
+    if journal:
+        citation += f"*{journal}*"
+        if volume:
+            citation += f", *{volume}*"
+        if issue:
+            citation += f"({issue})"
+        if pages:
+            citation += f", {pages}"
+        citation += "."
+
+    if doi:
+        citation += f" https://doi.org/{doi}"
+    elif url:
+        citation += f" {url}"
+
+    return citation
+
+
+def legacy_mla_citation(metadata: Dict) -> str:
+    """MLA 9th edition, if-ladder implementation."""
+    authors = metadata.get('authors', [])
+    title = metadata.get('title', 'Untitled')
+    journal = metadata.get('journal', '')
+    volume = metadata.get('volume', '')
+    issue = metadata.get('issue', '')
+    year = metadata.get('year', datetime.now().year)
+    pages = metadata.get('pages', '')
+    doi = metadata.get('doi', '')
+
+    author_str = format_authors_mla(authors)
+    if not author_str:
+        author_str = UNKNOWN_AUTHOR
+
+    citation = f'{author_str}{_period(author_str)} "{title}{_period(title)}" '
+
+    if journal:
+        citation += f"*{journal}*"
+        if volume:
+            citation += f", vol. {volume}"
+        if issue:
+            citation += f", no. {issue}"
+        citation += f", {year}"
+        if pages:
+            citation += f", pp. {pages}"
+        citation += "."
+
+    if doi:
+        citation += f" https://doi.org/{doi}{_period(doi)}"
+
+    return citation
+
+
+def legacy_chicago_citation(metadata: Dict) -> str:
+    """Chicago 17th edition, if-ladder implementation."""
+    authors = metadata.get('authors', [])
+    title = metadata.get('title', 'Untitled')
+    journal = metadata.get('journal', '')
+    volume = metadata.get('volume', '')
+    issue = metadata.get('issue', '')
+    year = metadata.get('year', datetime.now().year)
+    pages = metadata.get('pages', '')
+    doi = metadata.get('doi', '')
+
+    author_str = format_authors_chicago(authors) if authors else UNKNOWN_AUTHOR
+
+    citation = f'{author_str}{_period(author_str)} "{title}{_period(title)}" '
+
+    if journal:
+        citation += f"*{journal}*"
+        if volume:
+            citation += f" {volume}"
+        if issue:
+            citation += f", no. {issue}"
+        citation += f" ({year})"
+        if pages:
+            citation += f": {pages}"
+        citation += "."
+
+    if doi:
+        citation += f" https://doi.org/{doi}{_period(doi)}"
+
+    return citation
+
+
+def legacy_harvard_citation(metadata: Dict) -> str:
+    """Harvard, if-ladder implementation."""
+    authors = metadata.get('authors', [])
+    year = metadata.get('year', datetime.now().year)
+    title = metadata.get('title', 'Untitled')
+    journal = metadata.get('journal', '')
+    volume = metadata.get('volume', '')
+    issue = metadata.get('issue', '')
+    pages = metadata.get('pages', '')
+
+    author_str = format_authors_harvard(authors) if authors else UNKNOWN_AUTHOR
+
+    citation = f"{author_str} ({year}) '{title}', "
+
+    if journal:
+        citation += f"*{journal}*"
+        if volume:
+            citation += f", vol. {volume}"
+        if issue:
+            citation += f", no. {issue}"
+        if pages:
+            citation += f", pp. {pages}"
+        citation += "."
+
+    return citation
+
+
+def legacy_ieee_citation(metadata: Dict) -> str:
+    """IEEE, if-ladder implementation."""
+    authors = metadata.get('authors', [])
+    title = metadata.get('title', 'Untitled')
+    journal = metadata.get('journal', '')
+    volume = metadata.get('volume', '')
+    issue = metadata.get('issue', '')
+    pages = metadata.get('pages', '')
+    year = metadata.get('year', datetime.now().year)
+    month = metadata.get('month', '')
+
+    author_str = format_authors_ieee(authors) if authors else UNKNOWN_AUTHOR
+
+    citation = f'{author_str}, "{title}," '
+
+    if journal:
+        citation += f"*{journal}*"
+        if volume:
+            citation += f", vol. {volume}"
+        if issue:
+            citation += f", no. {issue}"
+        if pages:
+            citation += f", pp. {pages}"
+        if month:
+            citation += f", {month}"
+        citation += f", {year}{_period(year)}"
+
+    return citation
+
+
+def legacy_format_citation(paper: Dict, style: str) -> str:
+    """Per-record if/elif dispatch of the reference implementations."""
+    if style == 'apa':
+        return legacy_apa_citation(paper)
+    elif style == 'mla':
+        return legacy_mla_citation(paper)
+    elif style == 'chicago':
+        return legacy_chicago_citation(paper)
+    elif style == 'harvard':
+        return legacy_harvard_citation(paper)
+    elif style == 'ieee':
+        return legacy_ieee_citation(paper)
+    else:
+        return legacy_apa_citation(paper)
+
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Citation Server
+Keeps the citation style engine warm and formats batches on request.
+
+Started with ``citation_generator.py serve``. Requests and responses are
+single JSON lines, exchanged over a Unix socket (``--socket PATH``) or over
+stdin/stdout:
+
+    {"id": 1, "style": "apa", "records": [{...}, ...]}
+    -> {"id": 1, "citations": ["...", ...]}
+
+    {"id": 2, "style": ["apa", "ieee"], "records": [...], "sort": true}
+    -> {"id": 2, "citations": {"apa": [...], "ieee": [...]}}
+
+    {"id": 3, "style": "ieee", "records": [...], "escape": "latex"}
+    -> {"id": 3, "citations": ["... \\textit{Journal} ..."]}
+
+    {"id": 4, "op": "styles"}
+    -> {"id": 4, "styles": ["apa", "mla", ...]}
+
+Failures are answered with {"id": ..., "error": "..."} and leave the
+connection open. Each socket connection is served by its own thread; with
+``--workers N`` large batches are additionally split across N processes.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, TextIO
+
+from citation_generator import (
+    DEFAULT_CHUNK_SIZE, ESCAPE_TARGETS, STYLE_DEFINITIONS, STYLES, _custom_style_definitions,
+    _format_chunk, _init_worker, chunked, get_formatter, load_style_file, sort_key,
+)
+
+
+class RequestError(ValueError):
+    """A request that cannot be answered; reported back to the client."""
+
+
+class CitationService:
+    """Formats request batches with compiled styles and an optional process pool."""
+
+    def __init__(self, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Initialize the service
+
+        Args:
+            workers: Worker processes for large batches (1 formats in-process)
+            chunk_size: Records per worker task; smaller batches stay in-process
+        """
+        self.chunk_size = chunk_size
+        self.pool = None
+        if workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(_custom_style_definitions(),))
+        self.requests = 0
+        self.citations = 0
+        self._lock = threading.Lock()
+
+    def handle(self, request: Dict) -> Dict:
+        """Answer one decoded request."""
+        if not isinstance(request, dict):
+            raise RequestError('request must be a JSON object')
+        op = request.get('op', 'format')
+        if op == 'styles':
+            return {'styles': list(STYLES)}
+        if op == 'stats':
+            return {'requests': self.requests, 'citations': self.citations}
+        if op != 'format':
+            raise RequestError(f"unknown op '{op}'")
+        return self.format(request)
+
+    def format(self, request: Dict) -> Dict:
+        style = request.get('style', 'apa')
+        styles = (style,) if isinstance(style, str) else tuple(style or ())
+        if not styles or not all(isinstance(s, str) for s in styles):
+            raise RequestError("'style' must be a style name or a list of names")
+        unknown = [s for s in styles if s not in STYLES]
+        if unknown:
+            raise RequestError(f"unknown format '{unknown[0]}' (available: {', '.join(STYLES)})")
+        records = request.get('records')
+        if records is None and 'record' in request:
+            records = [request['record']]
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise RequestError("'records' must be a list of objects")
+
+        escape = request.get('escape', 'none')
+        if escape not in ESCAPE_TARGETS:
+            raise RequestError(f"'escape' must be one of {', '.join(ESCAPE_TARGETS)}")
+
+        multi = not isinstance(style, str)
+        key = styles if multi else styles[0]
+        if self.pool is not None and len(records) > self.chunk_size:
+            rows = []
+            tasks = -(-len(records) // self.chunk_size)
+            for chunk in self.pool.map(_format_chunk, chunked(records, self.chunk_size),
+                                       [key] * tasks, [escape] * tasks):
+                rows.extend(chunk)
+        else:
+            rows = list(map(get_formatter(key, escape), records))
+
+        with self._lock:
+            self.requests += 1
+            self.citations += len(rows) * len(styles)
+
+        if not multi:
+            citations = rows
+            if request.get('sort'):
+                citations = self._sorted(citations, records, styles[0])
+            return {'citations': citations}
+        result = {}
+        for i, name in enumerate(styles):
+            citations = [row[i] for row in rows]
+            if request.get('sort'):
+                citations = self._sorted(citations, records, name)
+            result[name] = citations
+        return {'citations': result}
+
+    @staticmethod
+    def _sorted(citations: List[str], records: List[Dict], style: str) -> List[str]:
+        spec = STYLE_DEFINITIONS[style].get('sort')
+        if not spec:
+            return citations
+        order = sorted(range(len(records)), key=lambda i: sort_key(records[i], spec))
+        return [citations[i] for i in order]
+
+    def respond(self, line: str) -> str:
+        """Answer one request line with one response line (without newline)."""
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise RequestError(f"invalid JSON: {e}") from None
+            if isinstance(request, dict):
+                request_id = request.get('id')
+            response = self.handle(request)
+        except RequestError as e:
+            response = {'error': str(e)}
+        except Exception as e:
+            response = {'error': f"{type(e).__name__}: {e}"}
+        return json.dumps({'id': request_id, **response}, ensure_ascii=False)
+
+    def serve_stream(self, infile: TextIO, outfile: TextIO):
+        """Line protocol over a pair of text streams (e.g. stdin/stdout)."""
+        for line in infile:
+            if not line.strip():
+                continue
+            outfile.write(self.respond(line) + '\n')
+            outfile.flush()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for raw in self.rfile:
+            line = raw.decode('utf-8', errors='replace')
+            if not line.strip():
+                continue
+            self.wfile.write(service.respond(line).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class CitationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server answering each connection in its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, service: CitationService):
+        self.service = service
+        if os.path.exists(path):
+            _remove_stale_socket(path)
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+
+def _remove_stale_socket(path: str):
+    """Remove a socket file left by a dead server; refuse if one is still listening."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.remove(path)
+    else:
+        raise OSError(f"a server is already listening on {path}")
+    finally:
+        probe.close()
+
+
+class CitationClient:
+    """Minimal client for a running ``serve --socket`` process."""
+
+    def __init__(self, path: str):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile('rb')
+        self.next_id = 0
+
+    def request(self, payload: Dict) -> Dict:
+        self.next_id += 1
+        payload = {'id': self.next_id, **payload}
+        self.sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+        response = json.loads(self.rfile.readline())
+        if 'error' in response:
+            raise RequestError(response['error'])
+        return response
+
+    def format(self, records: List[Dict], style='apa', sort: bool = False):
+        """Citations for ``records`` (a dict of lists when ``style`` is a list)."""
+        return self.request({'style': style, 'records': records, 'sort': sort})['citations']
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Run the server until stdin closes or the process is terminated."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='citation_generator.py serve',
+        description='Serve citation formatting requests (JSON lines) from a warm process')
+    parser.add_argument('--socket', metavar='PATH',
+                       help='Listen on this Unix socket (default: stdin/stdout)')
+    parser.add_argument('--style-file', action='append', default=[],
+                       help='JSON file with additional style definition(s); may be repeated')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Worker processes for large batches (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                       help=f'Records per worker task (default: {DEFAULT_CHUNK_SIZE})')
+
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be positive')
+    for path in args.style_file:
+        try:
+            load_style_file(path)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot load style file '{path}': {e}")
+
+    service = CitationService(args.workers, args.chunk_size)
+    try:
+        if not args.socket:
+            service.serve_stream(sys.stdin, sys.stdout)
+            return 0
+        try:
+            server = CitationServer(args.socket, service)
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        # SIGTERM shuts down cleanly so the socket file is removed
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        print(f"Serving citations on {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(args.socket):
+                os.remove(args.socket)
+        return 0
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+External Merge Sort
+Sorts a stream of (key, sequence, text) items within a memory budget.
+
+Items are buffered until the budget is reached, then the buffer is sorted
+and spilled to a temporary run file. Iterating the sorter merges the runs
+with the in-memory remainder; when there are more runs than
+MAX_MERGE_FAN_IN, they are first merged in passes into fewer, longer runs
+so the number of open files stays bounded. Because the sequence number
+breaks ties, the result is identical to sorting everything in memory.
+"""
+
+import heapq
+import os
+import pickle
+import tempfile
+from typing import Any, Iterator, List, Optional, Tuple
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Rough per-item overhead of a buffered (key, seq, text) tuple, in bytes
+_ITEM_OVERHEAD = 200
+
+# Items pickled per write when spilling a run
+_SPILL_BATCH = 1000
+
+# Most run files open at once during a merge
+MAX_MERGE_FAN_IN = 64
+
+SortItem = Tuple[Any, int, str]
+
+
+class ExternalSorter:
+    """Bounded-memory sorter for (key, seq, text) items."""
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 tmp_dir: Optional[str] = None):
+        """
+        Initialize the sorter
+
+        Args:
+            memory_budget: Approximate bytes of items held before spilling
+            tmp_dir: Directory for run files (default: system temp dir)
+        """
+        self.memory_budget = memory_budget
+        self.tmp_dir = tmp_dir
+        self.buffer: List[SortItem] = []
+        self.buffered_bytes = 0
+        self.runs: List[str] = []
+
+    def add(self, key: Any, seq: int, text: str):
+        self.buffer.append((key, seq, text))
+        self.buffered_bytes += len(text) + _ITEM_OVERHEAD
+        if self.buffered_bytes >= self.memory_budget:
+            self._spill()
+
+    def _write_run(self, items: Iterator[SortItem]) -> str:
+        """Write sorted items to a new run file and return its path."""
+        fd, path = tempfile.mkstemp(prefix='citation-sort-', suffix='.run', dir=self.tmp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= _SPILL_BATCH:
+                    pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+                    batch = []
+            if batch:
+                pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def _spill(self):
+        self.buffer.sort()
+        self.runs.append(self._write_run(iter(self.buffer)))
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def _reduce_runs(self, fan_in: int):
+        """Merge runs in groups of ``fan_in`` until at most ``fan_in`` remain."""
+        while len(self.runs) > fan_in:
+            group, rest = self.runs[:fan_in], self.runs[fan_in:]
+            merged = self._write_run(heapq.merge(*(self._read_run(path) for path in group)))
+            # The merged run goes last; (key, seq) order does not depend on run order
+            self.runs = rest + [merged]
+            for path in group:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[SortItem]:
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def __iter__(self) -> Iterator[SortItem]:
+        """Yield all items in sorted order; run files are removed afterwards."""
+        self.buffer.sort()
+        try:
+            if not self.runs:
+                yield from self.buffer
+            else:
+                # One slot is taken by the in-memory buffer
+                self._reduce_runs(MAX_MERGE_FAN_IN - 1)
+                runs = [self._read_run(path) for path in self.runs]
+                yield from heapq.merge(*runs, self.buffer)
+        finally:
+            self.cleanup()
+
+    def sorted_texts(self) -> Iterator[str]:
+        """Yield only the texts, in sorted order."""
+        for _, _, text in self:
+            yield text
+
+    def cleanup(self):
+        """Delete spilled run files and drop buffered items."""
+        for path in self.runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.runs = []
+        self.buffer = []
+        self.buffered_bytes = 0
@@ -53,7 +53,8 @@ def auto_generate(
     auto_images: bool = False,
     image_model: str = "gemini-3-pro-image-preview",
     image_size: str = "2K",
-    aspect_ratio: str = "16:9"
+    aspect_ratio: str = "16:9",
+    use_cache: bool = True
 ) -> None:
     """
     自动化生成流程
@@ -69,6 +70,7 @@ def auto_generate(
         image_model: 图像生成模型
         image_size: 图像分辨率
         aspect_ratio: 图像宽高比
+        use_cache: 是否使用响应缓存（相同提示词不重复调用 API）
     """
     print("="*60)
     print("自动化 PPT 生成")
@@ -105,6 +107,8 @@ def auto_generate(
 
     if topic:
         outline_cmd.extend(["--topic", topic])
+    if not use_cache:
+        outline_cmd.append("--no-cache")
 
     if not run_command(outline_cmd, "生成大纲"):
         sys.exit(1)
@@ -130,6 +134,8 @@ def auto_generate(
             "--image-size", image_size,
             "--aspect-ratio", aspect_ratio
         ])
+        if not use_cache:
+            prompts_cmd.append("--no-cache")
 
         if not run_command(prompts_cmd, "自动生成图像"):
             sys.exit(1)
@@ -347,6 +353,12 @@ def main():
         help='图像宽高比（默认: 16:9）'
     )
 
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='不使用响应缓存（总是重新调用 API）'
+    )
+
     parser.add_argument(
         '--resume',
         metavar='WORK_DIR',
@@ -375,7 +387,8 @@ def main():
                 auto_images=args.auto_images,
                 image_model=args.image_model,
                 image_size=args.image_size,
-                aspect_ratio=args.aspect_ratio
+                aspect_ratio=args.aspect_ratio,
+                use_cache=not args.no_cache
             )
 
     except KeyboardInterrupt:
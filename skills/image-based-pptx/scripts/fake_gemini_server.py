@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Gemini API 本地模拟服务器
+
+实现 generateContent REST 接口，用于在没有网络和 API 密钥的情况下压测
+并发、限速、重试与整条生成流水线：
+
+    python3 fake_gemini_server.py --port 8765 --image-latency lognormal:8,0.4 --error-429 0.05
+    export GEMINI_BASE_URL=http://127.0.0.1:8765
+    python3 auto-generate.py --input paper.pdf --auto-images
+
+三种模式：
+- 模拟（默认）：按延迟分布等待后返回合成的大纲文本或真实大小的 PNG，
+  可按比例注入 429/500，或按 --rpm 模拟服务端配额
+- 录制（--record FILE --upstream URL）：把请求转发到真实服务并把响应写入录像带（JSON Lines，不含密钥）
+- 回放（--replay FILE）：按请求内容匹配录像带中的响应，连同当时的延迟一起返回
+
+随机数由 --seed 与请求内容决定，与请求到达的顺序和线程调度无关，同样的负载每次得到同样的结果。
+"""
+
+import base64
+import hashlib
+import http.client
+import json
+import math
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# 分辨率档位 -> 正方形图像的边长；其他宽高比保持相同像素数
+IMAGE_SIDES = {'1K': 1024, '2K': 2048, '4K': 4096}
+
+# 压缩后每像素字节数；幻灯片图像（大面积纯色 + 文字）的 PNG 通常在 0.3~1 之间
+DEFAULT_BYTES_PER_PIXEL = 0.6
+
+# 录像带中保留的响应头
+RECORDED_HEADERS = ('content-type', 'retry-after')
+
+
+class LatencyModel:
+    """
+    延迟分布（秒）
+
+    fixed:S | uniform:LO,HI | normal:MEAN,SD | lognormal:MEDIAN,SIGMA
+    """
+
+    PARAMS = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+
+    def __init__(self, spec: str = 'fixed:0'):
+        kind, _, args = spec.partition(':')
+        try:
+            params = [float(x) for x in args.split(',')] if args else []
+        except ValueError:
+            params = []
+        if self.PARAMS.get(kind) != len(params):
+            raise ValueError(f"无效的延迟分布: {spec}（应为 fixed:S、uniform:LO,HI、"
+                             f"normal:MEAN,SD 或 lognormal:MEDIAN,SIGMA）")
+        self.spec = spec
+        self.kind = kind
+        self.params = params
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == 'fixed':
+            return p[0]
+        if self.kind == 'uniform':
+            return rng.uniform(p[0], p[1])
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(p[0], p[1]))
+        return p[0] * math.exp(rng.gauss(0.0, p[1]))
+
+
+def image_dimensions(aspect_ratio: str, image_size: str) -> Tuple[int, int]:
+    """按宽高比与分辨率档位计算图像尺寸（16 像素对齐）"""
+    try:
+        w_ratio, h_ratio = (int(x) for x in aspect_ratio.split(':'))
+    except ValueError:
+        w_ratio, h_ratio = 1, 1
+    side = IMAGE_SIDES.get(image_size, IMAGE_SIDES['1K'])
+    scale = math.sqrt(side * side / (w_ratio * h_ratio))
+    return (max(16, round(w_ratio * scale / 16) * 16), max(16, round(h_ratio * scale / 16) * 16))
+
+
+def make_png(width: int, height: int, bytes_per_pixel: float, rng: random.Random) -> bytes:
+    """
+    生成有效的 RGB PNG
+
+    部分行填充随机噪声（不可压缩），其余为纯色背景，
+    使压缩后大小约为 width × height × bytes_per_pixel。
+    """
+    noisy = min(height, round(height * bytes_per_pixel / 3))
+    noisy_rows = {int(i * height / noisy) for i in range(noisy)} if noisy else set()
+    flat = b'\x00' + b'\xf8\xf7\xf5' * width
+    raw = b''.join(b'\x00' + rng.randbytes(width * 3) if y in noisy_rows else flat
+                   for y in range(height))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + tag + data
+                + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 1))
+            + chunk(b'IEND', b''))
+
+
+def fake_text(prompt: str, rng: random.Random) -> str:
+    """合成文本响应；大纲提示词按要求的页数返回可被解析的大纲"""
+    match = re.search(r'幻灯片数量:\s*(\d+)', prompt)
+    if not match:
+        return f"这是本地模拟服务器返回的文本（{rng.randrange(10 ** 6):06d}）。"
+    slides = []
+    for n in range(1, int(match.group(1)) + 1):
+        slides.append(
+            f"// SLIDE {n}: 模拟幻灯片 {n}\n\n"
+            f"// NARRATIVE GOAL\n说明第 {n} 页在整体叙事中的作用。\n\n"
+            f"// KEY CONTENT\n标题：第 {n} 页的核心观点\n- 要点 A\n- 要点 B\n\n"
+            f"// VISUAL\n简洁的几何图形与一张示意图。\n\n"
+            f"// LAYOUT\n左文右图，标题位于上方。\n")
+    return '\n'.join(slides)
+
+
+def request_key(model: str, body: Dict) -> str:
+    """请求内容的哈希（录像带匹配与随机数种子）"""
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f'{model}\n{payload}'.encode('utf-8')).hexdigest()
+
+
+def _error(code: int, status: str, message: str, retry_delay: Optional[float] = None) -> Dict:
+    error = {'code': code, 'message': message, 'status': status}
+    if retry_delay is not None:
+        error['details'] = [{'@type': 'type.googleapis.com/google.rpc.RetryInfo',
+                             'retryDelay': f'{retry_delay:.3f}s'}]
+    return {'error': error}
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'   # keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        match = re.fullmatch(r'.*/models/([^/:]+):generateContent', urlsplit(self.path).path)
+        if not match:
+            self._send(404, {}, json.dumps(_error(404, 'NOT_FOUND', '未知接口')).encode())
+            return
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            self._send(400, {}, json.dumps(_error(400, 'INVALID_ARGUMENT', '无效的 JSON')).encode())
+            return
+        status, headers, data = self.server.generate(match.group(1), body, raw, self.headers)
+        self._send(status, headers, data)
+
+    def _send(self, status: int, headers: Dict[str, str], data: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', headers.pop('content-type', 'application/json; charset=UTF-8'))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """模拟 generateContent 接口的 HTTP 服务器"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        text_latency: str = 'fixed:0',
+        image_latency: str = 'fixed:0',
+        error_429: float = 0.0,
+        error_500: float = 0.0,
+        rpm: int = 0,
+        retry_delay: float = 1.0,
+        bytes_per_pixel: float = DEFAULT_BYTES_PER_PIXEL,
+        seed: int = 0,
+        replay: Optional[str] = None,
+        replay_speed: float = 1.0,
+        record: Optional[str] = None,
+        upstream: Optional[str] = None
+    ):
+        """
+        Args:
+            port: 监听端口，0 表示随机
+            text_latency: 文本请求的延迟分布
+            image_latency: 图像请求的延迟分布
+            error_429: 注入 429 的比例
+            error_500: 注入 500 的比例
+            rpm: 每个模型每分钟允许的请求数，超出返回 429（0 表示不限）
+            retry_delay: 注入的 429 中建议的重试等待（秒）
+            bytes_per_pixel: 合成 PNG 每像素的压缩后字节数
+            seed: 随机种子
+            replay: 回放的录像带文件
+            replay_speed: 回放延迟倍数（0 表示立即返回）
+            record: 录制的录像带文件（需同时指定 upstream）
+            upstream: 录制时转发的真实服务地址
+        """
+        super().__init__(('127.0.0.1', port), _FakeHandler)
+        if record and not upstream:
+            raise ValueError("录制模式需要指定 upstream")
+        self.text_latency = LatencyModel(text_latency)
+        self.image_latency = LatencyModel(image_latency)
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.rpm = rpm
+        self.retry_delay = retry_delay
+        self.bytes_per_pixel = bytes_per_pixel
+        self.seed = seed
+        self.replay_speed = replay_speed
+        self.record = record
+        self.upstream = upstream
+        self.mode = 'record' if record else 'replay' if replay else 'synthetic'
+
+        self.cassette: Dict[str, List[Dict]] = {}
+        if replay:
+            with open(replay, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.cassette.setdefault(entry['key'], []).append(entry)
+
+        self.lock = threading.Lock()
+        self._seen: Dict[str, int] = {}
+        self._windows: Dict[str, deque] = {}
+        self._images: Dict[Tuple[int, int], str] = {}
+        self.stats = {'requests': 0, 'ok': 0, '429': 0, '500': 0, 'other': 0, 'image_bytes': 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> 'FakeGeminiServer':
+        """在后台线程中运行"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def _count(self, status: int):
+        with self.lock:
+            self.stats['ok' if status == 200 else str(status) if status in (429, 500) else 'other'] += 1
+
+    def generate(self, model: str, body: Dict, raw: bytes, headers) -> Tuple[int, Dict[str, str], bytes]:
+        """处理一次 generateContent 请求，返回 (状态码, 响应头, 响应体)"""
+        key = request_key(model, body)
+        with self.lock:
+            self.stats['requests'] += 1
+            occurrence = self._seen.get(key, 0)
+            self._seen[key] = occurrence + 1
+        if self.mode == 'replay':
+            result = self._replay(key, occurrence)
+        elif self.mode == 'record':
+            result = self._record(model, key, raw, headers)
+        else:
+            result = self._synthetic(model, key, body, occurrence)
+        self._count(result[0])
+        return result
+
+    def _replay(self, key: str, occurrence: int):
+        entries = self.cassette.get(key)
+        if not entries:
+            return 404, {}, json.dumps(_error(404, 'NOT_FOUND', '录像带中没有匹配的请求')).encode()
+        # 相同请求按录制顺序依次回放，用完后重复最后一条
+        entry = entries[min(occurrence, len(entries) - 1)]
+        time.sleep(entry.get('latency', 0.0) * self.replay_speed)
+        return entry['status'], dict(entry.get('headers', {})), entry['body'].encode('utf-8')
+
+    def _record(self, model: str, key: str, raw: bytes, headers):
+        parts = urlsplit(self.upstream)
+        conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        conn = conn_class(parts.hostname, parts.port, timeout=600)
+        api_key = headers.get('x-goog-api-key') or os.getenv('GEMINI_API_KEY', '')
+        start = time.perf_counter()
+        try:
+            conn.request('POST', f'{parts.path.rstrip("/")}/v1beta/models/{model}:generateContent', raw,
+                         {'Content-Type': 'application/json', 'x-goog-api-key': api_key})
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+        latency = time.perf_counter() - start
+        kept = {name: value for name, value in
+                ((k.lower(), v) for k, v in response.getheaders()) if name in RECORDED_HEADERS}
+        entry = {'key': key, 'model': model, 'status': response.status, 'headers': kept,
+                 'latency': round(latency, 3), 'body': data.decode('utf-8')}
+        with self.lock:
+            with open(self.record, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return response.status, dict(kept), data
+
+    def _admit(self, model: str) -> Optional[float]:
+        """服务端配额：返回 None 表示放行，否则为需要等待的秒数"""
+        if not self.rpm:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            window = self._windows.setdefault(model, deque())
+            while window and window[0] <= now - 60:
+                window.popleft()
+            if len(window) >= self.rpm:
+                return window[0] + 60 - now
+            window.append(now)
+        return None
+
+    def _image_data(self, width: int, height: int) -> str:
+        """同一尺寸的图像只生成一次（base64）"""
+        data = self._images.get((width, height))
+        if data is None:
+            png = make_png(width, height, self.bytes_per_pixel, random.Random(self.seed))
+            data = base64.b64encode(png).decode('ascii')
+            self._images[(width, height)] = data
+        return data
+
+    def _synthetic(self, model: str, key: str, body: Dict, occurrence: int):
+        rng = random.Random(f'{self.seed}:{key}:{occurrence}')
+        config = body.get('generationConfig', {})
+        is_image = 'IMAGE' in [m.upper() for m in config.get('responseModalities', [])]
+
+        wait = self._admit(model)
+        if wait is not None:
+            return 429, {}, json.dumps(_error(
+                429, 'RESOURCE_EXHAUSTED', f'Quota exceeded for {model}. Please retry in {wait:.1f}s.',
+                wait)).encode()
+
+        roll = rng.random()
+        if roll < self.error_429:
+            return 429, {}, json.dumps(_error(
+                429, 'RESOURCE_EXHAUSTED', 'Resource has been exhausted (e.g. check quota).',
+                self.retry_delay)).encode()
+
+        latency = (self.image_latency if is_image else self.text_latency).sample(rng)
+        time.sleep(latency)
+        if roll < self.error_429 + self.error_500:
+            return 500, {}, json.dumps(_error(500, 'INTERNAL', 'An internal error has occurred.')).encode()
+
+        prompt = ''.join(part.get('text', '') for content in body.get('contents', [])
+                         for part in content.get('parts', []))
+        prompt_tokens = max(1, len(prompt.encode('utf-8')) // 4)
+        if is_image:
+            image_config = config.get('imageConfig', {})
+            width, height = image_dimensions(image_config.get('aspectRatio', '1:1'),
+                                             image_config.get('imageSize', '1K'))
+            data = self._image_data(width, height)
+            with self.lock:
+                self.stats['image_bytes'] += len(data) * 3 // 4
+            parts = [{'text': f'模拟图像 {width}x{height}'},
+                     {'inlineData': {'mimeType': 'image/png', 'data': data}}]
+            output_tokens = 1290
+        else:
+            text = fake_text(prompt, rng)
+            parts = [{'text': text}]
+            output_tokens = max(1, len(text.encode('utf-8')) // 4)
+        payload = {
+            'candidates': [{'content': {'role': 'model', 'parts': parts}, 'finishReason': 'STOP'}],
+            'usageMetadata': {'promptTokenCount': prompt_tokens,
+                              'candidatesTokenCount': output_tokens,
+                              'totalTokenCount': prompt_tokens + output_tokens},
+            'modelVersion': model,
+        }
+        return 200, {}, json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Gemini API 本地模拟服务器',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  # 图像请求约 8 秒（对数正态），5%% 返回 429，服务端每分钟最多 20 次
+  %(prog)s --image-latency lognormal:8,0.4 --error-429 0.05 --rpm 20
+
+  # 录制真实响应，之后离线回放
+  %(prog)s --record cassette.jsonl --upstream https://generativelanguage.googleapis.com
+  %(prog)s --replay cassette.jsonl
+
+  # 让客户端使用模拟服务器
+  export GEMINI_BASE_URL=http://127.0.0.1:8765
+        """
+    )
+    parser.add_argument('--port', type=int, default=8765, help='监听端口（默认: 8765）')
+    parser.add_argument('--text-latency', default='lognormal:1.5,0.3',
+                        help='文本请求延迟分布（默认: lognormal:1.5,0.3）')
+    parser.add_argument('--image-latency', default='lognormal:8,0.4',
+                        help='图像请求延迟分布（默认: lognormal:8,0.4）')
+    parser.add_argument('--error-429', type=float, default=0.0, help='注入 429 的比例（0~1）')
+    parser.add_argument('--error-500', type=float, default=0.0, help='注入 500 的比例（0~1）')
+    parser.add_argument('--rpm', type=int, default=0, help='每个模型每分钟允许的请求数（默认不限）')
+    parser.add_argument('--retry-delay', type=float, default=1.0,
+                        help='注入的 429 中建议的重试等待秒数（默认: 1）')
+    parser.add_argument('--bytes-per-pixel', type=float, default=DEFAULT_BYTES_PER_PIXEL,
+                        help=f'合成 PNG 每像素字节数（默认: {DEFAULT_BYTES_PER_PIXEL}）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（默认: 0）')
+    parser.add_argument('--replay', metavar='FILE', help='回放录像带')
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help='回放延迟倍数，0 表示立即返回（默认: 1）')
+    parser.add_argument('--record', metavar='FILE', help='录制到录像带（需 --upstream）')
+    parser.add_argument('--upstream', help='录制时转发的真实服务地址')
+
+    args = parser.parse_args()
+    if args.record and not args.upstream:
+        parser.error('--record 需要同时指定 --upstream')
+
+    try:
+        server = FakeGeminiServer(
+            args.port, args.text_latency, args.image_latency, args.error_429, args.error_500,
+            args.rpm, args.retry_delay, args.bytes_per_pixel, args.seed,
+            args.replay, args.replay_speed, args.record, args.upstream
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"🧪 模拟 Gemini 服务器（{server.mode}）: {server.url}")
+    print(f"   export GEMINI_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n统计: {server.stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,568 @@
+#!/usr/bin/env python3
+"""
+Gemini API 后端
+
+GeminiClient 通过后端发送请求，负责重试、限速、缓存等的代码与具体传输方式无关：
+- GoogleSDKBackend: 使用 google-generativeai（文本）与 google-genai（图像）SDK
+- HTTPBackend: 直接调用 REST 接口（generateContent），仅依赖标准库；
+  设置 GEMINI_BASE_URL 后可指向本地的 fake_gemini_server.py，离线压测并发、限速与整条流水线
+
+两者返回相同的 TextResponse / ImageResponse。
+"""
+
+import asyncio
+import base64
+import http.client
+import json
+import os
+import ssl
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+DEFAULT_BASE_URL = 'https://generativelanguage.googleapis.com'
+API_VERSION = 'v1beta'
+DEFAULT_TIMEOUT = 300.0  # 图像生成可能需要几十秒
+
+
+class TextResponse:
+    """文本生成结果"""
+
+    def __init__(self, text: str, prompt_tokens: Optional[int] = None,
+                 response_tokens: Optional[int] = None, ttfb: Optional[float] = None):
+        self.text = text
+        self.prompt_tokens = prompt_tokens  # 实际输入 token 数（用于修正限速器的预估）
+        self.response_tokens = response_tokens
+        self.ttfb = ttfb                    # 首字节时间（秒）；SDK 后端无法测量时为 None
+
+
+class ImageResponse:
+    """图像生成结果"""
+
+    def __init__(self, image: Optional[bytes], mime_type: str = 'image/png', text: str = '',
+                 prompt_tokens: Optional[int] = None, response_tokens: Optional[int] = None,
+                 ttfb: Optional[float] = None):
+        self.image = image          # 编码后的图像字节；响应中没有图像时为 None
+        self.mime_type = mime_type
+        self.text = text            # 模型附带的文字描述
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        self.ttfb = ttfb
+
+
+class GeminiAPIError(Exception):
+    """REST 接口返回的错误（code 为 HTTP 状态码，details 为原始 JSON 错误体）"""
+
+    def __init__(self, code: int, message: str, details: Optional[Dict] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+        self.details = details or {}
+        self.headers = headers or {}
+
+
+class GeminiBackend:
+    """后端接口；异步方法默认在线程中调用同步实现"""
+
+    name = 'base'
+
+    def __init__(self):
+        self.setup_seconds = 0.0  # 构造客户端/建立连接累计耗时
+        self.setup_count = 0      # 实际构造次数
+        self.reuse_count = 0      # 复用已有实例的次数
+        self._lock = threading.Lock()
+
+    def generate_text(self, model: str, prompt: str, generation_config: Dict) -> TextResponse:
+        raise NotImplementedError
+
+    def generate_image(self, model: str, prompt: str, aspect_ratio: str, image_size: str,
+                       response_modalities: List[str]) -> ImageResponse:
+        raise NotImplementedError
+
+    async def generate_text_async(self, model: str, prompt: str,
+                                  generation_config: Dict) -> TextResponse:
+        return await asyncio.to_thread(self.generate_text, model, prompt, generation_config)
+
+    async def generate_image_async(self, model: str, prompt: str, aspect_ratio: str,
+                                   image_size: str, response_modalities: List[str]) -> ImageResponse:
+        return await asyncio.to_thread(self.generate_image, model, prompt, aspect_ratio,
+                                       image_size, response_modalities)
+
+    def close(self):
+        """释放连接"""
+
+
+def supports_image_size(model: str) -> bool:
+    """只有 Nano Banana Pro 支持 image_size 参数"""
+    return model == "gemini-3-pro-image-preview"
+
+
+class GoogleSDKBackend(GeminiBackend):
+    """基于 Google 官方 SDK 的后端"""
+
+    name = 'sdk'
+
+    def __init__(self, api_key: str):
+        """
+        Args:
+            api_key: Gemini API 密钥
+
+        Raises:
+            ImportError: 未安装 google-generativeai
+        """
+        super().__init__()
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.api_key = api_key
+        # 长期复用的 SDK 客户端与模型实例（首次使用时创建，线程安全）。
+        # 同一个客户端内部的 HTTP 连接池会保持 keep-alive，
+        # 后续调用无需重复构造客户端和 TLS 握手。
+        self._image_client = None
+        self._text_models: Dict[str, object] = {}
+
+    def _get_text_model(self, model_name: str):
+        """
+        获取（必要时创建）文本模型实例
+
+        Args:
+            model_name: 模型名称
+
+        Returns:
+            genai.GenerativeModel 实例
+        """
+        model = self._text_models.get(model_name)
+        if model is not None:
+            self.reuse_count += 1
+            return model
+        with self._lock:
+            model = self._text_models.get(model_name)
+            if model is None:
+                start = time.perf_counter()
+                model = self.genai.GenerativeModel(model_name)
+                self.setup_seconds += time.perf_counter() - start
+                self.setup_count += 1
+                self._text_models[model_name] = model
+            else:
+                self.reuse_count += 1
+        return model
+
+    def _get_image_client(self):
+        """
+        获取（必要时创建）图像生成所用的 google-genai 客户端
+
+        Returns:
+            google.genai.Client 实例
+        """
+        client = self._image_client
+        if client is not None:
+            self.reuse_count += 1
+            return client
+        with self._lock:
+            if self._image_client is None:
+                from google import genai as google_genai
+
+                start = time.perf_counter()
+                self._image_client = google_genai.Client(api_key=self.api_key)
+                self.setup_seconds += time.perf_counter() - start
+                self.setup_count += 1
+            else:
+                self.reuse_count += 1
+            return self._image_client
+
+    @staticmethod
+    def _image_generation_config(aspect_ratio: str, model: str, image_size: str,
+                                 response_modalities: List[str]):
+        """构建图像生成配置（google.genai.types.GenerateContentConfig）"""
+        from google.genai import types
+
+        # 构建配置
+        config_params = {
+            'response_modalities': response_modalities,
+            'image_config': types.ImageConfig(
+                aspect_ratio=aspect_ratio,
+            )
+        }
+
+        if supports_image_size(model) and image_size:
+            config_params['image_config'].image_size = image_size
+
+        return types.GenerateContentConfig(**config_params)
+
+    @staticmethod
+    def _usage(response) -> Tuple[Optional[int], Optional[int]]:
+        """(输入 token 数, 输出 token 数)"""
+        usage = getattr(response, 'usage_metadata', None)
+        return (getattr(usage, 'prompt_token_count', None),
+                getattr(usage, 'candidates_token_count', None))
+
+    @classmethod
+    def _text_response(cls, response) -> TextResponse:
+        return TextResponse(response.text, *cls._usage(response))
+
+    @classmethod
+    def _image_response(cls, response) -> ImageResponse:
+        texts = []
+        tokens = cls._usage(response)
+        for part in response.parts:
+            if part.text is not None:
+                texts.append(part.text)
+            elif part.inline_data is not None:
+                return ImageResponse(part.inline_data.data, part.inline_data.mime_type,
+                                     ''.join(texts), *tokens)
+        return ImageResponse(None, text=''.join(texts), prompt_tokens=tokens[0],
+                             response_tokens=tokens[1])
+
+    def generate_text(self, model: str, prompt: str, generation_config: Dict) -> TextResponse:
+        response = self._get_text_model(model).generate_content(
+            prompt,
+            generation_config=generation_config
+        )
+        return self._text_response(response)
+
+    def generate_image(self, model: str, prompt: str, aspect_ratio: str, image_size: str,
+                       response_modalities: List[str]) -> ImageResponse:
+        response = self._get_image_client().models.generate_content(
+            model=model,
+            contents=[prompt],
+            config=self._image_generation_config(aspect_ratio, model, image_size,
+                                                 response_modalities)
+        )
+        return self._image_response(response)
+
+    async def generate_text_async(self, model: str, prompt: str,
+                                  generation_config: Dict) -> TextResponse:
+        response = await self._get_text_model(model).generate_content_async(
+            prompt,
+            generation_config=generation_config
+        )
+        return self._text_response(response)
+
+    async def generate_image_async(self, model: str, prompt: str, aspect_ratio: str,
+                                   image_size: str, response_modalities: List[str]) -> ImageResponse:
+        response = await self._get_image_client().aio.models.generate_content(
+            model=model,
+            contents=[prompt],
+            config=self._image_generation_config(aspect_ratio, model, image_size,
+                                                 response_modalities)
+        )
+        # 解码 inline_data 放到线程中，避免阻塞事件循环
+        return await asyncio.to_thread(self._image_response, response)
+
+    def close(self):
+        with self._lock:
+            client, self._image_client = self._image_client, None
+            self._text_models.clear()
+        close = getattr(client, 'close', None)
+        if callable(close):
+            close()
+
+
+def _camel(name: str) -> str:
+    """max_output_tokens -> maxOutputTokens"""
+    head, *rest = name.split('_')
+    return head + ''.join(word.title() for word in rest)
+
+
+class HTTPBackend(GeminiBackend):
+    """
+    直接调用 generateContent REST 接口的后端（仅标准库）
+
+    同步请求每个线程复用一个 keep-alive 连接；异步请求在各自的事件循环中
+    维护一个 asyncio streams 连接池，不占用线程。
+    """
+
+    name = 'http'
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = DEFAULT_BASE_URL,
+                 timeout: float = DEFAULT_TIMEOUT):
+        """
+        Args:
+            api_key: Gemini API 密钥（本地模拟服务器不需要）
+            base_url: 服务地址，如 http://127.0.0.1:8765
+            timeout: 单次请求超时（秒）
+        """
+        super().__init__()
+        parts = urlsplit(base_url.rstrip('/'))
+        self.base_url = base_url.rstrip('/')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.prefix = parts.path
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json'}
+        if api_key:
+            self.headers['x-goog-api-key'] = api_key
+        self._local = threading.local()
+        self._idle: Dict[object, List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def _path(self, model: str) -> str:
+        return f'{self.prefix}/{API_VERSION}/models/{model}:generateContent'
+
+    # ---- 请求体与响应解析 ----
+
+    @staticmethod
+    def _text_body(prompt: str, generation_config: Dict) -> Dict:
+        return {
+            'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+            'generationConfig': {_camel(k): v for k, v in generation_config.items()},
+        }
+
+    @staticmethod
+    def _image_body(model: str, prompt: str, aspect_ratio: str, image_size: str,
+                    response_modalities: List[str]) -> Dict:
+        image_config = {'aspectRatio': aspect_ratio}
+        if supports_image_size(model) and image_size:
+            image_config['imageSize'] = image_size
+        return {
+            'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+            'generationConfig': {
+                'responseModalities': [m.upper() for m in response_modalities],
+                'imageConfig': image_config,
+            },
+        }
+
+    @staticmethod
+    def _check(status: int, headers: Dict[str, str], body: bytes) -> Dict:
+        """解析响应；HTTP 错误转换为 GeminiAPIError"""
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            payload = {}
+        if status >= 400:
+            error = payload.get('error', {}) if isinstance(payload, dict) else {}
+            message = error.get('message') or body[:200].decode('utf-8', 'replace')
+            raise GeminiAPIError(status, message, payload, headers)
+        return payload
+
+    @staticmethod
+    def _parts(payload: Dict) -> List[Dict]:
+        candidates = payload.get('candidates') or []
+        if not candidates:
+            reason = payload.get('promptFeedback', {}).get('blockReason', '无候选结果')
+            raise ValueError(f"响应中没有内容: {reason}")
+        return candidates[0].get('content', {}).get('parts', [])
+
+    @staticmethod
+    def _usage(payload: Dict) -> Tuple[Optional[int], Optional[int]]:
+        """(输入 token 数, 输出 token 数)"""
+        usage = payload.get('usageMetadata', {})
+        return usage.get('promptTokenCount'), usage.get('candidatesTokenCount')
+
+    @classmethod
+    def _text_response(cls, payload: Dict, ttfb: Optional[float] = None) -> TextResponse:
+        text = ''.join(part.get('text', '') for part in cls._parts(payload))
+        return TextResponse(text, *cls._usage(payload), ttfb=ttfb)
+
+    @classmethod
+    def _image_response(cls, payload: Dict, ttfb: Optional[float] = None) -> ImageResponse:
+        texts = []
+        prompt_tokens, response_tokens = cls._usage(payload)
+        for part in cls._parts(payload):
+            if 'text' in part:
+                texts.append(part['text'])
+            elif 'inlineData' in part:
+                data = part['inlineData']
+                return ImageResponse(base64.b64decode(data['data']),
+                                     data.get('mimeType', 'image/png'), ''.join(texts),
+                                     prompt_tokens, response_tokens, ttfb)
+        return ImageResponse(None, text=''.join(texts), prompt_tokens=prompt_tokens,
+                             response_tokens=response_tokens, ttfb=ttfb)
+
+    # ---- 同步传输 ----
+
+    def _connection(self) -> Tuple[http.client.HTTPConnection, bool]:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self.reuse_count += 1
+            return conn, True
+        start = time.perf_counter()
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self.setup_seconds += time.perf_counter() - start
+        self.setup_count += 1
+        self._local.conn = conn
+        return conn, False
+
+    def _post(self, path: str, payload: Dict) -> Tuple[Dict, float]:
+        """发送请求，返回 (响应 JSON, 首字节时间)"""
+        body = json.dumps(payload).encode('utf-8')
+        for attempt in range(2):
+            conn, reused = self._connection()
+            try:
+                start = time.perf_counter()
+                conn.request('POST', path, body, self.headers)
+                response = conn.getresponse()
+                ttfb = time.perf_counter() - start
+                data = response.read()
+            except (ConnectionError, http.client.HTTPException) as e:
+                conn.close()
+                self._local.conn = None
+                # 复用的连接可能已被服务器关闭，换新连接重试一次
+                if reused and attempt == 0:
+                    continue
+                if isinstance(e, ConnectionError):
+                    raise
+                raise ConnectionError(f"HTTP 连接异常: {e!r}") from e
+            headers = {k.lower(): v for k, v in response.getheaders()}
+            if response.will_close:
+                conn.close()
+                self._local.conn = None
+            return self._check(response.status, headers, data), ttfb
+        raise ConnectionError(f"无法连接 {self.base_url}")
+
+    def generate_text(self, model: str, prompt: str, generation_config: Dict) -> TextResponse:
+        return self._text_response(*self._post(self._path(model),
+                                               self._text_body(prompt, generation_config)))
+
+    def generate_image(self, model: str, prompt: str, aspect_ratio: str, image_size: str,
+                       response_modalities: List[str]) -> ImageResponse:
+        body = self._image_body(model, prompt, aspect_ratio, image_size, response_modalities)
+        return self._image_response(*self._post(self._path(model), body))
+
+    # ---- 异步传输 ----
+
+    async def _acquire(self):
+        idle = self._idle.setdefault(asyncio.get_running_loop(), [])
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                self.reuse_count += 1
+                return (reader, writer), True
+            writer.close()
+        context = None
+        if self.scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            context = self._ssl_context
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=context, limit=2 ** 20),
+            self.timeout)
+        self.setup_seconds += time.perf_counter() - start
+        self.setup_count += 1
+        return (reader, writer), False
+
+    async def _roundtrip(self, conn, path: str, body: bytes):
+        """返回 (状态码, 响应头, 响应体, 连接可复用, 首字节时间)"""
+        reader, writer = conn
+        start = time.perf_counter()
+        lines = [f'POST {path} HTTP/1.1', f'Host: {self.host}', f'Content-Length: {len(body)}',
+                 'Connection: keep-alive']
+        lines.extend(f'{name}: {value}' for name, value in self.headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('连接在响应前关闭')
+        ttfb = time.perf_counter() - start
+        version, status = status_line.decode('latin-1').split(None, 2)[:2]
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if not size:
+                    await reader.readline()
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        else:
+            data = await reader.read()
+            keep = False
+        return int(status), headers, data, keep, ttfb
+
+    async def _post_async(self, path: str, payload: Dict) -> Tuple[Dict, float]:
+        """_post 的协程版本"""
+        body = json.dumps(payload).encode('utf-8')
+        for attempt in range(2):
+            conn, reused = await self._acquire()
+            try:
+                status, headers, data, keep, ttfb = await asyncio.wait_for(
+                    self._roundtrip(conn, path, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                conn[1].close()
+                if reused and attempt == 0:
+                    continue
+                if isinstance(e, ConnectionError):
+                    raise
+                raise ConnectionError(f"HTTP 连接异常: {e!r}") from e
+            except BaseException:
+                conn[1].close()
+                raise
+            if keep:
+                self._idle.setdefault(asyncio.get_running_loop(), []).append(conn)
+            else:
+                conn[1].close()
+            # 大响应（图像 base64）的 JSON 解析放到线程中
+            if len(data) > 2 ** 20:
+                return await asyncio.to_thread(self._check, status, headers, data), ttfb
+            return self._check(status, headers, data), ttfb
+        raise ConnectionError(f"无法连接 {self.base_url}")
+
+    async def generate_text_async(self, model: str, prompt: str,
+                                  generation_config: Dict) -> TextResponse:
+        payload, ttfb = await self._post_async(self._path(model),
+                                               self._text_body(prompt, generation_config))
+        return self._text_response(payload, ttfb)
+
+    async def generate_image_async(self, model: str, prompt: str, aspect_ratio: str,
+                                   image_size: str, response_modalities: List[str]) -> ImageResponse:
+        body = self._image_body(model, prompt, aspect_ratio, image_size, response_modalities)
+        payload, ttfb = await self._post_async(self._path(model), body)
+        return await asyncio.to_thread(self._image_response, payload, ttfb)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        for loop, connections in self._idle.items():
+            # 事件循环已关闭（如 asyncio.run 返回后再 close）时无法再操作其传输，
+            # 丢弃即可，传输被回收时会关闭套接字
+            if loop.is_closed():
+                continue
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+
+def create_backend(api_key: Optional[str] = None) -> GeminiBackend:
+    """
+    按环境选择后端
+
+    GEMINI_BASE_URL 已设置（例如本地模拟服务器）或 GEMINI_BACKEND=http 时使用 HTTPBackend；
+    否则使用官方 SDK，未安装 SDK 时退回 HTTPBackend。
+
+    Args:
+        api_key: Gemini API 密钥
+
+    Returns:
+        GeminiBackend 实例
+    """
+    base_url = os.getenv('GEMINI_BASE_URL')
+    if base_url or os.getenv('GEMINI_BACKEND', '').lower() == 'http':
+        return HTTPBackend(api_key, base_url or DEFAULT_BASE_URL)
+    try:
+        return GoogleSDKBackend(api_key)
+    except ImportError:
+        print("⚠️  未安装 google-generativeai，改用 REST 接口（pip install google-generativeai 可使用官方 SDK）")
+        return HTTPBackend(api_key)
@@ -3,50 +3,194 @@
 Gemini API 客户端
 
 封装 Google Generative AI API，提供文本生成和图像生成功能。
+GeminiClient 为同步接口，AsyncGeminiClient 为基于 asyncio 的并发接口。
+实际请求由 gemini_backends 中的后端发送（官方 SDK 或 REST / 本地模拟服务器）。
 """
 
 import os
+import shutil
 import time
+import asyncio
 import base64
+import io
 from typing import Optional, Dict, List
 from pathlib import Path
 import json
 
-try:
-    import google.generativeai as genai
-    from google.api_core import exceptions as google_exceptions
-except ImportError:
-    print("错误: 需要安装 google-generativeai")
-    print("运行: pip install google-generativeai")
-    exit(1)
+from gemini_backends import GeminiBackend, ImageResponse, create_backend
+from rate_limiter import RateLimiter, estimate_tokens
+from response_cache import ResponseCache, cache_key
+from retry_policy import RetryPolicy
+from single_flight import SingleFlight
+from telemetry import Telemetry
+
+# 图像文件扩展名 -> MIME 类型（一致时直接写入响应中的字节，无需重新编码）
+IMAGE_MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+}
 
 
 class GeminiClient:
     """Gemini API 客户端封装"""
 
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 cache: Optional[ResponseCache] = None,
+                 use_cache: bool = True,
+                 backend: Optional[GeminiBackend] = None,
+                 telemetry: Optional[Telemetry] = None):
         """
         初始化 Gemini 客户端
 
         Args:
             api_key: Gemini API 密钥，如果为 None 则从环境变量读取
+            rate_limiter: 共享限速器，为 None 时按 GEMINI_RATE_LIMITS 环境变量创建
+            retry_policy: 重试策略，为 None 时使用默认策略
+            cache: 响应缓存，为 None 时按 GEMINI_CACHE* 环境变量创建
+            use_cache: 为 False 时不读写缓存
+            backend: 请求后端，为 None 时按环境选择（见 gemini_backends.create_backend）
+            telemetry: 调用遥测，为 None 时按 GEMINI_TELEMETRY 环境变量创建
         """
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
-        if not self.api_key:
+        # 自定义服务地址（如本地模拟服务器）不需要密钥
+        if not self.api_key and backend is None and not os.getenv('GEMINI_BASE_URL'):
             raise ValueError(
                 "未找到 GEMINI_API_KEY。请设置环境变量或传入 api_key 参数。\n"
                 "设置方法: export GEMINI_API_KEY='your-api-key'"
             )
 
-        genai.configure(api_key=self.api_key)
+        # 后端内部长期复用 SDK 客户端 / keep-alive 连接
+        self.backend = backend or create_backend(self.api_key)
 
         # 默认模型配置
         self.text_model = 'gemini-1.5-pro'  # 用于文本生成
         self.image_model = 'gemini-1.5-pro'  # 用于图像生成（注意：实际使用 Imagen 3）
 
-        # 重试配置
-        self.max_retries = 3
-        self.retry_delay = 2  # 秒
+        # 重试配置（退避、服务器提示、熔断；统计见 retry_policy.stats）
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=3, base_delay=2)
+
+        # 按模型的 RPM/TPM/IPM 限速（跨线程、跨进程共享）
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter.from_env()
+
+        # 相同请求直接返回磁盘缓存中的结果
+        self.cache = (cache or ResponseCache.from_env()) if use_cache else None
+
+        # 同时进行的相同请求只发送一次（线程与协程之间共享结果）
+        self.single_flight = SingleFlight()
+
+        # 每次调用的延迟、排队、重试、token 与失败原因（汇总见 telemetry.memory）
+        self.telemetry = telemetry if telemetry is not None else Telemetry.from_env()
+
+    def _measure(self, method: str, model: str):
+        """测量一次调用：with self._measure(...) as metrics"""
+        return self.telemetry.call(method, model, self.backend.name)
+
+    def _throttle(self, model: str, tokens: int = 0, images: int = 0):
+        """请求前按配额取令牌，必要时等待"""
+        if self.rate_limiter is not None:
+            waited = self.rate_limiter.acquire(model, tokens=tokens, images=images)
+            if waited >= 1:
+                print(f"⏳ 速率限制: 等待了 {waited:.1f} 秒 ({model})")
+
+    def _settle_tokens(self, model: str, response, estimate: int):
+        """用响应中的实际输入 token 数修正预估值"""
+        actual = response.prompt_tokens
+        if self.rate_limiter is not None and actual is not None:
+            self.rate_limiter.adjust(model, actual - estimate)
+
+    def _text_request_key(self, prompt: str, generation_config: Dict) -> str:
+        return cache_key(kind='text', model=self.text_model, prompt=prompt,
+                         config=generation_config)
+
+    def _image_request_key(self, prompt: str, output_path: str, aspect_ratio: str, model: str,
+                           image_size: str, response_modalities: List[str]) -> str:
+        # 图像按输出文件格式保存，格式不同的请求分开缓存；输出路径不参与
+        return cache_key(kind='image', model=model, prompt=prompt, aspect_ratio=aspect_ratio,
+                         image_size=image_size, response_modalities=response_modalities,
+                         format=Path(output_path).suffix.lower())
+
+    def _load_cached_image(self, key: str, output_path: str) -> bool:
+        """缓存命中时把图像写到 output_path"""
+        data = self.cache.get(key) if self.cache is not None else None
+        if data is None:
+            return False
+        output_path_obj = Path(output_path)
+        output_path_obj.parent.mkdir(parents=True, exist_ok=True)
+        output_path_obj.write_bytes(data)
+        print(f"  ♻️ 使用缓存图像: {output_path}")
+        return True
+
+    def _store_image(self, key: str, output_path: str):
+        if self.cache is not None:
+            self.cache.put(key, Path(output_path).read_bytes(), 'image')
+
+    @staticmethod
+    def _copy_shared_image(source: str, output_path: str):
+        """把合并请求中 leader 生成的图像复制到自己的输出路径"""
+        if Path(source).resolve() != Path(output_path).resolve():
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(source, output_path)
+        print(f"  🔗 与进行中的相同请求合并: {output_path}")
+
+    def close(self):
+        """释放后端复用的客户端及其连接池，并写出遥测数据"""
+        self.backend.close()
+        self.telemetry.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _text_generation_config(temperature: float, max_tokens: Optional[int], extra: Dict) -> Dict:
+        """构建文本生成配置"""
+        generation_config = {
+            'temperature': temperature,
+        }
+        if max_tokens:
+            generation_config['max_output_tokens'] = max_tokens
+
+        generation_config.update(extra)
+        return generation_config
+
+    @staticmethod
+    def _save_image_response(response: ImageResponse, output_path: str) -> bool:
+        """
+        保存响应中的图像
+
+        Args:
+            response: 后端返回的 ImageResponse
+            output_path: 输出图像路径
+
+        Returns:
+            是否找到并保存了图像
+        """
+        output_path_obj = Path(output_path)
+        output_path_obj.parent.mkdir(parents=True, exist_ok=True)
+
+        if response.text:
+            # 打印文本描述
+            print(f"  描述: {response.text[:100]}...")
+
+        if response.image is None:
+            print(f"  ⚠️ 警告: 响应中未找到图像数据")
+            return False
+
+        # 保存图像：格式与扩展名一致时直接写入，否则用 Pillow 转换
+        if IMAGE_MIME_TYPES.get(output_path_obj.suffix.lower()) == response.mime_type:
+            output_path_obj.write_bytes(response.image)
+        else:
+            from PIL import Image
+
+            Image.open(io.BytesIO(response.image)).save(str(output_path_obj))
+        print(f"  ✓ 图像已保存: {output_path}")
+        return True
 
     def generate_text(
         self,
@@ -70,43 +214,36 @@ class GeminiClient:
         Raises:
             Exception: API 调用失败
         """
-        model = genai.GenerativeModel(self.text_model)
-
-        generation_config = {
-            'temperature': temperature,
-        }
-        if max_tokens:
-            generation_config['max_output_tokens'] = max_tokens
-
-        generation_config.update(kwargs)
-
-        for attempt in range(self.max_retries):
-            try:
-                response = model.generate_content(
-                    prompt,
-                    generation_config=generation_config
-                )
+        with self._measure('generate_text', self.text_model) as metrics:
+            generation_config = self._text_generation_config(temperature, max_tokens, kwargs)
+            key = self._text_request_key(prompt, generation_config)
+            cached = self.cache.get_text(key) if self.cache is not None else None
+            if cached is not None:
+                metrics.outcome = 'cache_hit'
+                return cached
+
+            estimate = estimate_tokens(prompt)
+
+            def attempt():
+                metrics.queued()
+                self._throttle(self.text_model, tokens=estimate)
+                metrics.sent()
+                response = self.backend.generate_text(self.text_model, prompt, generation_config)
+                metrics.received(response)
+                self._settle_tokens(self.text_model, response, estimate)
                 return response.text
 
-            except google_exceptions.ResourceExhausted as e:
-                print(f"⚠️  API 配额已用尽: {e}")
-                if attempt < self.max_retries - 1:
-                    wait_time = self.retry_delay * (2 ** attempt)
-                    print(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                else:
-                    raise
-
-            except google_exceptions.InvalidArgument as e:
-                print(f"❌ API 参数错误: {e}")
-                raise
-
-            except Exception as e:
-                print(f"⚠️  API 调用失败 (尝试 {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                else:
-                    raise
+            def request():
+                text = self.retry_policy.call(attempt, self.text_model, metrics.retried)
+                if self.cache is not None:
+                    self.cache.put_text(key, text)
+                return text
+
+            # 相同请求正在进行时直接等待其结果
+            text, coalesced = self.single_flight.do(key, request)
+            if coalesced:
+                metrics.outcome = 'coalesced'
+            return text
 
     def generate_image(
         self,
@@ -138,77 +275,45 @@ class GeminiClient:
         Raises:
             Exception: API 调用失败
         """
-        from google.genai import types
-
-        if response_modalities is None:
-            response_modalities = ['Text', 'Image']
-
-        # 构建配置
-        config_params = {
-            'response_modalities': response_modalities,
-            'image_config': types.ImageConfig(
-                aspect_ratio=aspect_ratio,
-            )
-        }
-
-        # 只有 Nano Banana Pro 支持 image_size 参数
-        if model == "gemini-3-pro-image-preview" and image_size:
-            config_params['image_config'].image_size = image_size
+        with self._measure('generate_image', model) as metrics:
+            # 先补默认值，省略参数与显式传默认值共用同一缓存键
+            if response_modalities is None:
+                response_modalities = ['Text', 'Image']
+
+            key = self._image_request_key(prompt, output_path, aspect_ratio, model,
+                                          image_size, response_modalities)
+            if self._load_cached_image(key, output_path):
+                metrics.outcome = 'cache_hit'
+                return True
 
-        generation_config = types.GenerateContentConfig(**config_params)
+            estimate = estimate_tokens(prompt)
 
-        for attempt in range(self.max_retries):
-            try:
-                response = genai.Client(api_key=self.api_key).models.generate_content(
-                    model=model,
-                    contents=[prompt],
-                    config=generation_config
+            def attempt():
+                metrics.queued()
+                self._throttle(model, tokens=estimate, images=1)
+                metrics.sent()
+                response = self.backend.generate_image(
+                    model, prompt, aspect_ratio, image_size, response_modalities
                 )
+                metrics.received(response)
 
                 # 保存生成的图像
-                image_saved = False
-                output_path_obj = Path(output_path)
-                output_path_obj.parent.mkdir(parents=True, exist_ok=True)
-
-                for part in response.parts:
-                    if part.text is not None:
-                        # 打印文本描述
-                        print(f"  描述: {part.text[:100]}...")
-                    elif part.inline_data is not None:
-                        # 保存图像
-                        image = part.as_image()
-                        image.save(str(output_path_obj))
-                        image_saved = True
-                        print(f"  ✓ 图像已保存: {output_path}")
-                        break
-
-                if not image_saved:
-                    print(f"  ⚠️ 警告: 响应中未找到图像数据")
-                    return False
-
-                return True
-
-            except google_exceptions.ResourceExhausted as e:
-                print(f"⚠️  API 配额已用尽: {e}")
-                if attempt < self.max_retries - 1:
-                    wait_time = self.retry_delay * (2 ** attempt)
-                    print(f"等待 {wait_time} 秒后重试...")
-                    time.sleep(wait_time)
-                else:
-                    raise
-
-            except google_exceptions.InvalidArgument as e:
-                print(f"❌ API 参数错误: {e}")
-                raise
-
-            except Exception as e:
-                print(f"⚠️  API 调用失败 (尝试 {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay)
-                else:
-                    raise
-
-        return False
+                return self._save_image_response(response, output_path)
+
+            def request():
+                success = self.retry_policy.call(attempt, model, metrics.retried)
+                if success:
+                    self._store_image(key, output_path)
+                return success, output_path
+
+            (success, source), coalesced = self.single_flight.do(key, request)
+            if coalesced:
+                metrics.outcome = 'coalesced'
+            if not success:
+                metrics.outcome = 'no_image'
+            elif coalesced:
+                self._copy_shared_image(source, output_path)
+            return success
 
     def generate_outline(
         self,
@@ -231,12 +336,33 @@ class GeminiClient:
         Returns:
             大纲字典，包含 style_instruction 和 slides 列表
         """
-        from .prompt_templates import PromptTemplates
+        with self._measure('generate_outline', self.text_model):
+            prompt = self._outline_prompt(content, style, slide_count, custom_instructions, kwargs)
+
+            # 调用 API 生成
+            response_text = self.generate_text(
+                prompt,
+                temperature=0.7,
+                max_tokens=8000
+            )
+
+            # 解析响应
+            outline = self._parse_outline_response(response_text, style)
+
+        print(f"✓ 成功生成 {len(outline['slides'])} 页大纲")
+
+        return outline
+
+    @staticmethod
+    def _outline_prompt(content: str, style: str, slide_count: int,
+                        custom_instructions: str, options: Dict) -> str:
+        """构建大纲生成提示词（options 为 audience、topic 等参数）"""
+        from prompt_templates import PromptTemplates
 
         # 提取或生成主题
-        topic = kwargs.get('topic', '演示文稿')
-        audience = kwargs.get('audience', '专业人士')
-        presentation_type = kwargs.get('presentation_type', '学术演示')
+        topic = options.get('topic', '演示文稿')
+        audience = options.get('audience', '专业人士')
+        presentation_type = options.get('presentation_type', '学术演示')
 
         # 生成提示词
         prompt = PromptTemplates.generate_outline_prompt(
@@ -252,20 +378,7 @@ class GeminiClient:
         print(f"🎨 生成 {slide_count} 页 {style} 风格大纲...")
         print(f"📝 主题: {topic}")
         print(f"👥 受众: {audience}\n")
-
-        # 调用 API 生成
-        response_text = self.generate_text(
-            prompt,
-            temperature=0.7,
-            max_tokens=8000
-        )
-
-        # 解析响应
-        outline = self._parse_outline_response(response_text, style)
-
-        print(f"✓ 成功生成 {len(outline['slides'])} 页大纲")
-
-        return outline
+        return prompt
 
     def _parse_outline_response(self, response: str, style: str) -> Dict:
         """
@@ -278,7 +391,7 @@ class GeminiClient:
         Returns:
             结构化的大纲字典
         """
-        from .prompt_templates import PromptTemplates
+        from prompt_templates import PromptTemplates
 
         # 获取风格指令
         style_instruction = PromptTemplates.generate_style_instruction(style)
@@ -369,6 +482,240 @@ class GeminiClient:
         }
 
 
+class AsyncGeminiClient(GeminiClient):
+    """
+    Gemini API 异步客户端
+
+    与 GeminiClient 接口一致，但 generate_text / generate_image /
+    generate_outline 均为协程。并发请求数由信号量限制，重试等待使用
+    asyncio.sleep，不会阻塞事件循环，可在一个事件循环中同时驱动几十个请求。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, max_concurrency: int = 8,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 cache: Optional[ResponseCache] = None,
+                 use_cache: bool = True,
+                 backend: Optional[GeminiBackend] = None,
+                 telemetry: Optional[Telemetry] = None):
+        """
+        初始化异步客户端
+
+        Args:
+            api_key: Gemini API 密钥，如果为 None 则从环境变量读取
+            max_concurrency: 同时进行中的最大请求数
+            rate_limiter: 共享限速器，为 None 时按 GEMINI_RATE_LIMITS 环境变量创建
+            retry_policy: 重试策略，为 None 时使用默认策略
+            cache: 响应缓存，为 None 时按 GEMINI_CACHE* 环境变量创建
+            use_cache: 为 False 时不读写缓存
+            backend: 请求后端，为 None 时按环境选择（见 gemini_backends.create_backend）
+            telemetry: 调用遥测，为 None 时按 GEMINI_TELEMETRY 环境变量创建
+        """
+        super().__init__(api_key, rate_limiter, retry_policy, cache, use_cache, backend, telemetry)
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency 必须为正数")
+        self.max_concurrency = max_concurrency
+        # 只限制请求本身；重试和限速等待期间不占用名额
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _throttle_async(self, model: str, tokens: int = 0, images: int = 0):
+        """_throttle 的协程版本"""
+        if self.rate_limiter is not None:
+            waited = await self.rate_limiter.acquire_async(model, tokens=tokens, images=images)
+            if waited >= 1:
+                print(f"⏳ 速率限制: 等待了 {waited:.1f} 秒 ({model})")
+
+    async def generate_text(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> str:
+        """
+        生成文本内容（协程）
+
+        Args:
+            prompt: 输入提示词
+            temperature: 温度参数 (0-1)
+            max_tokens: 最大生成 token 数
+            **kwargs: 其他生成参数
+
+        Returns:
+            生成的文本
+
+        Raises:
+            Exception: API 调用失败
+        """
+        with self._measure('generate_text', self.text_model) as metrics:
+            generation_config = self._text_generation_config(temperature, max_tokens, kwargs)
+            key = self._text_request_key(prompt, generation_config)
+            # 缓存与限速器都是 sqlite/文件 I/O，放到线程中执行，避免阻塞事件循环
+            cached = (await asyncio.to_thread(self.cache.get_text, key)
+                      if self.cache is not None else None)
+            if cached is not None:
+                metrics.outcome = 'cache_hit'
+                return cached
+
+            estimate = estimate_tokens(prompt)
+
+            async def attempt():
+                metrics.queued()
+                await self._throttle_async(self.text_model, tokens=estimate)
+                async with self.semaphore:
+                    metrics.sent()
+                    response = await self.backend.generate_text_async(
+                        self.text_model, prompt, generation_config
+                    )
+                metrics.received(response)
+                await asyncio.to_thread(self._settle_tokens, self.text_model, response, estimate)
+                return response.text
+
+            async def request():
+                text = await self.retry_policy.call_async(attempt, self.text_model,
+                                                          metrics.retried)
+                if self.cache is not None:
+                    await asyncio.to_thread(self.cache.put_text, key, text)
+                return text
+
+            # 相同请求正在进行时直接等待其结果
+            text, coalesced = await self.single_flight.do_async(key, request)
+            if coalesced:
+                metrics.outcome = 'coalesced'
+            return text
+
+    async def generate_image(
+        self,
+        prompt: str,
+        output_path: str,
+        aspect_ratio: str = "16:9",
+        model: str = "gemini-3-pro-image-preview",
+        image_size: str = "2K",
+        response_modalities: Optional[List[str]] = None,
+        **kwargs
+    ) -> bool:
+        """
+        生成图像（协程，参数同 GeminiClient.generate_image）
+
+        Returns:
+            是否成功生成
+
+        Raises:
+            Exception: API 调用失败
+        """
+        with self._measure('generate_image', model) as metrics:
+            # 先补默认值，省略参数与显式传默认值共用同一缓存键
+            if response_modalities is None:
+                response_modalities = ['Text', 'Image']
+
+            key = self._image_request_key(prompt, output_path, aspect_ratio, model,
+                                          image_size, response_modalities)
+            if await asyncio.to_thread(self._load_cached_image, key, output_path):
+                metrics.outcome = 'cache_hit'
+                return True
+
+            estimate = estimate_tokens(prompt)
+
+            async def attempt():
+                metrics.queued()
+                await self._throttle_async(model, tokens=estimate, images=1)
+                async with self.semaphore:
+                    # 排队时间包含限速等待和信号量等待
+                    metrics.sent()
+                    response = await self.backend.generate_image_async(
+                        model, prompt, aspect_ratio, image_size, response_modalities
+                    )
+                metrics.received(response)
+
+                # 写文件放到线程中，避免阻塞事件循环
+                return await asyncio.to_thread(self._save_image_response, response, output_path)
+
+            async def request():
+                success = await self.retry_policy.call_async(attempt, model, metrics.retried)
+                if success:
+                    await asyncio.to_thread(self._store_image, key, output_path)
+                return success, output_path
+
+            (success, source), coalesced = await self.single_flight.do_async(key, request)
+            if coalesced:
+                metrics.outcome = 'coalesced'
+            if not success:
+                metrics.outcome = 'no_image'
+            elif coalesced:
+                await asyncio.to_thread(self._copy_shared_image, source, output_path)
+            return success
+
+    async def generate_outline(
+        self,
+        content: str,
+        style: str = "academic",
+        slide_count: int = 15,
+        custom_instructions: str = "",
+        **kwargs
+    ) -> Dict:
+        """
+        生成幻灯片大纲（协程，参数同 GeminiClient.generate_outline）
+
+        Returns:
+            大纲字典，包含 style_instruction 和 slides 列表
+        """
+        with self._measure('generate_outline', self.text_model):
+            prompt = self._outline_prompt(content, style, slide_count, custom_instructions, kwargs)
+
+            # 调用 API 生成
+            response_text = await self.generate_text(
+                prompt,
+                temperature=0.7,
+                max_tokens=8000
+            )
+
+            # 解析响应
+            outline = self._parse_outline_response(response_text, style)
+
+        print(f"✓ 成功生成 {len(outline['slides'])} 页大纲")
+
+        return outline
+
+
+async def run_load_test(requests: int, concurrency: int, model: str, image_size: str,
+                        output_dir: str) -> Dict:
+    """
+    并发生成 requests 张互不相同的图像，测量吞吐量（配合 fake_gemini_server.py 离线压测）
+
+    Args:
+        requests: 图像数
+        concurrency: 最大并发数
+        model: 图像模型
+        image_size: 图像分辨率
+        output_dir: 输出目录
+
+    Returns:
+        统计字典
+    """
+    client = AsyncGeminiClient(max_concurrency=concurrency, use_cache=False)
+
+    async def one(i: int) -> bool:
+        try:
+            return await client.generate_image(f"压测图像 #{i}", f"{output_dir}/load{i:04d}.png",
+                                               model=model, image_size=image_size)
+        except Exception:
+            return False
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    client.close()
+    return {
+        'succeeded': sum(results),
+        'failed': requests - sum(results),
+        'seconds': elapsed,
+        'per_minute': sum(results) / elapsed * 60 if elapsed else 0.0,
+        'rate_limit_wait': client.rate_limiter.wait_seconds if client.rate_limiter else 0.0,
+        'retry': client.retry_policy.summary(),
+        'telemetry': client.telemetry.memory.summary() if client.telemetry.memory else '',
+    }
+
+
 def main():
     """测试和示例"""
     import argparse
@@ -384,6 +731,15 @@ def main():
                        help='检查 API 配额')
     parser.add_argument('--output', default='test_image.png',
                        help='测试图像输出路径')
+    parser.add_argument('--test-latency', type=int, default=0, metavar='N',
+                       help='连续调用 N 次文本生成，对比首次调用与复用客户端后的延迟')
+    parser.add_argument('--load-test', type=int, default=0, metavar='N',
+                       help='并发生成 N 张图像并统计吞吐量（建议配合 GEMINI_BASE_URL 指向模拟服务器）')
+    parser.add_argument('--concurrency', type=int, default=8,
+                       help='--load-test 的最大并发数（默认: 8）')
+    parser.add_argument('--model', default='gemini-3-pro-image-preview',
+                       help='--load-test 使用的图像模型')
+    parser.add_argument('--image-size', default='2K', help='--load-test 的图像分辨率')
 
     args = parser.parse_args()
 
@@ -448,12 +804,44 @@ Color Palette:
             quota = client.check_quota()
             print(f"配额状态: {quota}")
 
-        if not any([args.test_text, args.test_outline, args.test_image, args.check_quota]):
+        if args.test_latency:
+            print(f"测试连接复用延迟（{args.test_latency} 次调用）...")
+            latencies = []
+            # 不走缓存：重复的相同提示词命中缓存会让延迟失真
+            with GeminiClient(use_cache=False) as latency_client:
+                for _ in range(args.test_latency):
+                    start = time.perf_counter()
+                    latency_client.generate_text("回复 OK", temperature=0, max_tokens=5)
+                    latencies.append(time.perf_counter() - start)
+            print(f"  首次调用: {latencies[0] * 1000:.0f} ms（含客户端构造 "
+                  f"{latency_client.backend.setup_seconds * 1000:.1f} ms 与连接建立）")
+            if len(latencies) > 1:
+                reused = sum(latencies[1:]) / (len(latencies) - 1)
+                print(f"  复用调用平均: {reused * 1000:.0f} ms")
+                print(f"  每次调用节省: {(latencies[0] - reused) * 1000:.0f} ms")
+
+        if args.load_test:
+            print(f"压测: {args.load_test} 张图像，并发 {args.concurrency}，"
+                  f"后端 {client.backend.name}")
+            output_dir = str(Path(args.output).parent / 'load-test')
+            result = asyncio.run(run_load_test(args.load_test, args.concurrency, args.model,
+                                               args.image_size, output_dir))
+            print(f"  成功 {result['succeeded']}，失败 {result['failed']}，"
+                  f"耗时 {result['seconds']:.1f} 秒，吞吐量 {result['per_minute']:.1f} 张/分钟")
+            print(f"  限速等待: {result['rate_limit_wait']:.1f} 秒")
+            print(f"  重试: {result['retry']}")
+            if result['telemetry']:
+                print(f"  遥测:\n    " + result['telemetry'].replace('\n', '\n    '))
+
+        if not any([args.test_text, args.test_outline, args.test_image, args.check_quota,
+                    args.test_latency, args.load_test]):
             print("请指定测试选项:")
             print("  --test-text      测试文本生成")
             print("  --test-outline   测试大纲生成")
             print("  --test-image     测试图像生成（Nano Banana Pro）")
             print("  --check-quota    检查配额")
+            print("  --test-latency N 测试客户端复用节省的延迟")
+            print("  --load-test N    并发压测 N 张图像")
 
     except Exception as e:
         print(f"❌ 错误: {e}")
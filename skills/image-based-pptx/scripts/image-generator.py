@@ -6,6 +6,7 @@
 """
 
 import argparse
+import asyncio
 import json
 import sys
 from pathlib import Path
@@ -242,7 +243,9 @@ def generate_images_auto(
     output_dir: str,
     model: str = "gemini-3-pro-image-preview",
     image_size: str = "2K",
-    aspect_ratio: str = "16:9"
+    aspect_ratio: str = "16:9",
+    concurrency: int = 1,
+    use_cache: bool = True
 ) -> None:
     """
     自动生成图像（使用 Nano Banana Pro）
@@ -253,9 +256,11 @@ def generate_images_auto(
         model: 模型名称
         image_size: 图像分辨率
         aspect_ratio: 宽高比
+        concurrency: 同时生成的图像数（大于 1 时使用 AsyncGeminiClient）
+        use_cache: 是否使用响应缓存
     """
     try:
-        from gemini_client import GeminiClient
+        from gemini_client import AsyncGeminiClient, GeminiClient
     except ImportError:
         print("错误: 无法导入 gemini_client")
         sys.exit(1)
@@ -280,11 +285,15 @@ def generate_images_auto(
     print("步骤 3: 连接 Gemini API")
     print("-" * 40)
     try:
-        client = GeminiClient()
+        if concurrency > 1:
+            client = AsyncGeminiClient(max_concurrency=concurrency, use_cache=use_cache)
+        else:
+            client = GeminiClient(use_cache=use_cache)
         print(f"✓ API 连接成功")
         print(f"✓ 使用模型: {model}")
         print(f"✓ 图像分辨率: {image_size}")
-        print(f"✓ 宽高比: {aspect_ratio}\n")
+        print(f"✓ 宽高比: {aspect_ratio}")
+        print(f"✓ 并发数: {concurrency}\n")
     except Exception as e:
         print(f"❌ API 连接失败: {e}")
         sys.exit(1)
@@ -300,31 +309,40 @@ def generate_images_auto(
     success_count = 0
     failed_slides = []
 
-    for i, prompt_data in enumerate(prompts, 1):
-        slide_num = prompt_data['slide_num']
-        prompt = prompt_data['prompt']
-        output_file = images_dir / f"slide{slide_num:02d}.png"
-
-        print(f"\n[{i}/{len(prompts)}] 生成幻灯片 {slide_num}")
-        print(f"  目标: {output_file.name}")
-
-        try:
-            success = client.generate_image(
-                prompt=prompt,
-                output_path=str(output_file),
-                aspect_ratio=aspect_ratio,
-                model=model,
-                image_size=image_size
-            )
-
-            if success:
-                success_count += 1
-            else:
-                failed_slides.append(slide_num)
-
-        except Exception as e:
-            print(f"  ❌ 生成失败: {e}")
-            failed_slides.append(slide_num)
+    try:
+        if concurrency > 1:
+            success_count, failed_slides = asyncio.run(generate_images_concurrently(
+                client, prompts, images_dir, model, image_size, aspect_ratio
+            ))
+        else:
+            for i, prompt_data in enumerate(prompts, 1):
+                slide_num = prompt_data['slide_num']
+                prompt = prompt_data['prompt']
+                output_file = images_dir / f"slide{slide_num:02d}.png"
+
+                print(f"\n[{i}/{len(prompts)}] 生成幻灯片 {slide_num}")
+                print(f"  目标: {output_file.name}")
+
+                try:
+                    success = client.generate_image(
+                        prompt=prompt,
+                        output_path=str(output_file),
+                        aspect_ratio=aspect_ratio,
+                        model=model,
+                        image_size=image_size
+                    )
+
+                    if success:
+                        success_count += 1
+                    else:
+                        failed_slides.append(slide_num)
+
+                except Exception as e:
+                    print(f"  ❌ 生成失败: {e}")
+                    failed_slides.append(slide_num)
+    finally:
+        # 释放连接并写出遥测数据
+        client.close()
 
     # 5. 保存提示词备份
     print("\n步骤 5: 保存提示词备份")
@@ -339,6 +357,13 @@ def generate_images_auto(
     print(f"  - 总数: {len(prompts)}")
     print(f"  - 成功: {success_count}")
     print(f"  - 失败: {len(failed_slides)}")
+    print(f"  - 重试: {client.retry_policy.summary()}")
+    if client.cache is not None:
+        print(f"  - 缓存: {client.cache.summary()}")
+    if client.telemetry.memory is not None:
+        print(f"  - 调用耗时:")
+        for line in client.telemetry.memory.summary().splitlines():
+            print(f"      {line}")
 
     if failed_slides:
         print(f"\n⚠️  失败的幻灯片: {', '.join(map(str, failed_slides))}")
@@ -350,6 +375,51 @@ def generate_images_auto(
     print(f"  python pptx-assembler.py --images {images_dir} --output presentation.pptx")
 
 
+async def generate_images_concurrently(
+    client,
+    prompts: List[Dict],
+    images_dir: Path,
+    model: str,
+    image_size: str,
+    aspect_ratio: str
+):
+    """
+    并发生成所有幻灯片图像
+
+    Args:
+        client: AsyncGeminiClient 实例（其信号量限制并发数）
+        prompts: 图像提示词列表
+        images_dir: 图像输出目录
+        model: 模型名称
+        image_size: 图像分辨率
+        aspect_ratio: 宽高比
+
+    Returns:
+        (成功数量, 失败的幻灯片编号列表)
+    """
+    async def generate_one(i: int, prompt_data: Dict) -> bool:
+        slide_num = prompt_data['slide_num']
+        output_file = images_dir / f"slide{slide_num:02d}.png"
+        print(f"\n[{i}/{len(prompts)}] 开始生成幻灯片 {slide_num} -> {output_file.name}")
+        try:
+            return await client.generate_image(
+                prompt=prompt_data['prompt'],
+                output_path=str(output_file),
+                aspect_ratio=aspect_ratio,
+                model=model,
+                image_size=image_size
+            )
+        except Exception as e:
+            print(f"  ❌ 幻灯片 {slide_num} 生成失败: {e}")
+            return False
+
+    results = await asyncio.gather(
+        *(generate_one(i, prompt_data) for i, prompt_data in enumerate(prompts, 1))
+    )
+    failed_slides = [p['slide_num'] for p, ok in zip(prompts, results) if not ok]
+    return len(prompts) - len(failed_slides), failed_slides
+
+
 def generate_images_manual(
     outline_file: str,
     output_dir: str
@@ -481,8 +551,24 @@ def main():
         help='图像宽高比（默认: 16:9）'
     )
 
+    parser.add_argument(
+        '--concurrency', '-c',
+        type=int,
+        default=1,
+        help='自动模式下同时生成的图像数（默认: 1，逐张生成）'
+    )
+
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='不使用响应缓存（总是重新调用 API）'
+    )
+
     args = parser.parse_args()
 
+    if args.concurrency < 1:
+        parser.error('--concurrency 必须为正数')
+
     try:
         if args.auto:
             # 自动模式
@@ -491,7 +577,9 @@ def main():
                 output_dir=args.output_dir,
                 model=args.model,
                 image_size=args.image_size,
-                aspect_ratio=args.aspect_ratio
+                aspect_ratio=args.aspect_ratio,
+                concurrency=args.concurrency,
+                use_cache=not args.no_cache
             )
         else:
             # 手动模式
@@ -153,7 +153,8 @@ def generate_outline(
     audience: str = "专业人士",
     presentation_type: str = "学术演示",
     custom_instructions: str = "",
-    language: str = "zh"
+    language: str = "zh",
+    use_cache: bool = True
 ) -> None:
     """
     生成幻灯片大纲
@@ -169,6 +170,7 @@ def generate_outline(
         presentation_type: 演示类型
         custom_instructions: 自定义指令
         language: 语言
+        use_cache: 是否使用响应缓存
     """
     print("="*60)
     print("幻灯片大纲生成器")
@@ -198,7 +200,7 @@ def generate_outline(
     print("步骤 3: 连接 Gemini API")
     print("-" * 40)
     try:
-        client = GeminiClient()
+        client = GeminiClient(use_cache=use_cache)
         print("✓ API 连接成功\n")
     except Exception as e:
         print(f"❌ API 连接失败: {e}")
@@ -238,6 +240,9 @@ def generate_outline(
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        # 释放连接并写出遥测数据
+        client.close()
 
     # 5. 保存大纲
     print("\n步骤 5: 保存大纲")
@@ -373,6 +378,12 @@ def main():
         help='语言（默认: zh）'
     )
 
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='不使用响应缓存（总是重新调用 API）'
+    )
+
     args = parser.parse_args()
 
     try:
@@ -386,7 +397,8 @@ def main():
             audience=args.audience,
             presentation_type=args.presentation_type,
             custom_instructions=args.custom_instructions,
-            language=args.language
+            language=args.language,
+            use_cache=not args.no_cache
         )
     except KeyboardInterrupt:
         print("\n\n⚠️  用户中断")
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Gemini API 速率限制器
+
+基于令牌桶，按模型限制每分钟请求数 (RPM)、输入 token 数 (TPM) 和图像数 (IPM)。
+桶状态保存在 SQLite 文件中，每次取令牌都在一个 IMMEDIATE 事务里完成，
+因此同一主机上的多个线程和多个进程（例如并行生成的多份演示文稿）共享同一份配额，
+吞吐量稳定在配额上限附近，而不是反复撞上 429 错误。
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# 各模型的默认配额（每分钟）。实际配额取决于项目的付费等级，
+# 可通过 GEMINI_RATE_LIMITS 环境变量（JSON）覆盖，例如：
+#   export GEMINI_RATE_LIMITS='{"gemini-3-pro-image-preview": {"rpm": 20, "ipm": 20}}'
+# 设置为 off 可完全关闭限速。
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    'gemini-1.5-pro': {'rpm': 360, 'tpm': 4_000_000},
+    'gemini-3-pro-image-preview': {'rpm': 20, 'ipm': 10},
+    'gemini-2.5-flash-image': {'rpm': 100, 'ipm': 100},
+    '*': {'rpm': 60},  # 未列出的模型
+}
+
+DIMENSIONS = ('rpm', 'tpm', 'ipm')
+
+# 桶容量 = 每分钟配额 × BURST_FRACTION（至少容纳一次请求），
+# 即任意一分钟内的用量不超过配额的 (1 + BURST_FRACTION) 倍
+BURST_FRACTION = 0.1
+
+
+def default_db_path() -> str:
+    """共享的桶状态文件（GEMINI_RATE_LIMIT_DB 可覆盖）"""
+    path = os.getenv('GEMINI_RATE_LIMIT_DB')
+    if path:
+        return path
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'image-based-pptx', 'gemini-ratelimit.sqlite')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计提示词的 token 数（约 4 个字符一个 token，中文按字计）"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class RateLimiter:
+    """跨线程、跨进程共享的令牌桶限速器"""
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 db_path: Optional[str] = None, burst_fraction: float = BURST_FRACTION):
+        """
+        初始化限速器
+
+        Args:
+            limits: 模型名 -> {'rpm': ..., 'tpm': ..., 'ipm': ...}，'*' 为默认项
+            db_path: 桶状态 SQLite 文件路径
+            burst_fraction: 桶容量占每分钟配额的比例
+        """
+        self.limits = limits if limits is not None else DEFAULT_LIMITS
+        self.db_path = db_path or default_db_path()
+        self.burst_fraction = burst_fraction
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                ' name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL'
+                ') WITHOUT ROWID')
+        self.wait_seconds = 0.0  # 本实例累计等待时间
+
+    @classmethod
+    def from_env(cls) -> Optional['RateLimiter']:
+        """按 GEMINI_RATE_LIMITS 创建限速器；值为 off 时返回 None"""
+        setting = os.getenv('GEMINI_RATE_LIMITS', '').strip()
+        if setting.lower() in ('off', 'none', '0', 'false'):
+            return None
+        limits = dict(DEFAULT_LIMITS)
+        if setting:
+            limits.update(json.loads(setting))
+        return cls(limits)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程各用一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def limits_for(self, model: str) -> Dict[str, float]:
+        return self.limits.get(model) or self.limits.get('*') or {}
+
+    def try_acquire(self, model: str, requests: int = 1, tokens: int = 0, images: int = 0) -> float:
+        """
+        尝试取令牌（不等待）
+
+        Args:
+            model: 模型名称
+            requests: 请求数
+            tokens: 输入 token 数
+            images: 图像数
+
+        Returns:
+            0 表示已取得；否则为建议等待的秒数（此时未扣减任何桶）
+        """
+        limits = self.limits_for(model)
+        costs = {'rpm': requests, 'tpm': tokens, 'ipm': images}
+        wanted = {d: (limits[d], costs[d]) for d in DIMENSIONS if limits.get(d) and costs[d]}
+        if not wanted:
+            return 0.0
+
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = {}
+            wait = 0.0
+            for dim, (limit, cost) in wanted.items():
+                name = f'{model}:{dim}'
+                capacity = max(limit * self.burst_fraction, 1.0)
+                rate = limit / 60.0
+                row = conn.execute('SELECT level, updated FROM buckets WHERE name = ?',
+                                   (name,)).fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                # 超过桶容量的单次请求在桶满时放行（之后桶为负，后续请求等待）
+                need = min(cost, capacity)
+                if level < need:
+                    wait = max(wait, (need - level) / rate)
+                levels[name] = level - cost
+            if wait > 0:
+                conn.execute('ROLLBACK')
+                return wait
+            conn.executemany('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)',
+                             [(name, level, now) for name, level in levels.items()])
+            conn.execute('COMMIT')
+            return 0.0
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def acquire(self, model: str, requests: int = 1, tokens: int = 0, images: int = 0) -> float:
+        """阻塞直到取得令牌，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(model, requests, tokens, images)
+            if not wait:
+                self.wait_seconds += waited
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, model: str, requests: int = 1, tokens: int = 0,
+                            images: int = 0) -> float:
+        """acquire 的协程版本：等待期间不阻塞事件循环"""
+        waited = 0.0
+        while True:
+            # try_acquire 在 sqlite 事务中可能等锁（最长 60 秒），放到线程中执行
+            wait = await asyncio.to_thread(self.try_acquire, model, requests, tokens, images)
+            if not wait:
+                self.wait_seconds += waited
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def adjust(self, model: str, tokens: int):
+        """
+        用实际用量修正 token 桶（tokens 为实际值减去预估值，可为负）
+        """
+        limit = self.limits_for(model).get('tpm')
+        if not limit or not tokens:
+            return
+        conn = self._connect()
+        name = f'{model}:tpm'
+        now = time.time()
+        capacity = max(limit * self.burst_fraction, 1.0)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT level, updated FROM buckets WHERE name = ?',
+                               (name,)).fetchone()
+            level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * limit / 60.0)
+            conn.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)',
+                         (name, min(capacity, level - tokens), now))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def main():
+    """查看或重置共享的限速状态"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Gemini API 速率限制状态')
+    parser.add_argument('--reset', action='store_true', help='清空所有桶（恢复为满）')
+    args = parser.parse_args()
+
+    limiter = RateLimiter.from_env()
+    if limiter is None:
+        print("限速已关闭（GEMINI_RATE_LIMITS=off）")
+        return
+    conn = limiter._connect()
+    if args.reset:
+        conn.execute('DELETE FROM buckets')
+        print(f"✓ 已重置: {limiter.db_path}")
+        return
+    print(f"状态文件: {limiter.db_path}")
+    for model, limits in limiter.limits.items():
+        print(f"  {model}: " + ', '.join(f"{d.upper()} {v:,.0f}" for d, v in limits.items()))
+    now = time.time()
+    for name, level, updated in conn.execute('SELECT name, level, updated FROM buckets ORDER BY name'):
+        print(f"  {name}: 剩余 {level:.1f}（{now - updated:.0f} 秒前更新）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Gemini 响应缓存
+
+按内容寻址的磁盘缓存：键为 (模型, 提示词, 生成配置, 宽高比, 分辨率, ...) 的 SHA-256，
+值为文本响应或生成的图像字节。重新运行 auto-generate.py 时，提示词未变的大纲和幻灯片
+直接从缓存返回，不再调用 API。
+
+- 对象文件保存在 objects/<前两位>/<哈希> 下，索引（大小、创建和访问时间）保存在 SQLite 中，
+  多个进程可同时读写
+- 超过 TTL 的条目视为未命中；总大小超过上限时按最近最少使用 (LRU) 淘汰
+- GEMINI_CACHE=off 或各脚本的 --no-cache 关闭缓存
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3   # 2 GB
+DEFAULT_TTL = 30 * 24 * 3600        # 30 天
+
+# 淘汰时降到上限的这个比例以下，避免每次写入都触发淘汰
+EVICT_TARGET = 0.9
+
+
+def default_cache_dir() -> str:
+    """缓存目录（GEMINI_CACHE_DIR 可覆盖）"""
+    path = os.getenv('GEMINI_CACHE_DIR')
+    if path:
+        return path
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'image-based-pptx', 'responses')
+
+
+def cache_key(**fields) -> str:
+    """
+    计算请求的缓存键
+
+    Args:
+        **fields: 决定响应内容的所有参数（模型、提示词、生成配置等），须可 JSON 序列化
+
+    Returns:
+        十六进制 SHA-256
+    """
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """按内容寻址、带 TTL 与 LRU 容量上限的磁盘缓存（线程、进程安全）"""
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+            ttl: 条目有效期（秒）
+        """
+        self.cache_dir = Path(cache_dir or default_cache_dir())
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        (self.cache_dir / 'objects').mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' key TEXT PRIMARY KEY, kind TEXT NOT NULL, size INTEGER NOT NULL,'
+            ' created REAL NOT NULL, accessed REAL NOT NULL'
+            ') WITHOUT ROWID')
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_saved': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional['ResponseCache']:
+        """
+        按环境变量创建缓存；GEMINI_CACHE=off 时返回 None
+
+        GEMINI_CACHE_MAX_MB 设置容量上限，GEMINI_CACHE_TTL_DAYS 设置有效期。
+        """
+        if os.getenv('GEMINI_CACHE', '').strip().lower() in ('off', 'none', '0', 'false'):
+            return None
+        max_mb = os.getenv('GEMINI_CACHE_MAX_MB')
+        ttl_days = os.getenv('GEMINI_CACHE_TTL_DAYS')
+        return cls(
+            max_bytes=int(float(max_mb) * 1024 ** 2) if max_mb else DEFAULT_MAX_BYTES,
+            ttl=float(ttl_days) * 24 * 3600 if ttl_days else DEFAULT_TTL,
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程各用一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.cache_dir / 'index.sqlite'), timeout=60,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / 'objects' / key[:2] / key
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.stats[name] += value
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取缓存
+
+        Args:
+            key: cache_key() 返回的键
+
+        Returns:
+            缓存的字节；未命中或已过期时为 None
+        """
+        conn = self._connect()
+        row = conn.execute('SELECT created FROM entries WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is not None and now - row[0] <= self.ttl:
+            try:
+                data = self._path(key).read_bytes()
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+                self._count('hits')
+                self._count('bytes_saved', len(data))
+                return data
+        if row is not None:
+            self._delete([key])
+        self._count('misses')
+        return None
+
+    def put(self, key: str, data: bytes, kind: str = 'text'):
+        """
+        写入缓存（先写临时文件再原子替换，读者不会看到半个文件）
+
+        Args:
+            key: cache_key() 返回的键
+            data: 响应内容
+            kind: 'text' 或 'image'，仅用于统计
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        now = time.time()
+        self._connect().execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                                (key, kind, len(data), now, now))
+        self._count('stores')
+        self.evict()
+
+    def get_text(self, key: str) -> Optional[str]:
+        data = self.get(key)
+        return None if data is None else data.decode('utf-8')
+
+    def put_text(self, key: str, text: str):
+        self.put(key, text.encode('utf-8'), 'text')
+
+    def _delete(self, keys):
+        conn = self._connect()
+        conn.executemany('DELETE FROM entries WHERE key = ?', [(k,) for k in keys])
+        for key in keys:
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """删除过期条目；总大小超过上限时按最近访问时间从旧到新删除"""
+        conn = self._connect()
+        expired = [k for (k,) in conn.execute('SELECT key FROM entries WHERE created < ?',
+                                              (time.time() - self.ttl,))]
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        victims = list(expired)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TARGET
+            for key, size in conn.execute('SELECT key, size FROM entries ORDER BY accessed'):
+                if total <= target:
+                    break
+                if key not in expired:
+                    victims.append(key)
+                total -= size
+        if victims:
+            self._delete(victims)
+            self._count('evictions', len(victims))
+
+    def clear(self):
+        """清空缓存"""
+        keys = [k for (k,) in self._connect().execute('SELECT key FROM entries')]
+        self._delete(keys)
+
+    def usage(self) -> Dict[str, int]:
+        """按类型统计条目数与总大小"""
+        rows = self._connect().execute(
+            'SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY kind')
+        return {kind: {'entries': n, 'bytes': size} for kind, n, size in rows}
+
+    def summary(self) -> str:
+        """一行统计"""
+        s = self.stats
+        return (f"命中 {s['hits']}，未命中 {s['misses']}，写入 {s['stores']}，"
+                f"淘汰 {s['evictions']}，节省下载 {s['bytes_saved'] / 1024 ** 2:.1f} MB")
+
+
+def main():
+    """查看或清空响应缓存"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Gemini 响应缓存')
+    parser.add_argument('--clear', action='store_true', help='清空缓存')
+    args = parser.parse_args()
+
+    cache = ResponseCache.from_env()
+    if cache is None:
+        print("缓存已关闭（GEMINI_CACHE=off）")
+        return
+    if args.clear:
+        cache.clear()
+        print(f"✓ 已清空: {cache.cache_dir}")
+        return
+    print(f"缓存目录: {cache.cache_dir}")
+    print(f"容量上限: {cache.max_bytes / 1024 ** 2:.0f} MB，有效期: {cache.ttl / 86400:g} 天")
+    for kind, info in sorted(cache.usage().items()):
+        print(f"  {kind}: {info['entries']} 条，{info['bytes'] / 1024 ** 2:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
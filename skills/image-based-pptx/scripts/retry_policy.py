@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Gemini API 重试策略
+
+GeminiClient 与 AsyncGeminiClient 共用的重试逻辑：
+- 错误分类：配额 (429)、可重试 (408/5xx/网络错误) 与不可重试（其他 4xx、参数错误等）
+- 退避：去相关抖动 (decorrelated jitter)，避免大量并发请求同时醒来再次撞上限额
+- 服务器提示：优先使用 Retry-After 响应头或 google.rpc.RetryInfo 中的 retryDelay
+- 熔断：同一模型连续失败达到阈值后快速失败，冷却期过后放行一次试探请求
+"""
+
+import asyncio
+import email.utils
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# 分类结果
+QUOTA = 'quota'
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# 未携带状态码的传输层异常（httpx / aiohttp / requests 等），按类名识别以免引入依赖
+TRANSIENT_EXCEPTION_NAMES = {
+    'TransportError', 'TimeoutException', 'ClientConnectionError',
+    'ServerDisconnectedError', 'ConnectionError', 'Timeout',
+}
+
+# 本地文件错误（保存图像失败等）：属于 OSError，但重试无济于事
+LOCAL_OS_ERRORS = (FileNotFoundError, FileExistsError, PermissionError,
+                   IsADirectoryError, NotADirectoryError)
+
+_RETRY_IN = re.compile(r'retry in ([\d.]+)\s*(ms|s)\b', re.IGNORECASE)
+_RETRY_DELAY_SECONDS = re.compile(r'retry_?delay\W+(?:seconds\W+)?(\d+(?:\.\d+)?)s?', re.IGNORECASE)
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时抛出：端点暂时不可用，请求未发送"""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"{model} 连续失败，熔断中，{retry_after:.0f} 秒后再试")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def status_code(exc: BaseException) -> Optional[int]:
+    """提取异常对应的 HTTP 状态码（google.api_core 与 google.genai 的异常均带 code）"""
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(exc, 'response', None)
+    code = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    return code if isinstance(code, int) else None
+
+
+def classify(exc: BaseException) -> str:
+    """
+    判断异常是否值得重试
+
+    Returns:
+        QUOTA、RETRYABLE 或 FATAL
+    """
+    if isinstance(exc, CircuitOpenError):
+        return FATAL
+    code = status_code(exc)
+    if code is not None:
+        if code == 429:
+            return QUOTA
+        return RETRYABLE if code in RETRYABLE_STATUS else FATAL
+    if isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+        return RETRYABLE
+    # 网络层错误（DNS 解析 socket.gaierror、ssl.SSLError、urllib.error.URLError、
+    # ConnectionError 等）都是 OSError 的子类
+    if isinstance(exc, OSError) and not isinstance(exc, LOCAL_OS_ERRORS):
+        return RETRYABLE
+    if any(cls.__name__ in TRANSIENT_EXCEPTION_NAMES for cls in type(exc).__mro__):
+        return RETRYABLE
+    # 其余异常（ValueError、响应被安全过滤等）重试也不会成功
+    return FATAL
+
+
+def _parse_duration(value) -> Optional[float]:
+    """解析 '32s'、'1.5s' 或 Duration 对象（seconds + nanos）"""
+    if isinstance(value, str):
+        match = re.fullmatch(r'\s*([\d.]+)\s*s?\s*', value)
+        return float(match.group(1)) if match else None
+    seconds = getattr(value, 'seconds', None)
+    if seconds is not None:
+        return seconds + getattr(value, 'nanos', 0) / 1e9
+    return None
+
+
+def server_retry_delay(exc: BaseException) -> Optional[float]:
+    """
+    读取服务器建议的重试等待时间
+
+    依次检查 Retry-After 响应头、错误详情中的 google.rpc.RetryInfo 以及错误消息文本。
+
+    Returns:
+        秒数；服务器未给出提示时为 None
+    """
+    response = getattr(exc, 'response', None)
+    headers = getattr(exc, 'headers', None) or getattr(response, 'headers', None)
+    if headers:
+        value = headers.get('Retry-After') or headers.get('retry-after')
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                parsed = email.utils.parsedate_to_datetime(value)
+                if parsed is not None:
+                    return max(0.0, parsed.timestamp() - time.time())
+
+    details = getattr(exc, 'details', None)
+    if isinstance(details, dict):
+        # google.genai: 原始 JSON 错误体（error 也可能只是字符串）
+        error = details.get('error', details)
+        details = error.get('details', []) if isinstance(error, dict) else []
+    for detail in details or []:
+        if isinstance(detail, dict):
+            if str(detail.get('@type', '')).endswith('RetryInfo'):
+                delay = _parse_duration(detail.get('retryDelay', ''))
+                if delay is not None:
+                    return delay
+        elif hasattr(detail, 'retry_delay'):
+            delay = _parse_duration(detail.retry_delay)
+            if delay is not None:
+                return delay
+
+    message = str(exc)
+    match = _RETRY_IN.search(message)
+    if match:
+        value = float(match.group(1))
+        return value / 1000 if match.group(2).lower() == 'ms' else value
+    match = _RETRY_DELAY_SECONDS.search(message)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class CircuitBreaker:
+    """单个模型的熔断器（closed -> open -> half-open -> closed）"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后打开
+            reset_timeout: 打开后多久放行一次试探请求（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self, model: str) -> bool:
+        """
+        请求前调用；熔断中则抛出 CircuitOpenError
+
+        Returns:
+            本次请求是否为半开状态下的试探请求
+        """
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(model, max(remaining, 0.0))
+            # 冷却结束：只放行一个试探请求
+            self.state = 'half-open'
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """试探请求被取消或中断（未得出成败）：交还试探名额，下一个请求重新试探"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class RetryPolicy:
+    """带抖动退避、服务器提示和熔断的重试策略（线程安全，可在协程中使用）"""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 2.0,
+        max_delay: float = 60.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        """
+        初始化重试策略
+
+        Args:
+            max_attempts: 每次调用的最大尝试次数（含首次）
+            base_delay: 退避的最小等待时间（秒）
+            max_delay: 单次等待上限（秒）；服务器要求更久时直接放弃
+            failure_threshold: 熔断阈值（同一模型连续失败次数）
+            reset_timeout: 熔断冷却时间（秒）
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'calls': 0,           # 调用次数
+            'retries': 0,         # 重试次数
+            'sleep_seconds': 0.0,  # 退避等待总时长
+            'server_hints': 0,    # 采用服务器建议等待时间的次数
+            'fatal': 0,           # 不可重试错误
+            'exhausted': 0,       # 重试用尽仍失败
+            'short_circuited': 0,  # 熔断拒绝的调用
+        }
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._breakers[model] = breaker
+            return breaker
+
+    def _count(self, key: str, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def backoff(self, previous: float) -> float:
+        """去相关抖动：在 [base, 3 × 上次等待] 之间随机取值，不超过 max_delay"""
+        return min(self.max_delay, random.uniform(self.base_delay, max(previous, self.base_delay) * 3))
+
+    def _next_delay(self, exc: BaseException, kind: str, attempt: int, previous: float) -> Optional[float]:
+        """
+        处理一次失败，返回下次重试前的等待时间；None 表示应当抛出异常
+        """
+        if kind == QUOTA:
+            print(f"⚠️  API 配额已用尽: {exc}")
+        elif kind == FATAL:
+            print(f"❌ API 调用失败（不可重试）: {exc}")
+            self._count('fatal')
+            return None
+        else:
+            print(f"⚠️  API 调用失败 (尝试 {attempt + 1}/{self.max_attempts}): {exc}")
+
+        if attempt >= self.max_attempts - 1:
+            self._count('exhausted')
+            return None
+
+        delay = self.backoff(previous)
+        hint = server_retry_delay(exc)
+        if hint is not None:
+            if hint > self.max_delay:
+                print(f"服务器要求等待 {hint:.0f} 秒，超过上限 {self.max_delay:.0f} 秒，放弃重试")
+                self._count('exhausted')
+                return None
+            # 在服务器给出的时间之后再随机错开一点
+            delay = hint + random.uniform(0, self.base_delay)
+            self._count('server_hints')
+        print(f"等待 {delay:.1f} 秒后重试...")
+        self._count('retries')
+        self._count('sleep_seconds', delay)
+        return delay
+
+    def _record(self, breaker: CircuitBreaker, kind: Optional[str]):
+        # 只有服务端故障（5xx、超时、网络错误）计入熔断；
+        # 配额与参数错误说明端点仍在正常响应
+        if kind == RETRYABLE:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def call(self, func: Callable, model: str,
+             on_retry: Optional[Callable[[float, BaseException], None]] = None):
+        """
+        按策略执行 func()
+
+        Args:
+            func: 无参可调用对象，每次尝试调用一次
+            model: 模型名称（熔断器按模型区分）
+            on_retry: 每次决定重试时以 (等待秒数, 异常) 调用，用于按调用统计
+
+        Returns:
+            func 的返回值
+
+        Raises:
+            CircuitOpenError: 熔断中
+            Exception: 不可重试或重试用尽时的最后一个异常
+        """
+        self._count('calls')
+        breaker = self.breaker(model)
+        delay = 0.0
+        for attempt in range(self.max_attempts):
+            try:
+                probe = breaker.before_call(model)
+            except CircuitOpenError:
+                self._count('short_circuited')
+                raise
+            try:
+                result = func()
+            except Exception as e:
+                kind = classify(e)
+                self._record(breaker, kind)
+                delay = self._next_delay(e, kind, attempt, delay)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(delay, e)
+                time.sleep(delay)
+            except BaseException:
+                # 取消、KeyboardInterrupt 等：不计入成败，但不能让熔断器停在试探中
+                if probe:
+                    breaker.release()
+                raise
+            else:
+                self._record(breaker, None)
+                return result
+
+    async def call_async(self, func: Callable, model: str,
+                         on_retry: Optional[Callable[[float, BaseException], None]] = None):
+        """call 的协程版本：func 返回协程，等待期间不阻塞事件循环"""
+        self._count('calls')
+        breaker = self.breaker(model)
+        delay = 0.0
+        for attempt in range(self.max_attempts):
+            try:
+                probe = breaker.before_call(model)
+            except CircuitOpenError:
+                self._count('short_circuited')
+                raise
+            try:
+                result = await func()
+            except Exception as e:
+                kind = classify(e)
+                self._record(breaker, kind)
+                delay = self._next_delay(e, kind, attempt, delay)
+                if delay is None:
+                    raise
+                if on_retry is not None:
+                    on_retry(delay, e)
+                await asyncio.sleep(delay)
+            except BaseException:
+                # 取消、KeyboardInterrupt 等：不计入成败，但不能让熔断器停在试探中
+                if probe:
+                    breaker.release()
+                raise
+            else:
+                self._record(breaker, None)
+                return result
+
+    def summary(self) -> str:
+        """一行统计，便于调参"""
+        s = self.stats
+        return (f"调用 {s['calls']} 次，重试 {s['retries']} 次（服务器指定 {s['server_hints']} 次），"
+                f"退避等待 {s['sleep_seconds']:.1f} 秒，不可重试 {s['fatal']}，"
+                f"重试用尽 {s['exhausted']}，熔断拒绝 {s['short_circuited']}")
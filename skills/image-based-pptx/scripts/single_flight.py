@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+请求合并（single-flight）
+
+同一时刻发出的相同请求只真正执行一次：第一个调用者（leader）发起请求，
+之后到达的相同请求（follower）挂在它上面等待，共享同一个结果或异常。
+结果通过 concurrent.futures.Future 传递，因此线程与 asyncio 任务（包括不同线程里的
+事件循环）之间可以互相合并。
+
+leader 被取消（asyncio.CancelledError）时不把取消传给等待者：请求键被释放，
+等待者重新加入，其中一个成为新的 leader 自行执行请求。
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Tuple
+
+
+class _LeaderCancelled(Exception):
+    """leader 被取消：等待者应重新加入，由其中一个接替执行"""
+
+
+class SingleFlight:
+    """按键合并进行中的调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    def _join(self, key: str) -> Tuple[Future, bool]:
+        """返回 (future, 是否为 leader)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats['coalesced'] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.stats['leaders'] += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if isinstance(error, asyncio.CancelledError):
+            future.set_exception(_LeaderCancelled())
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, func: Callable) -> Tuple[object, bool]:
+        """
+        执行 func()，或等待进行中的相同调用
+
+        Args:
+            key: 请求键（相同键的请求视为相同）
+            func: 无参可调用对象
+
+        Returns:
+            (结果, 是否与其他调用合并)
+
+        Raises:
+            Exception: leader 调用抛出的异常（所有等待者都会收到）
+
+        注意：不要在运行 leader 所在事件循环的线程里调用 do。等待者会阻塞这个线程，
+        leader 的协程无法继续执行，两者互相等待而死锁；协程中请使用 do_async。
+        """
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                return future.result(), True
+            except _LeaderCancelled:
+                continue
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
+
+    async def do_async(self, key: str, func: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """do 的协程版本：func 返回协程"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # shield：等待者被取消时不影响 leader 与其他等待者
+                return await asyncio.shield(asyncio.wrap_future(future)), True
+            except _LeaderCancelled:
+                continue
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Gemini 调用遥测
+
+GeminiClient 的每次 generate_text / generate_image / generate_outline 调用生成一条记录：
+排队等待（限速 + 并发信号量）、请求延迟、首字节时间、重试次数与等待、
+输入/输出 token 数、图像字节数、结果（ok / cache_hit / coalesced / error）及失败原因。
+记录发送给可插拔的输出端：
+
+- memory: 保存在内存中，提供直方图与分位数查询（默认）
+- jsonl:PATH: 每次调用追加一行 JSON
+- prom:PATH: Prometheus textfile（供 node_exporter 的 textfile collector 读取）
+
+通过 GEMINI_TELEMETRY 环境变量配置，多个输出端用逗号分隔，例如：
+    export GEMINI_TELEMETRY='memory,jsonl:./telemetry.jsonl,prom:/var/lib/node_exporter/gemini-{pid}.prom'
+路径中的 {pid} 会替换为进程号，避免多个进程写同一个 textfile。
+"""
+
+import atexit
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from retry_policy import status_code
+
+# 延迟直方图的桶上界（秒），覆盖文本请求到 4K 图像生成
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# 记录中的时长字段
+TIMING_FIELDS = ('latency', 'queue_wait', 'request_latency', 'ttfb', 'retry_sleep')
+
+
+def failure_reason(exc: BaseException) -> str:
+    """失败原因：异常类名，带 HTTP 状态码时附加在后面（如 GeminiAPIError:429）"""
+    code = status_code(exc)
+    name = type(exc).__name__
+    return f'{name}:{code}' if code is not None else name
+
+
+class CallMetrics:
+    """一次调用的测量值（由 GeminiClient 在调用过程中填写）"""
+
+    def __init__(self, method: str, model: str, backend: str = ''):
+        self.method = method
+        self.model = model
+        self.backend = backend
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._queued = None
+        self._sent = None
+        self.outcome = 'ok'
+        self.error: Optional[str] = None
+        self.attempt_errors: List[str] = []
+        self.attempts = 0
+        self.retry_sleep = 0.0
+        self.queue_wait = 0.0
+        self.request_latency: Optional[float] = None
+        self.ttfb: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.response_tokens: Optional[int] = None
+        self.image_bytes: Optional[int] = None
+
+    def queued(self):
+        """一次尝试开始排队（限速、信号量）"""
+        self.attempts += 1
+        self._queued = time.perf_counter()
+
+    def sent(self):
+        """排队结束、请求发出"""
+        self._sent = time.perf_counter()
+        if self._queued is not None:
+            self.queue_wait += self._sent - self._queued
+
+    def received(self, response):
+        """收到后端响应（TextResponse / ImageResponse）"""
+        if self._sent is not None:
+            self.request_latency = time.perf_counter() - self._sent
+        self.ttfb = getattr(response, 'ttfb', None)
+        self.prompt_tokens = getattr(response, 'prompt_tokens', None)
+        self.response_tokens = getattr(response, 'response_tokens', None)
+        image = getattr(response, 'image', None)
+        if image is not None:
+            self.image_bytes = len(image)
+
+    def retried(self, delay: float, exc: BaseException):
+        """RetryPolicy 的 on_retry 回调"""
+        self.attempt_errors.append(failure_reason(exc))
+        self.retry_sleep += delay
+
+    def failed(self, exc: BaseException):
+        self.outcome = 'error'
+        self.error = failure_reason(exc)
+        self.attempt_errors.append(self.error)
+
+    def record(self) -> Dict:
+        """转换为输出端使用的字典"""
+        return {
+            'ts': round(self.started, 3),
+            'method': self.method,
+            'model': self.model,
+            'backend': self.backend,
+            'outcome': self.outcome,
+            'error': self.error,
+            'attempts': self.attempts,
+            'retries': max(self.attempts - 1, 0),
+            'attempt_errors': self.attempt_errors,
+            'latency': time.perf_counter() - self._start,
+            'queue_wait': self.queue_wait,
+            'request_latency': self.request_latency,
+            'ttfb': self.ttfb,
+            'retry_sleep': self.retry_sleep,
+            'prompt_tokens': self.prompt_tokens,
+            'response_tokens': self.response_tokens,
+            'image_bytes': self.image_bytes,
+        }
+
+
+class Histogram:
+    """固定桶直方图；保留一个蓄水池样本用于估算分位数"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS, reservoir: int = 10000):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.reservoir = reservoir
+        self.samples: List[float] = []
+        self._rng = random.Random(0)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if len(self.samples) < self.reservoir:
+            self.samples.append(value)
+        elif self.reservoir:
+            i = self._rng.randrange(self.count)
+            if i < self.reservoir:
+                self.samples[i] = value
+
+    def cumulative(self) -> List[int]:
+        """Prometheus 格式的累计桶计数（含 +Inf）"""
+        total, result = 0, []
+        for n in self.counts:
+            total += n
+            result.append(total)
+        return result
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """样本分位数（0 <= q <= 1）"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TelemetrySink:
+    """输出端接口"""
+
+    def emit(self, record: Dict):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemorySink(TelemetrySink):
+    """在内存中保留最近的记录，按需计算直方图"""
+
+    def __init__(self, max_records: int = 100000):
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict):
+        with self._lock:
+            self.records.append(record)
+
+    def select(self, method: Optional[str] = None, model: Optional[str] = None,
+               outcome: Optional[str] = None) -> List[Dict]:
+        """按方法、模型、结果筛选记录（None 表示不限）"""
+        with self._lock:
+            records = list(self.records)
+        return [r for r in records
+                if (method is None or r['method'] == method)
+                and (model is None or r['model'] == model)
+                and (outcome is None or r['outcome'] == outcome)]
+
+    def histogram(self, field: str = 'latency', method: Optional[str] = None,
+                  model: Optional[str] = None, outcome: Optional[str] = None,
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        指定字段的直方图
+
+        Args:
+            field: latency / queue_wait / request_latency / ttfb / retry_sleep
+            method: 方法名，如 generate_image
+            model: 模型名称
+            outcome: ok / cache_hit / coalesced / error
+
+        Returns:
+            Histogram（缺失该字段的记录不计入）
+        """
+        histogram = Histogram(buckets, reservoir=len(self.records) or 1)
+        for record in self.select(method, model, outcome):
+            value = record.get(field)
+            if value is not None:
+                histogram.observe(value)
+        return histogram
+
+    def failures(self, model: Optional[str] = None) -> Dict[str, int]:
+        """失败原因计数（包含后来重试成功的失败尝试）"""
+        counts: Dict[str, int] = {}
+        for record in self.select(model=model):
+            for reason in record['attempt_errors']:
+                counts[reason] = counts.get(reason, 0) + 1
+        return counts
+
+    def summary(self) -> str:
+        """按方法与模型汇总的多行文本"""
+        groups = sorted({(r['method'], r['model']) for r in self.select()})
+        lines = []
+        for method, model in groups:
+            records = self.select(method, model)
+            outcomes: Dict[str, int] = {}
+            for r in records:
+                outcomes[r['outcome']] = outcomes.get(r['outcome'], 0) + 1
+            latency = self.histogram('latency', method, model)
+            line = (f"{method} [{model}] {len(records)} 次 "
+                    f"({', '.join(f'{k} {v}' for k, v in sorted(outcomes.items()))})，"
+                    f"延迟 p50 {latency.quantile(0.5):.2f}s / p90 {latency.quantile(0.9):.2f}s / "
+                    f"p99 {latency.quantile(0.99):.2f}s")
+            sent = self.histogram('request_latency', method, model)
+            if sent.count:
+                queue = self.histogram('queue_wait', method, model)
+                line += (f"，排队 p50 {queue.quantile(0.5):.2f}s / p90 {queue.quantile(0.9):.2f}s，"
+                         f"请求 p50 {sent.quantile(0.5):.2f}s")
+                ttfb = self.histogram('ttfb', method, model)
+                if ttfb.count:
+                    line += f"，首字节 p50 {ttfb.quantile(0.5):.2f}s"
+            retries = sum(r['retries'] for r in records)
+            if retries:
+                line += f"，重试 {retries} 次"
+            lines.append(line)
+        for model in sorted({r['model'] for r in self.select()}):
+            failures = self.failures(model)
+            if failures:
+                lines.append(f"失败原因 [{model}]: " + ', '.join(
+                    f'{reason} × {n}' for reason, n in sorted(failures.items(), key=lambda x: -x[1])))
+        return '\n'.join(lines)
+
+
+class JSONLinesSink(TelemetrySink):
+    """每次调用追加一行 JSON"""
+
+    def __init__(self, path: str):
+        self.path = path.replace('{pid}', str(os.getpid()))
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def emit(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _labels(**labels) -> str:
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+               for k, v in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+class PrometheusTextfileSink(TelemetrySink):
+    """
+    汇总为 Prometheus 指标并定期原子地重写 textfile
+
+    指标：gemini_calls_total、gemini_attempt_errors_total、gemini_retries_total、
+    gemini_tokens_total、gemini_image_bytes_total，以及
+    gemini_{latency,queue_wait,request_latency,ttfb}_seconds 直方图
+    """
+
+    HISTOGRAMS = ('latency', 'queue_wait', 'request_latency', 'ttfb')
+
+    def __init__(self, path: str, min_interval: float = 1.0):
+        """
+        Args:
+            path: 输出文件（支持 {pid} 占位符）
+            min_interval: 两次重写文件的最小间隔（秒）
+        """
+        self.path = path.replace('{pid}', str(os.getpid()))
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self.calls: Dict[tuple, int] = {}
+        self.errors: Dict[tuple, int] = {}
+        self.retries: Dict[tuple, int] = {}
+        self.tokens: Dict[tuple, int] = {}
+        self.image_bytes: Dict[str, int] = {}
+        self.histograms: Dict[tuple, Histogram] = {}
+
+    def emit(self, record: Dict):
+        method, model = record['method'], record['model']
+        with self._lock:
+            key = (method, model, record['outcome'])
+            self.calls[key] = self.calls.get(key, 0) + 1
+            for reason in record['attempt_errors']:
+                self.errors[(model, reason)] = self.errors.get((model, reason), 0) + 1
+            self.retries[(method, model)] = self.retries.get((method, model), 0) + record['retries']
+            for direction in ('prompt', 'response'):
+                value = record.get(f'{direction}_tokens')
+                if value:
+                    self.tokens[(model, direction)] = self.tokens.get((model, direction), 0) + value
+            if record.get('image_bytes'):
+                self.image_bytes[model] = self.image_bytes.get(model, 0) + record['image_bytes']
+            for field in self.HISTOGRAMS:
+                value = record.get(field)
+                if value is not None:
+                    histogram = self.histograms.get((field, method, model))
+                    if histogram is None:
+                        histogram = self.histograms[(field, method, model)] = Histogram(reservoir=0)
+                    histogram.observe(value)
+            if time.monotonic() - self._last_write >= self.min_interval:
+                self._write()
+
+    def render(self) -> str:
+        lines = ['# HELP gemini_calls_total Gemini client calls by outcome',
+                 '# TYPE gemini_calls_total counter']
+        lines += [f'gemini_calls_total{_labels(method=m, model=mo, outcome=o)} {n}'
+                  for (m, mo, o), n in sorted(self.calls.items())]
+        lines += ['# HELP gemini_attempt_errors_total Failed attempts by reason',
+                  '# TYPE gemini_attempt_errors_total counter']
+        lines += [f'gemini_attempt_errors_total{_labels(model=mo, reason=r)} {n}'
+                  for (mo, r), n in sorted(self.errors.items())]
+        lines += ['# HELP gemini_retries_total Retried attempts',
+                  '# TYPE gemini_retries_total counter']
+        lines += [f'gemini_retries_total{_labels(method=m, model=mo)} {n}'
+                  for (m, mo), n in sorted(self.retries.items())]
+        lines += ['# HELP gemini_tokens_total Prompt and response tokens',
+                  '# TYPE gemini_tokens_total counter']
+        lines += [f'gemini_tokens_total{_labels(model=mo, direction=d)} {n}'
+                  for (mo, d), n in sorted(self.tokens.items())]
+        lines += ['# HELP gemini_image_bytes_total Bytes of generated images',
+                  '# TYPE gemini_image_bytes_total counter']
+        lines += [f'gemini_image_bytes_total{_labels(model=mo)} {n}'
+                  for mo, n in sorted(self.image_bytes.items())]
+        for field in self.HISTOGRAMS:
+            name = f'gemini_{field}_seconds'
+            lines += [f'# HELP {name} Gemini call {field.replace("_", " ")} in seconds',
+                      f'# TYPE {name} histogram']
+            for (f, method, model), histogram in sorted(self.histograms.items()):
+                if f != field:
+                    continue
+                bounds = [str(b) for b in histogram.buckets] + ['+Inf']
+                for bound, n in zip(bounds, histogram.cumulative()):
+                    lines.append(f'{name}_bucket{_labels(method=method, model=model, le=bound)} {n}')
+                lines.append(f'{name}_sum{_labels(method=method, model=model)} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{_labels(method=method, model=model)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def _write(self):
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+        self._last_write = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+
+def parse_sinks(spec: str) -> List[TelemetrySink]:
+    """
+    解析输出端配置，如 'memory,jsonl:calls.jsonl,prom:gemini.prom'
+
+    Raises:
+        ValueError: 未知的输出端
+    """
+    sinks: List[TelemetrySink] = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kind, _, target = item.partition(':')
+        if kind == 'memory':
+            sinks.append(MemorySink())
+        elif kind == 'jsonl' and target:
+            sinks.append(JSONLinesSink(target))
+        elif kind == 'prom' and target:
+            sinks.append(PrometheusTextfileSink(target))
+        else:
+            raise ValueError(f"未知的遥测输出端: {item}（可用: memory、jsonl:PATH、prom:PATH）")
+    return sinks
+
+
+class Telemetry:
+    """把每次调用的测量值分发给所有输出端"""
+
+    def __init__(self, sinks: Optional[List[TelemetrySink]] = None):
+        self.sinks = [MemorySink()] if sinks is None else list(sinks)
+        self._warned = False
+
+    @classmethod
+    def from_env(cls) -> 'Telemetry':
+        """
+        按 GEMINI_TELEMETRY 创建（默认 memory；off 表示不记录）
+
+        同一进程中配置相同的客户端共用一个实例，避免多个输出端写同一个文件；
+        进程退出时写出最后一批数据。
+        """
+        spec = os.getenv('GEMINI_TELEMETRY', 'memory').strip()
+        with _shared_lock:
+            telemetry = _shared.get(spec)
+            if telemetry is None:
+                if spec.lower() in ('off', 'none', '0', 'false'):
+                    telemetry = cls([])
+                else:
+                    telemetry = cls(parse_sinks(spec))
+                _shared[spec] = telemetry
+                atexit.register(telemetry.close)
+            return telemetry
+
+    @property
+    def memory(self) -> Optional[MemorySink]:
+        """第一个 MemorySink（没有时为 None）"""
+        return next((s for s in self.sinks if isinstance(s, MemorySink)), None)
+
+    @contextmanager
+    def call(self, method: str, model: str, backend: str = ''):
+        """
+        测量一次调用
+
+        用法：
+            with telemetry.call('generate_text', model) as metrics:
+                ...
+        调用中抛出的异常记为失败后继续向上抛出。
+        """
+        metrics = CallMetrics(method, model, backend)
+        try:
+            yield metrics
+        except BaseException as e:
+            metrics.failed(e)
+            raise
+        finally:
+            if self.sinks:
+                self.emit(metrics.record())
+
+    def emit(self, record: Dict):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                # 遥测故障不影响生成，只提示一次
+                if not self._warned:
+                    print(f"⚠️  遥测输出失败（{type(sink).__name__}）: {e}")
+                    self._warned = True
+
+    def flush(self):
+        """写出节流中的数据（Prometheus textfile）"""
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# from_env 创建的进程内共享实例（键为 GEMINI_TELEMETRY 的值）
+_shared: Dict[str, Telemetry] = {}
+_shared_lock = threading.Lock()